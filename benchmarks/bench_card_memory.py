@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+Memory benchmark comparing the compact Card with the old dict-based layout.
+
+Each run parses a synthetic JSON catalog, builds one card per entry, drops
+the parsed data and reports how much memory the cards keep alive, measured
+with tracemalloc. Tags and effects come out of the JSON parser as separate
+string objects per card, as they do when loading a real catalog.
+
+Usage: python3 benchmarks/bench_card_memory.py [--cards N]
+"""
+
+import argparse
+import gc
+import json
+import os
+import random
+import sys
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from prototyper import Card  # noqa: E402
+
+TAG_POOL = ["spell", "unit", "item", "fire", "ice", "melee", "ranged",
+            "damage", "defense", "healing", "rare", "common"]
+EFFECT_POOL = ["Deal 6 damage to target", "Gain 5 armor", "Attack: 3, Health: 5",
+               "Attack: 2, Health: 3, Range: 2", "Restore 10 health"]
+
+
+class LegacyCard:
+    """The original Card layout: instance __dict__ and a mutable tag list."""
+
+    def __init__(self, name, effect="", tags=None):
+        self.name = name
+        self.effect = effect
+        self.tags = tags if tags is not None else []
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data.get("name", ""), data.get("effect", ""), data.get("tags", []))
+
+
+def make_catalog(count: int, seed: int = 0) -> str:
+    """Return a JSON catalog of `count` synthetic cards."""
+    rng = random.Random(seed)
+    return json.dumps([
+        {
+            "name": f"Card {i}",
+            "effect": rng.choice(EFFECT_POOL),
+            "tags": rng.sample(TAG_POOL, rng.randint(1, 4)),
+        }
+        for i in range(count)
+    ])
+
+
+def measure(catalog: str, build) -> int:
+    """Bytes still allocated by the cards after the parsed JSON is dropped."""
+    gc.collect()
+    tracemalloc.start()
+    data = json.loads(catalog)
+    cards = [build(entry) for entry in data]
+    del data
+    gc.collect()
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del cards
+    return current
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--cards", type=int, default=1_000_000,
+                        help="number of cards to build")
+    args = parser.parse_args()
+
+    catalog = make_catalog(args.cards)
+    variants = [
+        ("legacy (__dict__, list tags)", LegacyCard.from_dict),
+        ("compact (slots, interned tags)", Card.from_dict),
+        ("compact + interned effects", lambda d: Card.from_dict(d, intern_effect=True)),
+    ]
+    baseline = None
+    print(f"{args.cards} cards")
+    for label, build in variants:
+        size = measure(catalog, build)
+        baseline = baseline or size
+        print(f"  {label:<32} {size / 2**20:8.1f} MiB  ({size / baseline:5.1%})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+"""
+Benchmark for `move` latency as the source pile grows.
+
+Builds a deck of N synthetic cards for each size and times moving cards out
+of the middle of the deck and back again. With the pile name index the
+per-move latency should stay flat from 1k to 1M cards.
+
+Usage: python3 benchmarks/bench_move.py [--sizes 1000,10000,...] [--moves N]
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from prototyper import Card, Session  # noqa: E402
+
+
+def build_session(size: int) -> Session:
+    """Create a session with a `deck` of `size` cards and an empty `hand`."""
+    session = Session()
+    deck = session.create_pile("deck")
+    session.create_pile("hand")
+    deck.add_cards(
+        Card(f"Card {i}", f"Effect {i}", ["spell" if i % 2 else "unit"])
+        for i in range(size)
+    )
+    return session
+
+
+def time_moves(session: Session, size: int, moves: int) -> list:
+    """Time `moves` round trips deck -> hand -> deck, in microseconds."""
+    samples = []
+    for i in range(moves):
+        name = f"Card {(size // 2 + i) % size}"
+        start = time.perf_counter()
+        session.move_card("deck", "hand", name)
+        session.move_card("hand", "deck", name)
+        samples.append((time.perf_counter() - start) * 1e6 / 2)
+    return samples
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", default="1000,10000,100000,1000000",
+                        help="comma-separated pile sizes")
+    parser.add_argument("--moves", type=int, default=2000,
+                        help="round trips timed per size")
+    args = parser.parse_args()
+
+    print(f"{'cards':>10}  {'median us':>10}  {'p95 us':>10}")
+    for size in (int(s) for s in args.sizes.split(",")):
+        session = build_session(size)
+        samples = sorted(time_moves(session, size, args.moves))
+        p95 = samples[int(len(samples) * 0.95) - 1]
+        print(f"{size:>10}  {statistics.median(samples):>10.2f}  {p95:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""
+Load test for the session server.
+
+Starts `prototyper.py serve` on a free localhost port, sets up a session
+with a `deck` and a `hand` pile, then has several client processes send
+pipelined batches of small `move` and `show` requests for a fixed time.
+Reports overall and per-client throughput.
+
+Usage: python3 benchmarks/bench_server.py [--clients N] [--seconds S]
+                                          [--batch B] [--cards N]
+"""
+
+import argparse
+import os
+import socket
+import subprocess
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+
+from prototyper import ServerClient  # noqa: E402
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_server(port: int) -> subprocess.Popen:
+    """Start the server and wait until it accepts connections."""
+    server = subprocess.Popen(
+        [sys.executable, os.path.join(ROOT, "prototyper.py"), "serve", "--port", str(port)],
+        stderr=subprocess.DEVNULL,
+    )
+    deadline = time.monotonic() + 10
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.2).close()
+            return server
+        except OSError:
+            time.sleep(0.05)
+    server.kill()
+    raise RuntimeError("Server did not start.")
+
+
+def client_worker(port: int, worker: int, seconds: float, batch: int, cards: int) -> int:
+    """Send pipelined move/show batches for `seconds`; return requests answered."""
+    done = 0
+    with ServerClient(port=port) as client:
+        deadline = time.monotonic() + seconds
+        i = worker
+        while time.monotonic() < deadline:
+            requests = []
+            for _ in range(batch // 2):
+                name = f"Card {i % cards}"
+                requests.append(("move", {"from": "deck", "to": "hand", "name": name}))
+                requests.append(("show", {"pile": "hand", "limit": 5}))
+                i += 7
+            # Put the cards back so the deck does not run dry.
+            requests.append(("movequery", {"from": "hand", "to": "deck", "query": "card"}))
+            done += len(client.pipeline(requests))
+    return done
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--clients", type=int, default=4, help="concurrent client processes")
+    parser.add_argument("--seconds", type=float, default=5.0, help="duration of the test")
+    parser.add_argument("--batch", type=int, default=100, help="requests per pipelined batch")
+    parser.add_argument("--cards", type=int, default=10000, help="cards in the deck")
+    args = parser.parse_args()
+
+    port = free_port()
+    server = start_server(port)
+    try:
+        with ServerClient(port=port) as client:
+            client.request("create", pile="deck")
+            client.request("create", pile="hand")
+        # Seed the deck through a temporary card file.
+        catalog = os.path.join(ROOT, f".bench_server_{port}.jsonl")
+        with open(catalog, "w") as f:
+            for i in range(args.cards):
+                f.write(f'{{"name": "Card {i}", "tags": ["card"]}}\n')
+        try:
+            with ServerClient(port=port) as client:
+                client.request("load", pile="deck", filename=catalog)
+        finally:
+            os.remove(catalog)
+
+        start = time.perf_counter()
+        with ProcessPoolExecutor(max_workers=args.clients) as pool:
+            futures = [pool.submit(client_worker, port, i, args.seconds, args.batch, args.cards)
+                       for i in range(args.clients)]
+            counts = [future.result() for future in futures]
+        elapsed = time.perf_counter() - start
+    finally:
+        server.terminate()
+        server.wait()
+
+    total = sum(counts)
+    print(f"{args.clients} client(s), batches of {args.batch}, {elapsed:.1f}s")
+    print(f"  {total} requests, {total / elapsed:,.0f} requests/s")
+    for i, count in enumerate(counts):
+        print(f"  client {i}: {count / elapsed:,.0f} requests/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -4,33 +4,338 @@ Universal Prototyper - A simple text-based prototyping tool for rapidly testing
 simulation/strategy game mechanics.
 """
 
+import argparse
+import asyncio
+import errno
+import hashlib
+import io
+import itertools
 import json
+import math
+import mmap
+import os
+import random
+import re
+import shlex
+import shutil
+import signal
+import socket
+import struct
+import subprocess
 import sys
-from typing import List, Dict, Optional
+import tempfile
+import threading
+import time
+from array import array
+from collections import Counter, defaultdict, deque
+from collections.abc import MutableMapping
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from contextlib import asynccontextmanager, contextmanager, redirect_stdout
+from fractions import Fraction
+from bisect import bisect_left, bisect_right, insort
+from functools import lru_cache
+from typing import Callable, Deque, Dict, Iterable, Iterator, List, Mapping, Optional, Sequence, Tuple
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+try:
+    import numpy as np
+except ImportError:  # NumPy is optional; only the columnar backend needs it.
+    np = None
+
+
+class PrototyperError(Exception):
+    """Base class for errors raised by the prototyper engine."""
+
+
+class InvalidArgumentError(PrototyperError, ValueError):
+    """An argument to an engine operation is out of range or malformed."""
+
+
+class QueryError(InvalidArgumentError):
+    """A tag query or draw condition could not be parsed."""
+
+
+class SessionFormatError(PrototyperError, ValueError):
+    """A saved session or journal is not in a format that can be read."""
+
+
+class PileNotFoundError(PrototyperError, LookupError):
+    """A command referred to a pile that does not exist."""
+    
+    def __init__(self, pile_name: str, role: str = "Pile"):
+        super().__init__(f"{role} '{pile_name}' does not exist.")
+        self.pile_name = pile_name
+
+
+class PileExistsError(PrototyperError):
+    """A pile with the requested name already exists."""
+    
+    def __init__(self, pile_name: str):
+        super().__init__(f"Pile '{pile_name}' already exists.")
+        self.pile_name = pile_name
+
+
+class CardNotFoundError(PrototyperError, LookupError):
+    """No card with the requested name is in the pile."""
+    
+    def __init__(self, card_name: str, pile_name: Optional[str]):
+        if pile_name is None:
+            super().__init__(f"Card '{card_name}' not found in any pile.")
+        else:
+            super().__init__(f"Card '{card_name}' not found in pile '{pile_name}'.")
+        self.card_name = card_name
+        self.pile_name = pile_name
+
+
+class BranchNotFoundError(PrototyperError, LookupError):
+    """A command referred to a session branch that does not exist."""
+    
+    def __init__(self, branch_name: str):
+        super().__init__(f"Branch '{branch_name}' does not exist.")
+        self.branch_name = branch_name
+
+
+class BranchExistsError(PrototyperError):
+    """A session branch with the requested name already exists."""
+    
+    def __init__(self, branch_name: str):
+        super().__init__(f"Branch '{branch_name}' already exists.")
+        self.branch_name = branch_name
+
+
+class TagVocabulary:
+    """Shared pool of tag strings, so each distinct tag is stored only once.
+    
+    Every tag is also assigned its own bit, which lets a card's tags be
+    encoded as a single integer mask for fast boolean queries. Registering
+    a new tag is serialized by a lock, so server threads loading cards at
+    the same time cannot give two tags the same bit.
+    """
+    
+    def __init__(self):
+        self._tags: Dict[str, str] = {}
+        self._bits: Dict[str, int] = {}
+        self._lock = threading.Lock()
+    
+    def __getstate__(self) -> Dict:
+        # Queries carrying a vocabulary are pickled for simulation workers
+        state = self.__dict__.copy()
+        del state["_lock"]
+        return state
+    
+    def __setstate__(self, state: Dict):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+    
+    def __len__(self) -> int:
+        return len(self._tags)
+    
+    def __contains__(self, tag: str) -> bool:
+        return tag in self._tags
+    
+    def intern(self, tag: str) -> str:
+        """Return the canonical copy of a tag string, registering it if new."""
+        canonical = self._tags.get(tag)
+        if canonical is None:
+            with self._lock:
+                canonical = self._tags.get(tag)
+                if canonical is None:
+                    # The bit goes in first: a tag seen in _tags always has one
+                    self._bits[tag] = 1 << len(self._bits)
+                    canonical = self._tags[tag] = tag
+        return canonical
+    
+    def intern_all(self, tags: Iterable[str]) -> Tuple[str, ...]:
+        """Return the canonical copies of several tags as a tuple."""
+        return tuple([self.intern(tag) for tag in tags])
+    
+    def bit(self, tag: str) -> Optional[int]:
+        """Return the bit assigned to a tag, or None if the tag is unknown."""
+        return self._bits.get(tag)
+    
+    def bits(self) -> Iterator[Tuple[str, int]]:
+        """Iterate over every known tag with its bit."""
+        return iter(list(self._bits.items()))
+    
+    def encode(self, tags: Iterable[str]) -> Tuple[Tuple[str, ...], int]:
+        """Intern several tags, returning them as a tuple with their mask."""
+        interned = self.intern_all(tags)
+        bits = self._bits
+        mask = 0
+        for tag in interned:
+            mask |= bits[tag]
+        return interned, mask
+
+
+# Process-wide tag vocabulary shared by every card, and so by every session
+# and branch in the process. Bits are never released, so once more than 64
+# distinct tags have been seen, columnar piles holding cards with the later
+# tags fall back to Python-integer masks.
+TAGS = TagVocabulary()
+
+
+class TagQuery:
+    """Boolean expression over tags, evaluated with mask arithmetic.
+    
+    Expressions combine tag names with `&` (and), `|` (or), `~` (not) and
+    parentheses, e.g. `spell & fire & ~ice`. Tag names may contain spaces.
+    The expression is compiled to disjunctive normal form: a list of
+    (required, forbidden) mask pairs, any of which a card may satisfy.
+    """
+    
+    _OPERATORS = "&|~()"
+    
+    def __init__(self, expression: str, vocabulary: TagVocabulary = TAGS):
+        self.expression = expression
+        self._vocabulary = vocabulary
+        self._tokens = self._tokenize(expression)
+        self._pos = 0
+        tree = self._parse_or()
+        if self._pos != len(self._tokens):
+            raise QueryError(f"Unexpected '{self._tokens[self._pos]}' in tag query.")
+        self.terms = self._normalize(tree, False)
+    
+    @classmethod
+    def _tokenize(cls, expression: str) -> List[str]:
+        tokens = []
+        word = []
+        for char in expression:
+            if char in cls._OPERATORS:
+                if "".join(word).strip():
+                    tokens.append("".join(word).strip())
+                word = []
+                tokens.append(char)
+            else:
+                word.append(char)
+        if "".join(word).strip():
+            tokens.append("".join(word).strip())
+        if not tokens:
+            raise QueryError("Empty tag query.")
+        return tokens
+    
+    def _next(self) -> Optional[str]:
+        return self._tokens[self._pos] if self._pos < len(self._tokens) else None
+    
+    def _parse_or(self):
+        node = self._parse_and()
+        while self._next() == "|":
+            self._pos += 1
+            node = ("or", node, self._parse_and())
+        return node
+    
+    def _parse_and(self):
+        node = self._parse_not()
+        while self._next() == "&":
+            self._pos += 1
+            node = ("and", node, self._parse_not())
+        return node
+    
+    def _parse_not(self):
+        token = self._next()
+        if token == "~":
+            self._pos += 1
+            return ("not", self._parse_not())
+        if token == "(":
+            self._pos += 1
+            node = self._parse_or()
+            if self._next() != ")":
+                raise QueryError("Missing ')' in tag query.")
+            self._pos += 1
+            return node
+        if token is None or token in self._OPERATORS:
+            raise QueryError(f"Expected a tag in query, got '{token or 'end of input'}'.")
+        self._pos += 1
+        return ("tag", token)
+    
+    def _normalize(self, node, negate: bool) -> List[Tuple[int, int]]:
+        """Convert a parse tree to a list of (required, forbidden) mask pairs."""
+        kind = node[0]
+        if kind == "tag":
+            bit = self._vocabulary.bit(node[1])
+            if bit is None:
+                # No card carries an unknown tag.
+                return [(0, 0)] if negate else []
+            return [(0, bit)] if negate else [(bit, 0)]
+        if kind == "not":
+            return self._normalize(node[1], not negate)
+        left = self._normalize(node[1], negate)
+        right = self._normalize(node[2], negate)
+        if (kind == "or") != negate:
+            return left + right
+        terms = []
+        for required_a, forbidden_a in left:
+            for required_b, forbidden_b in right:
+                required = required_a | required_b
+                forbidden = forbidden_a | forbidden_b
+                if not required & forbidden:
+                    terms.append((required, forbidden))
+        return terms
+    
+    @classmethod
+    def from_terms(cls, expression: str, terms: List[Tuple[int, int]]) -> 'TagQuery':
+        """Build a query directly from (required, forbidden) mask pairs."""
+        query = cls.__new__(cls)
+        query.expression = expression
+        query.terms = terms
+        return query
+    
+    def matches(self, mask: int) -> bool:
+        """Check whether a tag mask satisfies the query."""
+        for required, forbidden in self.terms:
+            if mask & required == required and not mask & forbidden:
+                return True
+        return False
 
 
 class Card:
-    """Represents a game object with name, effect, and tags."""
+    """Represents a game object with name, effect, and tags.
+    
+    Cards are compact: attributes live in slots and tags are an immutable
+    tuple of strings interned in the shared tag vocabulary, alongside the
+    bit mask encoding them.
+    """
+    
+    __slots__ = ("name", "effect", "tags", "mask")
     
-    def __init__(self, name: str, effect: str = "", tags: Optional[List[str]] = None):
+    def __init__(self, name: str, effect: str = "", tags: Optional[Iterable[str]] = None):
         self.name = name
         self.effect = effect
-        self.tags = tags if tags is not None else []
+        self.tags: Tuple[str, ...]
+        self.tags, self.mask = TAGS.encode(tags) if tags else ((), 0)
     
     def to_dict(self) -> Dict:
         """Convert card to dictionary for JSON serialization."""
         return {
             "name": self.name,
             "effect": self.effect,
-            "tags": self.tags
+            "tags": list(self.tags)
         }
     
     @classmethod
-    def from_dict(cls, data: Dict) -> 'Card':
-        """Create card from dictionary."""
+    def from_encoded(cls, name: str, effect: str, tags: Tuple[str, ...], mask: int) -> 'Card':
+        """Create card from tags already interned and encoded by TAGS.encode."""
+        card = cls.__new__(cls)
+        card.name = name
+        card.effect = effect
+        card.tags = tags
+        card.mask = mask
+        return card
+    
+    @classmethod
+    def from_dict(cls, data: Dict, intern_effect: bool = False) -> 'Card':
+        """Create card from dictionary.
+        
+        With intern_effect, the effect text is interned as well, which saves
+        memory when many cards share the same effect.
+        """
+        effect = data.get("effect", "")
         return cls(
             name=data.get("name", ""),
-            effect=data.get("effect", ""),
+            effect=sys.intern(effect) if intern_effect and isinstance(effect, str) else effect,
             tags=data.get("tags", [])
         )
     
@@ -40,199 +345,3141 @@ class Card:
     
     def has_tag(self, tag: str) -> bool:
         """Check if card has a specific tag."""
-        return tag in self.tags
+        bit = TAGS.bit(tag)
+        return bit is not None and bool(self.mask & bit)
+
+
+_STAT_PATTERN = re.compile(r"([A-Za-z][\w-]*)\s*:\s*(-?\d+(?:\.\d+)?)(?![\w.])")
+
+
+@lru_cache(maxsize=1 << 16)
+def _effect_stats(effect: str) -> Tuple[Tuple[str, float], ...]:
+    """Numeric stats written into effect text as "Name: value", e.g. "Attack: 3"."""
+    return tuple((name, float(value) if '.' in value else int(value))
+                 for name, value in _STAT_PATTERN.findall(effect))
+
+
+def _tally_stats(stats: Dict[str, List], card: Card, sign: int):
+    """Add (sign=1) or remove (sign=-1) a card's stats in a {stat: [cards, total]} table."""
+    effect = card.effect
+    if not effect or not isinstance(effect, str):
+        return
+    for name, value in _effect_stats(effect):
+        entry = stats.get(name)
+        if entry is None:
+            entry = stats[name] = [0, 0]
+        entry[0] += sign
+        entry[1] += sign * value
+        if not entry[0]:
+            del stats[name]
+
+
+class _SlotOrder:
+    """Sorted slot numbers, stored as a list of sorted blocks.
+    
+    Appending past the end is O(1). Inserting or removing a single slot
+    anywhere costs a bisect plus a shift within one block of at most
+    2 * BLOCK slots, so putting a card back mid-pile never touches the rest
+    of the pile. Bulk changes to a large share of the slots rebuild the
+    blocks in linear time instead.
+    """
+    
+    BLOCK = 1024
+    
+    __slots__ = ("_blocks", "_maxes", "_len")
+    
+    def __init__(self, slots: Iterable[int] = ()):
+        self._rebuild(slots)
+    
+    def _rebuild(self, slots: Iterable[int]):
+        """Replace the contents with already sorted slots."""
+        slots = list(slots)
+        size = self.BLOCK
+        self._blocks = [slots[i:i + size] for i in range(0, len(slots), size)]
+        self._maxes = [block[-1] for block in self._blocks]
+        self._len = len(slots)
+    
+    def __len__(self) -> int:
+        return self._len
+    
+    def __iter__(self) -> Iterator[int]:
+        return itertools.chain.from_iterable(self._blocks)
+    
+    def __reversed__(self) -> Iterator[int]:
+        return itertools.chain.from_iterable(reversed(block) for block in reversed(self._blocks))
+    
+    def copy(self) -> '_SlotOrder':
+        order = _SlotOrder.__new__(_SlotOrder)
+        order._blocks = [block[:] for block in self._blocks]
+        order._maxes = self._maxes[:]
+        order._len = self._len
+        return order
+    
+    def append(self, slot: int):
+        """Add a slot greater than every slot present."""
+        if self._blocks and len(self._blocks[-1]) < self.BLOCK:
+            self._blocks[-1].append(slot)
+            self._maxes[-1] = slot
+        else:
+            self._blocks.append([slot])
+            self._maxes.append(slot)
+        self._len += 1
+    
+    def add(self, slot: int):
+        """Insert a slot in sorted position."""
+        maxes = self._maxes
+        if not maxes or slot > maxes[-1]:
+            self.append(slot)
+            return
+        i = bisect_left(maxes, slot)
+        block = self._blocks[i]
+        insort(block, slot)
+        if len(block) > 2 * self.BLOCK:
+            half = self.BLOCK
+            self._blocks[i:i + 1] = [block[:half], block[half:]]
+            maxes[i:i + 1] = [block[half - 1], block[-1]]
+        self._len += 1
+    
+    def add_many(self, slots: Sequence[int]):
+        """Insert several slots (sorted) that are not present yet."""
+        if len(slots) * 8 > self._len:
+            self._rebuild(sorted(itertools.chain(self, slots)))
+        else:
+            for slot in slots:
+                self.add(slot)
+    
+    def remove(self, slot: int):
+        """Remove a slot that is present."""
+        maxes = self._maxes
+        i = bisect_left(maxes, slot)
+        block = self._blocks[i]
+        del block[bisect_left(block, slot)]
+        self._len -= 1
+        if not block:
+            del self._blocks[i]
+            del maxes[i]
+        elif maxes[i] != block[-1]:
+            maxes[i] = block[-1]
+    
+    def remove_many(self, slots: Sequence[int]):
+        """Remove several slots that are present."""
+        if len(slots) * 8 > self._len:
+            gone = set(slots)
+            self._rebuild(slot for slot in self if slot not in gone)
+        else:
+            for slot in slots:
+                self.remove(slot)
+    
+    def _offsets(self) -> List[int]:
+        """Position of the first slot of each block."""
+        return list(itertools.accumulate((len(block) for block in self._blocks), initial=0))
+    
+    def positions(self, slots: Iterable[int]) -> List[int]:
+        """Zero-based positions of slots that are present."""
+        offsets = self._offsets()
+        maxes, blocks = self._maxes, self._blocks
+        positions = []
+        for slot in slots:
+            i = bisect_left(maxes, slot)
+            positions.append(offsets[i] + bisect_left(blocks[i], slot))
+        return positions
+    
+    def at(self, positions: Iterable[int]) -> List[int]:
+        """Slots at zero-based positions."""
+        offsets = self._offsets()
+        blocks = self._blocks
+        slots = []
+        for position in positions:
+            i = bisect_right(offsets, position) - 1
+            slots.append(blocks[i][position - offsets[i]])
+        return slots
+    
+    def islice(self, start: int, stop: int) -> Iterator[int]:
+        """Slots at positions start to stop - 1.
+    
+        Whole blocks are skipped from whichever end is nearer the range.
+        """
+        if self._len - stop < start:
+            return self._islice_from_end(start, stop)
+        return self._islice_from_front(start, stop)
+    
+    def _islice_from_front(self, start: int, stop: int) -> Iterator[int]:
+        for block in self._blocks:
+            if start >= len(block):
+                start -= len(block)
+                stop -= len(block)
+                continue
+            if stop <= 0:
+                return
+            yield from block[start:stop]
+            stop -= len(block)
+            start = 0
+    
+    def _islice_from_end(self, start: int, stop: int) -> Iterator[int]:
+        pieces = []
+        end = self._len
+        for block in reversed(self._blocks):
+            begin = end - len(block)
+            if begin < stop:
+                pieces.append(block[max(start - begin, 0):stop - begin])
+                if begin <= start:
+                    break
+            end = begin
+        return itertools.chain.from_iterable(reversed(pieces))
 
 
 class Pile:
-    """Represents a collection of cards."""
+    """Represents a collection of cards.
+    
+    Cards are keyed by slot numbers that increase towards the bottom of
+    the pile, and a _SlotOrder keeps the slots in pile order. Name and tag
+    indexes map each card name and tag to the slots holding it, so lookups
+    and removals by name or tag do not scan the pile.
+    
+    Slots are never reused, so a card taken out can later be put back in
+    exactly its old place with `restore_slots`, at the cost of a bisect
+    rather than a re-sort of the pile.
+    
+    Tag counts come straight from the tag index. Sums of the numeric stats
+    in card effects are tallied on first request and kept current as cards
+    come and go.
+    
+    `version` grows whenever the pile's cards or their order change, so
+    savers can tell whether a pile changed since they last wrote it.
+    """
     
     def __init__(self, name: str):
         self.name = name
-        self.cards: List[Card] = []
+        self._slots: Dict[int, Card] = {}
+        self._order = _SlotOrder()
+        self._by_name: Dict[str, Dict[int, None]] = {}
+        self._by_tag: Dict[str, Dict[int, None]] = {}
+        self._next_slot = 0
+        self._stats: Optional[Dict[str, List]] = None
+        self.version = 0
+    
+    @property
+    def cards(self) -> List[Card]:
+        """Snapshot of the cards in pile order."""
+        return list(map(self._slots.__getitem__, self._order))
+    
+    @property
+    def next_slot(self) -> int:
+        """Slot the next card added to the bottom will get."""
+        return self._next_slot
+    
+    def __len__(self) -> int:
+        return len(self._slots)
+    
+    def __iter__(self) -> Iterator[Card]:
+        return map(self._slots.__getitem__, self._order)
     
     def add_card(self, card: Card):
         """Add a card to the pile."""
-        self.cards.append(card)
+        slot = self._next_slot
+        self._next_slot += 1
+        self.version += 1
+        self._slots[slot] = card
+        self._order.append(slot)
+        self._by_name.setdefault(card.name, {})[slot] = None
+        for tag in card.tags:
+            self._by_tag.setdefault(tag, {})[slot] = None
+        if self._stats is not None:
+            _tally_stats(self._stats, card, 1)
+    
+    def add_cards(self, cards: Iterable[Card]) -> int:
+        """Add several cards to the pile. Returns the number added."""
+        count = 0
+        for card in cards:
+            self.add_card(card)
+            count += 1
+        return count
     
     def remove_card(self, card: Card) -> bool:
         """Remove a card from the pile. Returns True if successful."""
-        try:
-            self.cards.remove(card)
-            return True
-        except ValueError:
+        slots = self._by_name.get(card.name)
+        if not slots:
             return False
+        for slot in slots:
+            if self._slots[slot] is card:
+                self._remove_slot(slot)
+                return True
+        return False
+    
+    def _remove_slot(self, slot: int) -> Card:
+        """Remove the card in a slot and drop it from the indexes."""
+        card = self._unindex(slot)
+        self._order.remove(slot)
+        return card
+    
+    def _unindex(self, slot: int) -> Card:
+        """Remove the card in a slot from everything but the slot order."""
+        card = self._slots.pop(slot)
+        self.version += 1
+        slots = self._by_name[card.name]
+        del slots[slot]
+        if not slots:
+            del self._by_name[card.name]
+        for tag in card.tags:
+            slots = self._by_tag.get(tag)
+            if slots is not None:
+                slots.pop(slot, None)
+                if not slots:
+                    del self._by_tag[tag]
+        if self._stats is not None:
+            _tally_stats(self._stats, card, -1)
+        return card
+    
+    def take_slots(self, slots: Iterable[int]) -> List[Card]:
+        """Remove the cards in the given slots, returning them in that order."""
+        slots = slots if isinstance(slots, (list, range)) else list(slots)
+        cards = [self._slots[slot] for slot in slots]  # KeyError before any change
+        for slot in slots:
+            self._unindex(slot)
+        self._order.remove_many(slots)
+        return cards
+    
+    def restore_slots(self, slots: Sequence[int], cards: Iterable[Card]):
+        """Put cards back into the free slots they were taken from, in pile order."""
+        self.version += 1
+        if len(slots):
+            self._next_slot = max(self._next_slot, max(slots) + 1)
+        self._order.add_many(slots)
+        out_of_order = set()
+        for slot, card in zip(slots, cards):
+            self._slots[slot] = card
+            named = self._by_name.setdefault(card.name, {})
+            if named and slot < next(reversed(named)):
+                out_of_order.add(card.name)
+            named[slot] = None
+            for tag in card.tags:
+                self._by_tag.setdefault(tag, {})[slot] = None
+            if self._stats is not None:
+                _tally_stats(self._stats, card, 1)
+        # The name index must stay in pile order for find_card_by_name
+        for name in out_of_order:
+            self._by_name[name] = dict.fromkeys(sorted(self._by_name[name]))
+    
+    def positions_of(self, slots: Iterable[int]) -> List[int]:
+        """Zero-based positions from the top of the cards in the given slots."""
+        return self._order.positions(slots)
+    
+    def slots_at(self, positions: Iterable[int]) -> List[int]:
+        """Slots of the cards at the given zero-based positions from the top."""
+        return self._order.at(positions)
+    
+    def insert_at(self, positions: Sequence[int], cards: Iterable[Card]):
+        """Insert cards so that they end up at the given positions, in pile order."""
+        merged = self.cards
+        added = []
+        for position, card in zip(positions, cards):
+            merged.insert(position, card)
+            added.append(card)
+        self._refill(merged)
+        if self._stats is not None:
+            for card in added:
+                _tally_stats(self._stats, card, 1)
+    
+    def slot_of(self, name: str) -> Optional[int]:
+        """Slot of the topmost card with an exact name, or None."""
+        slots = self._by_name.get(name)
+        if not slots:
+            return None
+        return next(iter(slots))
     
     def find_card_by_name(self, name: str) -> Optional[Card]:
         """Find a card by exact name match."""
-        for card in self.cards:
-            if card.name == name:
-                return card
-        return None
+        slot = self.slot_of(name)
+        return None if slot is None else self._slots[slot]
+    
+    def slots_by_tag(self, tag: str) -> List[int]:
+        """Slots of all cards with a specific tag, in pile order."""
+        return sorted(self._by_tag.get(tag, ()))
     
     def find_cards_by_tag(self, tag: str) -> List[Card]:
         """Find all cards with a specific tag."""
-        return [card for card in self.cards if card.has_tag(tag)]
+        return [self._slots[slot] for slot in self.slots_by_tag(tag)]
+    
+    def take_cards_by_tag(self, tag: str) -> List[Card]:
+        """Remove all cards with a specific tag, returning them in pile order."""
+        return self.take_slots(self.slots_by_tag(tag))
+    
+    def slots_matching(self, query: TagQuery) -> List[int]:
+        """Slots whose cards satisfy a tag query, in pile order."""
+        terms = query.terms
+        if not terms:
+            return []
+        # The card dict is not in pile order; sorting slots restores it
+        if len(terms) == 1:
+            required, forbidden = terms[0]
+            return sorted([slot for slot, card in self._slots.items()
+                           if card.mask & required == required and not card.mask & forbidden])
+        matches = query.matches
+        return sorted([slot for slot, card in self._slots.items() if matches(card.mask)])
+    
+    def query(self, query: TagQuery) -> List[Card]:
+        """Find all cards matching a tag query."""
+        return [self._slots[slot] for slot in self.slots_matching(query)]
+    
+    def count(self, query: TagQuery) -> int:
+        """Count the cards matching a tag query."""
+        return len(self.slots_matching(query))
+    
+    def take_cards_matching(self, query: TagQuery) -> List[Card]:
+        """Remove all cards matching a tag query, returning them in pile order."""
+        return self.take_slots(self.slots_matching(query))
+    
+    def shuffle(self, rng: random.Random):
+        """Shuffle the pile in place.
+        
+        Cards are dealt back into the pile's existing slots, so slots
+        recorded earlier (e.g. for undo) keep pointing at the same places.
+        """
+        cards = self.cards
+        rng.shuffle(cards)
+        self._permute(cards)
+    
+    def unshuffle(self, rng: random.Random):
+        """Reverse a `shuffle` made with an rng in the same state as `rng`."""
+        cards = self.cards
+        order = list(range(len(cards)))
+        rng.shuffle(order)
+        previous: List[Card] = [None] * len(cards)
+        for card, position in zip(cards, order):
+            previous[position] = card
+        self._permute(previous)
+    
+    def _permute(self, cards: List[Card]):
+        """Deal a reordering of the pile's cards back into its slots, in order."""
+        self.version += 1
+        self._slots = dict(zip(self._order, cards))
+        by_name: Dict[str, Dict[int, None]] = {}
+        by_tag: Dict[str, Dict[int, None]] = {}
+        for slot, card in self._slots.items():
+            by_name.setdefault(card.name, {})[slot] = None
+            for tag in card.tags:
+                by_tag.setdefault(tag, {})[slot] = None
+        self._by_name = by_name
+        self._by_tag = by_tag
+    
+    def top_slots(self, count: int) -> List[int]:
+        """Slots of the top `count` cards (fewer if the pile is smaller)."""
+        return list(self._order.islice(0, max(count, 0)))
+    
+    def _refill(self, cards: List[Card]):
+        """Replace the pile's contents with a reordering of its cards."""
+        stats, self._stats = self._stats, None
+        self._slots.clear()
+        self._order = _SlotOrder()
+        self._by_name.clear()
+        self._by_tag.clear()
+        self.add_cards(cards)
+        self._stats = stats
+    
+    def copy(self) -> 'Pile':
+        """Independent copy of the pile that shares the (immutable) Card objects."""
+        pile = self.__class__.__new__(self.__class__)
+        pile.name = self.name
+        pile._slots = self._slots.copy()
+        pile._order = self._order.copy()
+        pile._by_name = {name: slots.copy() for name, slots in self._by_name.items()}
+        pile._by_tag = {tag: slots.copy() for tag, slots in self._by_tag.items()}
+        pile._next_slot = self._next_slot
+        pile.version = self.version
+        pile._stats = None if self._stats is None else {name: list(entry) for name, entry in self._stats.items()}
+        return pile
+    
+    def tag_counts(self) -> Dict[str, int]:
+        """Number of cards carrying each tag, in O(number of tags)."""
+        return {tag: len(slots) for tag, slots in self._by_tag.items()}
+    
+    def stat_sums(self) -> Dict[str, Tuple[int, float]]:
+        """Numeric stats found in card effects, as {stat: (cards with it, total)}."""
+        if self._stats is None:
+            stats: Dict[str, List] = {}
+            for card in self._slots.values():
+                _tally_stats(stats, card, 1)
+            self._stats = stats
+        return {name: (cards, total) for name, (cards, total) in self._stats.items()}
+    
+    def draw(self, count: int) -> List[Card]:
+        """Remove up to `count` cards from the top of the pile."""
+        return self.take_slots(self.top_slots(count))
     
     def to_dict(self) -> Dict:
         """Convert pile to dictionary for JSON serialization."""
         return {
             "name": self.name,
-            "cards": [card.to_dict() for card in self.cards]
+            "cards": [card.to_dict() for card in self]
         }
     
     @classmethod
     def from_dict(cls, data: Dict) -> 'Pile':
         """Create pile from dictionary."""
         pile = cls(data.get("name", ""))
-        for card_data in data.get("cards", []):
-            pile.add_card(Card.from_dict(card_data))
+        pile.add_cards(Card.from_dict(card_data) for card_data in data.get("cards", []))
         return pile
     
+    def iter_range(self, start: int, stop: int) -> Iterator[Card]:
+        """Cards at zero-based positions start to stop - 1 from the top.
+        
+        The walk starts from whichever end of the pile is nearer, so the
+        last rows of a huge pile are as cheap to reach as the first.
+        """
+        size = len(self._slots)
+        start, stop = max(start, 0), min(stop, size)
+        if start >= stop:
+            return iter(())
+        return map(self._slots.__getitem__, self._order.islice(start, stop))
+    
+    @staticmethod
+    def card_line(position: int, card: Card) -> str:
+        """One numbered row of a pile listing."""
+        line = f"{position}. {card.name}"
+        if card.effect:
+            line += f" - {card.effect}"
+        if card.tags:
+            line += f" [{', '.join(card.tags)}]"
+        return line
+    
+    def render(self, start: int = 0, stop: Optional[int] = None) -> Iterator[str]:
+        """Lines describing the pile, optionally only positions start to stop - 1.
+        
+        Rows are produced one at a time, so the cost is O(rows rendered).
+        """
+        size = len(self)
+        if not size:
+            yield f"Pile '{self.name}' is empty."
+            return
+        stop = size if stop is None else min(stop, size)
+        start = max(start, 0)
+        if start == 0 and stop == size:
+            yield f"Pile '{self.name}' contains {size} card(s):"
+        elif start >= stop:
+            yield f"Pile '{self.name}' contains {size} card(s), none in that range."
+            return
+        else:
+            yield f"Pile '{self.name}' contains {size} card(s), showing {start + 1}-{stop}:"
+        yield ""
+        card_line = self.card_line
+        for position, card in enumerate(self.iter_range(start, stop), start + 1):
+            yield card_line(position, card)
+    
     def __str__(self) -> str:
-        if not self.cards:
-            return f"Pile '{self.name}' is empty."
-        
-        result = f"Pile '{self.name}' contains {len(self.cards)} card(s):\n"
-        for i, card in enumerate(self.cards, 1):
-            result += f"\n{i}. {card.name}"
-            if card.effect:
-                result += f" - {card.effect}"
-            if card.tags:
-                result += f" [{', '.join(card.tags)}]"
-        return result
+        return "\n".join(self.render())
 
 
-class Prototyper:
-    """Main REPL for the prototyping tool."""
+class CardCatalog:
+    """Shared columnar store of cards for the columnar pile backend.
+    
+    Every card added gets an integer id. Columnar piles hold NumPy arrays of
+    these ids and look up names, effects and tag masks here, so filtering
+    and partitioning become array operations over the mask column.
+    """
     
     def __init__(self):
-        self.piles: Dict[str, Pile] = {}
-        self.running = True
+        if np is None:
+            raise RuntimeError("The columnar backend requires NumPy.")
+        self.cards: List[Card] = []
+        self._ids: Dict[int, int] = {}
+        self._by_name: Dict[str, List[int]] = {}
+        self.masks = np.zeros(1024, dtype=np.uint64)
     
-    def create_pile(self, pile_name: str):
-        """Create a new pile."""
-        if pile_name in self.piles:
-            print(f"Error: Pile '{pile_name}' already exists.")
-            return
-        
-        self.piles[pile_name] = Pile(pile_name)
-        print(f"Created pile '{pile_name}'.")
+    def __len__(self) -> int:
+        return len(self.cards)
     
-    def load_cards(self, pile_name: str, filename: str):
-        """Load cards from JSON file into a pile."""
-        if pile_name not in self.piles:
-            print(f"Error: Pile '{pile_name}' does not exist. Create it first.")
-            return
-        
-        try:
-            with open(filename, 'r') as f:
-                data = json.load(f)
-            
-            # Support both list of cards and object with cards array
-            cards_data = data if isinstance(data, list) else data.get("cards", [])
-            
-            count = 0
-            for card_data in cards_data:
-                card = Card.from_dict(card_data)
-                self.piles[pile_name].add_card(card)
-                count += 1
-            
-            print(f"Loaded {count} card(s) into pile '{pile_name}' from '{filename}'.")
-        
-        except FileNotFoundError:
-            print(f"Error: File '{filename}' not found.")
-        except json.JSONDecodeError:
-            print(f"Error: Invalid JSON in file '{filename}'.")
-        except Exception as e:
-            print(f"Error loading cards: {e}")
+    def add(self, card: Card) -> int:
+        """Return the id of a card, adding it to the catalog if new."""
+        card_id = self._ids.get(id(card))
+        if card_id is not None:
+            return card_id
+        card_id = len(self.cards)
+        self.cards.append(card)
+        self._ids[id(card)] = card_id
+        self._by_name.setdefault(card.name, []).append(card_id)
+        if card_id == len(self.masks):
+            self.masks = np.concatenate([self.masks, np.zeros_like(self.masks)])
+        if card.mask >> 64 and self.masks.dtype != object:
+            # More than 64 tags in use: fall back to Python integers.
+            self.masks = self.masks.astype(object)
+        self.masks[card_id] = card.mask
+        return card_id
     
-    def move_card(self, from_pile: str, to_pile: str, identifier: str, by_tag: bool = False):
-        """Move card(s) from one pile to another by name or tag."""
-        if from_pile not in self.piles:
-            print(f"Error: Source pile '{from_pile}' does not exist.")
-            return
-        
-        if to_pile not in self.piles:
-            print(f"Error: Destination pile '{to_pile}' does not exist.")
-            return
-        
-        source = self.piles[from_pile]
-        dest = self.piles[to_pile]
-        
-        if by_tag:
-            # Move all cards with matching tag
-            cards = source.find_cards_by_tag(identifier)
-            if not cards:
-                print(f"No cards with tag '{identifier}' found in pile '{from_pile}'.")
-                return
-            
-            for card in cards:
-                source.remove_card(card)
-                dest.add_card(card)
-            
-            print(f"Moved {len(cards)} card(s) with tag '{identifier}' from '{from_pile}' to '{to_pile}'.")
-        else:
-            # Move single card by name
-            card = source.find_card_by_name(identifier)
-            if not card:
-                print(f"Card '{identifier}' not found in pile '{from_pile}'.")
-                return
-            
-            source.remove_card(card)
-            dest.add_card(card)
-            print(f"Moved card '{identifier}' from '{from_pile}' to '{to_pile}'.")
+    def id_of(self, card: Card) -> Optional[int]:
+        """Return the id of a card, or None if it is not in the catalog."""
+        return self._ids.get(id(card))
     
-    def show_pile(self, pile_name: str):
-        """Display contents of a pile."""
-        if pile_name not in self.piles:
-            print(f"Error: Pile '{pile_name}' does not exist.")
-            return
-        
-        print(self.piles[pile_name])
+    def ids_named(self, name: str) -> List[int]:
+        """Return the ids of all catalog cards with a given name."""
+        return self._by_name.get(name, [])
     
-    def list_piles(self):
-        """List all existing piles."""
-        if not self.piles:
-            print("No piles created yet.")
-            return
+    def match(self, ids, query: TagQuery):
+        """Boolean array telling which of `ids` satisfy a tag query."""
+        masks = self.masks[ids]
+        hits = np.zeros(len(ids), dtype=bool)
+        if masks.dtype != object and any((r | f) >> 64 for r, f in query.terms):
+            masks = masks.astype(object)
+        wrap = int if masks.dtype == object else np.uint64
+        for required, forbidden in query.terms:
+            term = (masks & wrap(required)) == wrap(required)
+            if forbidden:
+                term &= (masks & wrap(forbidden)) == 0
+            hits |= term
+        return hits
+
+
+class ColumnarCards(Sequence):
+    """Read-only sequence of cards backed by an array of catalog ids."""
+    
+    def __init__(self, catalog: CardCatalog, ids):
+        self.catalog = catalog
+        self.ids = ids
+    
+    def __len__(self) -> int:
+        return len(self.ids)
+    
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return ColumnarCards(self.catalog, self.ids[index])
+        return self.catalog.cards[self.ids[index]]
+    
+    def __iter__(self) -> Iterator[Card]:
+        cards = self.catalog.cards
+        return (cards[card_id] for card_id in self.ids.tolist())
+
+
+class ColumnarPile(Pile):
+    """Pile backed by a NumPy array of card ids into a shared CardCatalog.
+    
+    Bulk operations (tag filtering, partitioning, shuffling, drawing and
+    counting) are vectorized over the array. Single-card removals copy the
+    array, so this backend suits large simulations rather than hand-driven
+    card-by-card play. A card's slot is simply its position in the array.
+    """
+    
+    def __init__(self, name: str, catalog: Optional[CardCatalog] = None):
+        self.name = name
+        self.catalog = catalog if catalog is not None else CardCatalog()
+        self._buf = np.empty(16, dtype=np.int64)
+        self._start = 0
+        self._end = 0
+        self._tag_counts: Optional[Dict[str, int]] = None
+        self._stats: Optional[Dict[str, List]] = None
+        self.version = 0
+    
+    @property
+    def ids(self):
+        """Array of the catalog ids in this pile, in pile order."""
+        return self._buf[self._start:self._end]
+    
+    @property
+    def cards(self) -> List[Card]:
+        """Snapshot of the cards in pile order."""
+        return list(self)
+    
+    @property
+    def next_slot(self) -> int:
+        """Slot the next card added to the bottom will get."""
+        return len(self)
+    
+    def __len__(self) -> int:
+        return self._end - self._start
+    
+    def __iter__(self) -> Iterator[Card]:
+        return iter(ColumnarCards(self.catalog, self.ids))
+    
+    def _set_ids(self, ids):
+        self.version += 1
+        self._buf = ids
+        self._start = 0
+        self._end = len(ids)
+    
+    def _account(self, ids, sign: int):
+        """Keep tag counts and stat sums current as ids join (+1) or leave (-1)."""
+        counts = self._tag_counts
+        if counts is not None and len(ids):
+            masks = self.catalog.masks[ids]
+            wide = masks.dtype == object
+            for tag, bit in TAGS.bits():
+                if bit >> 64 and not wide:
+                    break
+                hits = int(np.count_nonzero(masks & (bit if wide else np.uint64(bit))))
+                if hits:
+                    total = counts.get(tag, 0) + sign * hits
+                    if total:
+                        counts[tag] = total
+                    else:
+                        del counts[tag]
+        if self._stats is not None:
+            cards = self.catalog.cards
+            for card_id in ids.tolist():
+                _tally_stats(self._stats, cards[card_id], sign)
+    
+    def tag_counts(self) -> Dict[str, int]:
+        """Number of cards carrying each tag, in O(number of tags) once tallied."""
+        if self._tag_counts is None:
+            self._tag_counts = {}
+            self._account(self.ids, 1)
+        return dict(self._tag_counts)
+    
+    def stat_sums(self) -> Dict[str, Tuple[int, float]]:
+        """Numeric stats found in card effects, as {stat: (cards with it, total)}."""
+        if self._stats is None:
+            counts, self._tag_counts = self._tag_counts, None
+            self._stats = {}
+            self._account(self.ids, 1)
+            self._tag_counts = counts
+        return {name: (cards, total) for name, (cards, total) in self._stats.items()}
+    
+    def add_ids(self, ids):
+        """Append an array of catalog ids to the bottom of the pile."""
+        self.version += 1
+        self._account(ids, 1)
+        count = len(ids)
+        if self._end + count > len(self._buf):
+            current = self.ids
+            buf = np.empty(max(2 * (len(current) + count), 16), dtype=np.int64)
+            buf[:len(current)] = current
+            self._set_ids(buf)
+            self._end = len(current)
+        self._buf[self._end:self._end + count] = ids
+        self._end += count
+    
+    def add_card(self, card: Card):
+        """Add a card to the pile."""
+        self.add_ids(np.array([self.catalog.add(card)], dtype=np.int64))
+    
+    def add_cards(self, cards: Iterable[Card]) -> int:
+        """Add several cards to the pile. Returns the number added."""
+        ids = self._ids_of(cards)
+        self.add_ids(ids)
+        return len(ids)
+    
+    def _take(self, hits) -> ColumnarCards:
+        """Remove the cards flagged in a boolean array, keeping their order."""
+        ids = self.ids
+        taken = ids[hits]
+        if len(taken):
+            self._set_ids(ids[~hits])
+            self._account(taken, -1)
+        return ColumnarCards(self.catalog, taken)
+    
+    def iter_range(self, start: int, stop: int) -> Iterator[Card]:
+        """Cards at zero-based positions start to stop - 1 from the top."""
+        return iter(ColumnarCards(self.catalog, self.ids[max(start, 0):max(stop, 0)]))
+    
+    def _ids_of(self, cards: Iterable[Card]):
+        if isinstance(cards, ColumnarCards) and cards.catalog is self.catalog:
+            return cards.ids
+        return np.fromiter((self.catalog.add(card) for card in cards), dtype=np.int64)
+    
+    def take_slots(self, slots: Iterable[int]) -> ColumnarCards:
+        """Remove the cards in the given slots, returning them in pile order."""
+        if isinstance(slots, range) and slots.start == 0 and slots.step == 1:
+            return self.draw(len(slots))
+        hits = np.zeros(len(self), dtype=bool)
+        hits[np.asarray(slots, dtype=np.int64)] = True
+        return self._take(hits)
+    
+    def restore_slots(self, slots: Sequence[int], cards: Iterable[Card]):
+        """Put cards back into the slots they were taken from, in pile order."""
+        slots = np.asarray(slots, dtype=np.int64)
+        restored = np.zeros(len(self) + len(slots), dtype=bool)
+        restored[slots] = True
+        ids = np.empty(len(restored), dtype=np.int64)
+        ids[restored] = added = self._ids_of(cards)
+        ids[~restored] = self.ids
+        self._set_ids(ids)
+        self._account(added, 1)
+    
+    def positions_of(self, slots: Iterable[int]) -> List[int]:
+        """Zero-based positions from the top of the cards in the given slots."""
+        return [int(slot) for slot in slots]
+    
+    def slots_at(self, positions: Iterable[int]) -> List[int]:
+        """Slots of the cards at the given zero-based positions from the top."""
+        return list(positions)
+    
+    insert_at = restore_slots
+    
+    def slot_of(self, name: str) -> Optional[int]:
+        """Slot of the topmost card with an exact name, or None."""
+        card_ids = self.catalog.ids_named(name)
+        if not card_ids:
+            return None
+        positions = np.flatnonzero(np.isin(self.ids, card_ids))
+        return int(positions[0]) if len(positions) else None
+    
+    def slots_by_tag(self, tag: str):
+        """Slots of all cards with a specific tag, in pile order."""
+        return np.flatnonzero(self._tag_hits(tag))
+    
+    def slots_matching(self, query: TagQuery):
+        """Slots whose cards satisfy a tag query, in pile order."""
+        return np.flatnonzero(self.catalog.match(self.ids, query))
+    
+    def remove_card(self, card: Card) -> bool:
+        """Remove a card from the pile. Returns True if successful."""
+        card_id = self.catalog.id_of(card)
+        if card_id is None:
+            return False
+        positions = np.flatnonzero(self.ids == card_id)
+        if not len(positions):
+            return False
+        self._set_ids(np.delete(self.ids, positions[0]))
+        self._account(np.array([card_id], dtype=np.int64), -1)
+        return True
+    
+    def find_card_by_name(self, name: str) -> Optional[Card]:
+        """Find a card by exact name match."""
+        slot = self.slot_of(name)
+        return None if slot is None else self.catalog.cards[self.ids[slot]]
+    
+    def _tag_hits(self, tag: str):
+        bit = TAGS.bit(tag)
+        if bit is None:
+            return np.zeros(len(self), dtype=bool)
+        return self.catalog.match(self.ids, TagQuery.from_terms(tag, [(bit, 0)]))
+    
+    def find_cards_by_tag(self, tag: str) -> List[Card]:
+        """Find all cards with a specific tag."""
+        return list(ColumnarCards(self.catalog, self.ids[self._tag_hits(tag)]))
+    
+    def take_cards_by_tag(self, tag: str) -> ColumnarCards:
+        """Remove all cards with a specific tag, returning them in pile order."""
+        return self._take(self._tag_hits(tag))
+    
+    def query(self, query: TagQuery) -> List[Card]:
+        """Find all cards matching a tag query."""
+        return list(ColumnarCards(self.catalog, self.ids[self.catalog.match(self.ids, query)]))
+    
+    def count(self, query: TagQuery) -> int:
+        """Count the cards matching a tag query."""
+        return int(np.count_nonzero(self.catalog.match(self.ids, query)))
+    
+    def take_cards_matching(self, query: TagQuery) -> ColumnarCards:
+        """Remove all cards matching a tag query, returning them in pile order."""
+        return self._take(self.catalog.match(self.ids, query))
+    
+    @staticmethod
+    def _shuffle_order(rng: random.Random, size: int):
+        """Positions the cards of a `size`-card pile come from after a shuffle.
         
-        print(f"Existing piles ({len(self.piles)}):")
-        for pile_name, pile in self.piles.items():
-            print(f"  - {pile_name} ({len(pile.cards)} cards)")
+        This is the permutation `rng.shuffle` applies, the same one the list
+        backend uses, so a seed (or a journal) gives the same order on both.
+        """
+        order = list(range(size))
+        rng.shuffle(order)
+        return np.array(order, dtype=np.int64)
+    
+    def shuffle(self, rng: random.Random):
+        """Shuffle the pile in place."""
+        self._set_ids(self.ids[self._shuffle_order(rng, len(self))])
+    
+    def unshuffle(self, rng: random.Random):
+        """Reverse a `shuffle` made with an rng in the same state as `rng`."""
+        order = self._shuffle_order(rng, len(self))
+        previous = np.empty_like(self.ids)
+        previous[order] = self.ids
+        self._set_ids(previous)
+    
+    def top_slots(self, count: int) -> range:
+        """Slots of the top `count` cards (fewer if the pile is smaller)."""
+        return range(min(max(count, 0), len(self)))
+    
+    def copy(self) -> 'ColumnarPile':
+        """Independent copy of the pile over the same catalog."""
+        pile = self.__class__(self.name, self.catalog)
+        pile._set_ids(self.ids.copy())
+        pile.version = self.version
+        if self._tag_counts is not None:
+            pile._tag_counts = dict(self._tag_counts)
+        if self._stats is not None:
+            pile._stats = {name: list(entry) for name, entry in self._stats.items()}
+        return pile
+    
+    def draw(self, count: int) -> ColumnarCards:
+        """Remove up to `count` cards from the top of the pile."""
+        count = min(count, len(self))
+        drawn = self._buf[self._start:self._start + count].copy()
+        self._start += count
+        self.version += 1
+        self._account(drawn, -1)
+        return ColumnarCards(self.catalog, drawn)
+    
+    @classmethod
+    def from_dict(cls, data: Dict, catalog: Optional[CardCatalog] = None) -> 'ColumnarPile':
+        """Create pile from dictionary."""
+        pile = cls(data.get("name", ""), catalog)
+        pile.add_cards(Card.from_dict(card_data) for card_data in data.get("cards", []))
+        return pile
+
+
+class DrawCondition:
+    """A requirement on how many drawn cards match a selector, e.g. `spell >= 2`.
+    
+    The selector is a tag query, or `name:<card name>` for an exact name.
+    A condition without a comparison means "at least one".
+    """
+    
+    _PATTERN = re.compile(r"^(.*?)\s*(>=|<=|==|!=|>|<)\s*(\d+)$")
+    _COMPARE = {
+        ">=": lambda a, b: a >= b,
+        "<=": lambda a, b: a <= b,
+        "==": lambda a, b: a == b,
+        "!=": lambda a, b: a != b,
+        ">": lambda a, b: a > b,
+        "<": lambda a, b: a < b,
+    }
+    
+    def __init__(self, text: str):
+        self.text = text.strip()
+        match = self._PATTERN.match(self.text)
+        if match:
+            selector, self.op, threshold = match.groups()
+            self.threshold = int(threshold)
+        else:
+            selector, self.op, self.threshold = self.text, ">=", 1
+        selector = selector.strip()
+        if selector.startswith("name:"):
+            self.name: Optional[str] = selector[len("name:"):].strip()
+            self.query: Optional[TagQuery] = None
+        else:
+            self.name = None
+            self.query = TagQuery(selector)
+    
+    @classmethod
+    def parse_all(cls, text: str) -> List['DrawCondition']:
+        """Parse a comma-separated list of conditions."""
+        conditions = [cls(part) for part in text.split(",") if part.strip()]
+        if not conditions:
+            raise QueryError("No draw conditions given.")
+        return conditions
+    
+    def selects(self, card: Card) -> bool:
+        """Check whether a card counts towards this condition."""
+        if self.name is not None:
+            return card.name == self.name
+        return self.query.matches(card.mask)
+    
+    def holds(self, count: int) -> bool:
+        """Check whether a count of selected cards satisfies the condition."""
+        return self._COMPARE[self.op](count, self.threshold)
+
+
+class SimulationResult:
+    """Aggregated outcome of a Monte Carlo draw simulation."""
+    
+    def __init__(self, trials: int, successes: int, seed: int, workers: int, elapsed: float):
+        self.trials = trials
+        self.successes = successes
+        self.seed = seed
+        self.workers = workers
+        self.elapsed = elapsed
+    
+    @property
+    def probability(self) -> float:
+        return self.successes / self.trials if self.trials else 0.0
+    
+    @property
+    def margin(self) -> float:
+        """Half-width of the 95% confidence interval."""
+        if not self.trials:
+            return 0.0
+        p = self.probability
+        return 1.96 * math.sqrt(p * (1 - p) / self.trials)
+
+
+def _run_trials(deck: List[int], draws: int, checks: List[Tuple[int, int, DrawCondition]],
+                trials: int, seed) -> int:
+    """Run `trials` draws from an encoded deck, returning how many succeed.
+    
+    Each deck entry packs one counter field per condition, so summing a
+    hand yields every condition's count at once.
+    """
+    sample = random.Random(seed).sample
+    successes = 0
+    for _ in range(trials):
+        packed = sum(sample(deck, draws))
+        for shift, field, condition in checks:
+            if not condition.holds((packed >> shift) & field):
+                break
+        else:
+            successes += 1
+    return successes
+
+
+_worker_state: Tuple = ()
+
+
+def _init_simulation_worker(deck: List[int], draws: int, checks):
+    global _worker_state
+    _worker_state = (deck, draws, checks)
+
+
+def _simulation_worker(trials: int, seed) -> int:
+    deck, draws, checks = _worker_state
+    return _run_trials(deck, draws, checks, trials, seed)
+
+
+class DrawSimulator:
+    """Monte Carlo estimator for "how often does a draw meet these conditions".
+    
+    Trials are split into fixed-size chunks, each with its own RNG stream
+    derived from the master seed, so a run is reproducible from the seed
+    alone no matter how many worker processes share the chunks.
+    """
+    
+    CHUNK_TRIALS = 10_000
+    
+    def __init__(self, cards: Iterable[Card], conditions: List[DrawCondition]):
+        self.conditions = conditions
+        self._cards = list(cards)
+    
+    def _encode(self, draws: int):
+        width = draws.bit_length() + 1
+        field = (1 << width) - 1
+        checks = [(i * width, field, condition) for i, condition in enumerate(self.conditions)]
+        deck = []
+        for card in self._cards:
+            packed = 0
+            for shift, _, condition in checks:
+                if condition.selects(card):
+                    packed |= 1 << shift
+            deck.append(packed)
+        return deck, checks
+    
+    def run(self, draws: int, trials: int, seed: Optional[int] = None,
+            workers: Optional[int] = None, mp_context=None) -> SimulationResult:
+        """Estimate the probability that `draws` cards meet every condition.
+        
+        `mp_context` picks the multiprocessing start method for the worker
+        processes (the platform default if None).
+        """
+        if draws < 0 or draws > len(self._cards):
+            raise InvalidArgumentError(f"Cannot draw {draws} card(s) from {len(self._cards)}.")
+        if trials <= 0:
+            raise InvalidArgumentError("Trials must be a positive number.")
+        if seed is None:
+            seed = random.SystemRandom().randrange(2 ** 32)
+        workers = workers or os.cpu_count() or 1
+        deck, checks = self._encode(draws)
+        
+        chunks = []
+        remaining = trials
+        while remaining > 0:
+            size = min(self.CHUNK_TRIALS, remaining)
+            chunks.append((size, f"{seed}:{len(chunks)}"))
+            remaining -= size
+        workers = max(1, min(workers, len(chunks)))
+        
+        start = time.perf_counter()
+        successes = 0
+        if workers == 1:
+            for size, chunk_seed in chunks:
+                successes += _run_trials(deck, draws, checks, size, chunk_seed)
+        else:
+            with ProcessPoolExecutor(max_workers=workers, mp_context=mp_context,
+                                     initializer=_init_simulation_worker,
+                                     initargs=(deck, draws, checks)) as pool:
+                futures = [pool.submit(_simulation_worker, size, chunk_seed)
+                           for size, chunk_seed in chunks]
+                for future in as_completed(futures):
+                    successes += future.result()
+        return SimulationResult(trials, successes, seed, workers, time.perf_counter() - start)
+
+
+@lru_cache(maxsize=65536)
+def _binomial(n: int, k: int) -> int:
+    return math.comb(n, k)
+
+
+class DrawProbability:
+    """Exact probability that a random draw meets a set of DrawConditions.
+    
+    Cards are grouped into classes by which conditions they count towards,
+    and a multivariate hypergeometric dynamic program walks the classes,
+    tracking the number drawn and each condition's count (capped just past
+    its threshold, since larger counts compare the same way). When that
+    state space is too large, `run` falls back to DrawSimulator.
+    """
+    
+    MAX_COST = 2_000_000
+    FALLBACK_TRIALS = 200_000
+    # The fallback can run on a server request thread, so it does not start
+    # a process per core unless asked to
+    FALLBACK_WORKERS = 1
+    
+    def __init__(self, cards: Iterable[Card], conditions: List[DrawCondition]):
+        self.conditions = conditions
+        self._cards = cards
+        by_name = any(condition.name is not None for condition in conditions)
+        # Conditions only look at names and tag masks, so count those first
+        # and classify each distinct key once.
+        keys = Counter((card.name, card.mask) if by_name else card.mask for card in cards)
+        self.classes: Dict[Tuple[bool, ...], int] = defaultdict(int)
+        for key, size in keys.items():
+            card = Card(key[0], "") if by_name else None
+            mask = key[1] if by_name else key
+            pattern = tuple(self._selects(condition, card, mask) for condition in conditions)
+            self.classes[pattern] += size
+        self.size = sum(keys.values())
+    
+    @staticmethod
+    def _selects(condition: DrawCondition, card: Optional[Card], mask: int) -> bool:
+        if condition.name is not None:
+            return card.name == condition.name
+        return condition.query.matches(mask)
+    
+    def _caps(self, draws: int) -> List[int]:
+        return [min(condition.threshold + 1, draws) for condition in self.conditions]
+    
+    def cost(self, draws: int) -> int:
+        """Upper bound on the work done by the exact computation."""
+        states = draws + 1
+        for cap in self._caps(draws):
+            states *= cap + 1
+        return len(self.classes) * states * (draws + 1)
+    
+    def exact(self, draws: int) -> Fraction:
+        """Compute the exact probability that `draws` cards meet every condition."""
+        if draws < 0 or draws > self.size:
+            raise InvalidArgumentError(f"Cannot draw {draws} card(s) from {self.size}.")
+        caps = self._caps(draws)
+        states: Dict[Tuple[int, Tuple[int, ...]], int] = {(0, (0,) * len(caps)): 1}
+        for pattern, size in self.classes.items():
+            following: Dict[Tuple[int, Tuple[int, ...]], int] = defaultdict(int)
+            for (drawn, counts), ways in states.items():
+                for taken in range(min(size, draws - drawn) + 1):
+                    new_counts = tuple(
+                        min(count + taken, cap) if hit else count
+                        for count, cap, hit in zip(counts, caps, pattern)
+                    )
+                    following[(drawn + taken, new_counts)] += ways * _binomial(size, taken)
+            states = following
+        favorable = sum(
+            ways for (drawn, counts), ways in states.items()
+            if drawn == draws and all(c.holds(n) for c, n in zip(self.conditions, counts))
+        )
+        return Fraction(favorable, _binomial(self.size, draws))
+    
+    def run(self, draws: int, seed: Optional[int] = None, workers: Optional[int] = None):
+        """Return the exact probability, or a SimulationResult if too costly.
+        
+        The fallback simulation uses `workers` processes (FALLBACK_WORKERS
+        if None).
+        """
+        if self.cost(draws) <= self.MAX_COST:
+            return self.exact(draws)
+        simulator = DrawSimulator(self._cards, self.conditions)
+        return simulator.run(draws, self.FALLBACK_TRIALS, seed=seed,
+                             workers=workers or self.FALLBACK_WORKERS)
+
+
+class CardStream:
+    """Incremental reader that yields card dictionaries from a file.
+    
+    Accepts a JSON array of cards, an object with a "cards" array, or JSON
+    Lines (one card per line). JSON is decoded one array element at a time
+    from a bounded buffer, so the whole catalog is never materialized as
+    Python objects at once. `chars_read` tracks progress through the file.
+    """
+    
+    CHUNK_SIZE = 1 << 16
+    _WHITESPACE = " \t\n\r"
+    _DELIMITERS = ",]}" + _WHITESPACE
+    
+    def __init__(self, f, json_lines: bool = False, chunk_size: int = CHUNK_SIZE):
+        self._file = f
+        self._json_lines = json_lines
+        self._chunk_size = chunk_size
+        self._decoder = json.JSONDecoder()
+        self._buf = ""
+        self._pos = 0
+        self._eof = False
+        self.chars_read = 0
+    
+    def __iter__(self) -> Iterator[Dict]:
+        if self._json_lines:
+            return self._iter_lines()
+        return self._iter_json()
+    
+    def _iter_lines(self) -> Iterator[Dict]:
+        for line in self._file:
+            self.chars_read += len(line)
+            if line.strip():
+                yield json.loads(line)
+    
+    def _fill(self) -> bool:
+        """Read another chunk, compacting the buffer. Returns False at EOF."""
+        if self._eof:
+            return False
+        chunk = self._file.read(self._chunk_size)
+        if not chunk:
+            self._eof = True
+            return False
+        self.chars_read += len(chunk)
+        self._buf = self._buf[self._pos:] + chunk
+        self._pos = 0
+        return True
+    
+    def _peek(self) -> str:
+        """Skip whitespace and return the next character ('' at EOF)."""
+        while True:
+            while self._pos < len(self._buf) and self._buf[self._pos] in self._WHITESPACE:
+                self._pos += 1
+            if self._pos < len(self._buf):
+                return self._buf[self._pos]
+            if not self._fill():
+                return ""
+    
+    def _expect(self, chars: str) -> str:
+        char = self._peek()
+        if not char or char not in chars:
+            raise json.JSONDecodeError(f"Expected one of {chars!r}", self._buf, self._pos)
+        self._pos += 1
+        return char
+    
+    def _value(self):
+        """Decode the next complete JSON value, reading more input as needed."""
+        self._peek()
+        while True:
+            try:
+                value, end = self._decoder.raw_decode(self._buf, self._pos)
+            except json.JSONDecodeError:
+                if not self._fill():
+                    raise
+                continue
+            # A number cut off by the end of the buffer (e.g. "1." of "1.5")
+            # may continue in the next chunk.
+            if (isinstance(value, (int, float)) and not isinstance(value, bool)
+                    and (end == len(self._buf) or self._buf[end] not in self._DELIMITERS)
+                    and self._fill()):
+                continue
+            self._pos = end
+            return value
+    
+    def _iter_array(self) -> Iterator[Dict]:
+        if self._peek() == "]":
+            self._pos += 1
+            return
+        while True:
+            yield self._value()
+            if self._expect(",]") == "]":
+                return
+    
+    def _iter_json(self) -> Iterator[Dict]:
+        start = self._expect("[{")
+        if start == "[":
+            yield from self._iter_array()
+            return
+        # Object format: stream the "cards" array, skip any other members.
+        if self._peek() == "}":
+            return
+        while True:
+            key = self._value()
+            self._expect(":")
+            if key == "cards" and self._peek() == "[":
+                self._pos += 1
+                yield from self._iter_array()
+            else:
+                self._value()
+            if self._expect(",}") == "}":
+                return
+
+
+class _PendingPile:
+    """Placeholder for a pile whose cards have not been loaded yet."""
+    
+    __slots__ = ("count", "loader", "source", "names")
+    
+    def __init__(self, count: int, loader: Callable[[], Pile], source=None,
+                 names: Optional[Callable[[], Optional[Dict[str, int]]]] = None):
+        self.count = count
+        self.loader = loader
+        self.source = source
+        self.names = names
+
+
+class PileMap(MutableMapping):
+    """Mapping of pile names to piles, where piles can be loaded lazily.
+    
+    A pile registered with `add_lazy` is built by its loader the first time
+    it is looked up. Until then its card count is still known, and checking
+    membership or listing names does not load anything.
+    
+    `fork` makes a copy-on-write branch: both maps share every pile until
+    one of them asks for it through `writable`, which copies just that pile.
+    """
+    
+    def __init__(self):
+        self._entries: Dict[str, object] = {}
+        # id(pile) -> number of maps holding it, for piles held by more than
+        # one map. Shared by every map forked from the same original.
+        self._refs: Dict[int, int] = {}
+    
+    def __getitem__(self, name: str) -> Pile:
+        entry = self._entries[name]
+        if isinstance(entry, _PendingPile):
+            # Each map runs its own loader, so the loaded pile is private
+            entry = self._entries[name] = entry.loader()
+        return entry
+    
+    def __setitem__(self, name: str, pile: Pile):
+        self._release(name)
+        self._entries[name] = pile
+    
+    def __delitem__(self, name: str):
+        self._release(name)
+        del self._entries[name]
+    
+    def __contains__(self, name) -> bool:
+        return name in self._entries
+    
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._entries)
+    
+    def __len__(self) -> int:
+        return len(self._entries)
+    
+    def add_lazy(self, name: str, count: int, loader: Callable[[], Pile], source=None,
+                 names: Optional[Callable[[], Optional[Dict[str, int]]]] = None):
+        """Register a pile of `count` cards that `loader` builds on first access.
+        
+        `source` optionally records where the cards are stored; see `source_of`.
+        `names` optionally counts the pile's card names without building it,
+        returning None if it cannot.
+        """
+        self._entries[name] = _PendingPile(count, loader, source, names)
+    
+    def is_loaded(self, name: str) -> bool:
+        return not isinstance(self._entries[name], _PendingPile)
+    
+    def source_of(self, name: str):
+        """The `source` an unloaded pile was registered with, or None once it is loaded."""
+        entry = self._entries[name]
+        return entry.source if isinstance(entry, _PendingPile) else None
+    
+    def size_of(self, name: str) -> int:
+        """Number of cards in a pile, without loading it."""
+        entry = self._entries[name]
+        return entry.count if isinstance(entry, _PendingPile) else len(entry)
+    
+    def name_counts(self, name: str) -> Dict[str, int]:
+        """Copies of each card name in a pile, without loading it if its storage can tell."""
+        entry = self._entries[name]
+        if isinstance(entry, _PendingPile) and entry.names is not None:
+            counts = entry.names()
+            if counts is not None:
+                return counts
+        return Counter(card.name for card in self[name])
+    
+    def _release(self, name: str):
+        """Drop this map's reference to a shared pile."""
+        key = id(self._entries.get(name))
+        count = self._refs.get(key)
+        if count is not None:
+            if count > 2:
+                self._refs[key] = count - 1
+            else:
+                del self._refs[key]
+    
+    def release(self):
+        """Drop the references of a map that is being discarded."""
+        for name in self._entries:
+            self._release(name)
+    
+    def fork(self) -> 'PileMap':
+        """Copy-on-write branch of this map, in O(number of piles)."""
+        branch = PileMap()
+        branch._entries = dict(self._entries)
+        branch._refs = refs = self._refs
+        for entry in self._entries.values():
+            if not isinstance(entry, _PendingPile):
+                refs[id(entry)] = refs.get(id(entry), 1) + 1
+        return branch
+    
+    def writable(self, name: str) -> Pile:
+        """Return a pile that is safe to mutate, copying it first if it is shared."""
+        pile = self[name]
+        if id(pile) in self._refs:
+            self._release(name)
+            pile = self._entries[name] = pile.copy()
+        return pile
+    
+    def shared_piles(self) -> int:
+        """Number of piles still shared with another branch."""
+        refs = self._refs
+        return sum(1 for entry in self._entries.values() if id(entry) in refs)
+
+
+class BinarySession:
+    """Binary session file, opened with mmap and decoded one pile at a time.
+    
+    Layout (little-endian):
+      header     magic, version, string/tagset/pile counts, section offsets
+      strings    u64 offsets[n + 1], then the UTF-8 bytes of every string
+      tagsets    u32 offsets[n + 1], then u32 string ids of each tag list
+      piles      per pile: u32 name id, u64 card count, u64 records offset
+      records    per card: u32 name id, u32 effect id, u32 tagset id
+    
+    Names, effects and tags are dictionary-encoded in the string table and
+    distinct tag lists in the tagset table, so card records are fixed-width.
+    """
+    
+    MAGIC = b"UPSESS\x00\x01"
+    VERSION = 1
+    SUFFIX = ".ups"
+    _HEADER = struct.Struct("<8sIIIIQQQ")
+    _PILE = struct.Struct("<IQQ")
+    _RECORD_WORDS = 3
+    
+    def __init__(self, filename: str):
+        self.filename = filename
+        with open(filename, 'rb') as f:
+            try:
+                self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:  # empty file
+                raise SessionFormatError(f"'{filename}' is not a supported binary session file.") from None
+        if len(self._mmap) < self._HEADER.size:
+            self._mmap.close()
+            raise SessionFormatError(f"'{filename}' is truncated or not a binary session file.")
+        (magic, version, n_strings, n_tagsets, n_piles,
+         self._strings_offset, self._tagsets_offset, piles_offset) = self._HEADER.unpack_from(self._mmap, 0)
+        if magic != self.MAGIC or version != self.VERSION:
+            self._mmap.close()
+            raise SessionFormatError(f"'{filename}' is not a supported binary session file.")
+        try:
+            self._read_tables(n_strings, n_tagsets, n_piles, piles_offset)
+        except (struct.error, IndexError, OverflowError, UnicodeDecodeError) as e:
+            self._mmap.close()
+            raise SessionFormatError(f"'{filename}' is truncated or corrupt ({e}).") from None
+    
+    def _read_tables(self, n_strings: int, n_tagsets: int, n_piles: int, piles_offset: int):
+        """Read the string, tagset and pile tables that follow the header."""
+        self._string_offsets = self._words(self._strings_offset, n_strings + 1, 'Q')
+        self._string_data = self._strings_offset + 8 * (n_strings + 1)
+        self._strings: List[Optional[str]] = [None] * n_strings
+        self._tagset_offsets = self._words(self._tagsets_offset, n_tagsets + 1, 'I')
+        self._tagset_data = self._tagsets_offset + 4 * (n_tagsets + 1)
+        self._tagsets: List[Optional[Tuple[Tuple[str, ...], int]]] = [None] * n_tagsets
+        self.piles: Dict[str, Tuple[int, int]] = {}
+        for i in range(n_piles):
+            name_id, count, offset = self._PILE.unpack_from(self._mmap, piles_offset + i * self._PILE.size)
+            self.piles[self._string(name_id)] = (count, offset)
+    
+    @classmethod
+    def is_binary(cls, filename: str) -> bool:
+        """Check whether a file starts with the binary session magic."""
+        with open(filename, 'rb') as f:
+            return f.read(len(cls.MAGIC)) == cls.MAGIC
+    
+    def _words(self, offset: int, count: int, typecode: str) -> array:
+        words = array(typecode)
+        end = offset + count * words.itemsize
+        if end > len(self._mmap):
+            raise SessionFormatError(f"'{self.filename}' is truncated or corrupt.")
+        words.frombytes(self._mmap[offset:end])
+        if sys.byteorder == "big":
+            words.byteswap()
+        return words
+    
+    def _string(self, string_id: int) -> str:
+        string = self._strings[string_id]
+        if string is None:
+            start = self._string_data + self._string_offsets[string_id]
+            end = self._string_data + self._string_offsets[string_id + 1]
+            string = self._strings[string_id] = self._mmap[start:end].decode("utf-8")
+        return string
+    
+    def _tagset(self, tagset_id: int) -> Tuple[Tuple[str, ...], int]:
+        """Tags of a tagset, interned in TAGS, together with their mask."""
+        encoded = self._tagsets[tagset_id]
+        if encoded is None:
+            start, end = self._tagset_offsets[tagset_id], self._tagset_offsets[tagset_id + 1]
+            ids = self._words(self._tagset_data + 4 * start, end - start, 'I')
+            encoded = self._tagsets[tagset_id] = TAGS.encode(self._string(i) for i in ids)
+        return encoded
+    
+    def read_cards(self, pile_name: str) -> List[Card]:
+        """Decode the cards of one pile."""
+        count, offset = self.piles[pile_name]
+        words = self._words(offset, count * self._RECORD_WORDS, 'I')
+        strings, string = self._strings, self._string
+        tagsets, tagset = self._tagsets, self._tagset
+        make = Card.from_encoded
+        cards = []
+        try:
+            for name_id, effect_id, tagset_id in zip(words[0::3], words[1::3], words[2::3]):
+                encoded = tagsets[tagset_id] or tagset(tagset_id)
+                cards.append(make(strings[name_id] or string(name_id),
+                                  strings[effect_id] or string(effect_id), *encoded))
+        except (IndexError, UnicodeDecodeError) as e:
+            raise SessionFormatError(f"Pile '{pile_name}' in '{self.filename}' is corrupt ({e}).") from None
+        return cards
+    
+    def name_counts(self, pile_name: str) -> Dict[str, int]:
+        """Copies of each card name in one pile, decoding only the names."""
+        count, offset = self.piles[pile_name]
+        words = self._words(offset, count * self._RECORD_WORDS, 'I')
+        try:
+            return {self._string(name_id): copies for name_id, copies in Counter(words[0::3]).items()}
+        except (IndexError, UnicodeDecodeError) as e:
+            raise SessionFormatError(f"Pile '{pile_name}' in '{self.filename}' is corrupt ({e}).") from None
+    
+    def close(self):
+        self._mmap.close()
+    
+    @classmethod
+    def write(cls, filename: str, piles: Mapping[str, Iterable[Card]]):
+        """Write piles to a binary session file, atomically."""
+        strings: Dict[str, int] = {}
+        tagsets: Dict[Tuple[str, ...], int] = {}
+        
+        def string_id(value: str) -> int:
+            sid = strings.get(value)
+            if sid is None:
+                sid = strings[value] = len(strings)
+            return sid
+        
+        pile_entries = []
+        records = array('I')
+        for name, cards in piles.items():
+            start = len(records)
+            for card in cards:
+                tagset_id = tagsets.get(card.tags)
+                if tagset_id is None:
+                    tagset_id = tagsets[card.tags] = len(tagsets)
+                records.extend((string_id(card.name), string_id(card.effect), tagset_id))
+            pile_entries.append((string_id(name), (len(records) - start) // cls._RECORD_WORDS, start))
+        
+        tagset_offsets = array('I', [0])
+        tagset_words = array('I')
+        for tags in tagsets:
+            tagset_words.extend(string_id(tag) for tag in tags)
+            tagset_offsets.append(len(tagset_words))
+        encoded = [value.encode("utf-8") for value in strings]
+        string_offsets = array('Q', [0])
+        for value in encoded:
+            string_offsets.append(string_offsets[-1] + len(value))
+        
+        strings_offset = cls._HEADER.size
+        tagsets_offset = strings_offset + 8 * len(string_offsets) + string_offsets[-1]
+        piles_offset = tagsets_offset + 4 * (len(tagset_offsets) + len(tagset_words))
+        records_offset = piles_offset + cls._PILE.size * len(pile_entries)
+        if sys.byteorder == "big":
+            for words in (records, tagset_offsets, tagset_words, string_offsets):
+                words.byteswap()
+        
+        with _atomic_open(filename, 'wb') as f:
+            f.write(cls._HEADER.pack(cls.MAGIC, cls.VERSION, len(strings), len(tagsets),
+                                     len(pile_entries), strings_offset, tagsets_offset, piles_offset))
+            f.write(string_offsets.tobytes())
+            f.write(b"".join(encoded))
+            f.write(tagset_offsets.tobytes())
+            f.write(tagset_words.tobytes())
+            for name_id, count, start in pile_entries:
+                f.write(cls._PILE.pack(name_id, count, records_offset + 4 * start))
+            f.write(records.tobytes())
+
+
+class SessionDirectory:
+    """Sharded session: a directory holding a manifest and one file per pile.
+    
+    manifest.json lists the piles in order with their card counts, file
+    names and SHA-256 checksums, so a session can be opened and its piles
+    listed without reading any cards. Each pile file holds its cards as
+    JSON Lines and is named after its checksum: a save only writes files
+    for content the directory does not have yet, then replaces the manifest
+    atomically, so an interrupted save leaves the previous session intact.
+    Next to each pile file a small .names.json file counts the copies of
+    each card name, so card locations can be found without reading cards.
+    """
+    
+    SUFFIX = ".session"
+    MANIFEST = "manifest.json"
+    FORMAT = "prototyper-session"
+    VERSION = 1
+    PILE_DIR = "piles"
+    PILE_FILE = re.compile(r"[0-9a-f]{32}\.(?:jsonl|names\.json)")
+    
+    def __init__(self, path: str):
+        self.path = path
+        with open(os.path.join(path, self.MANIFEST), 'r') as f:
+            manifest = json.load(f)
+        if manifest.get("format") != self.FORMAT or manifest.get("version") != self.VERSION:
+            raise SessionFormatError(f"'{path}' is not a supported session directory.")
+        self.piles: Dict[str, Dict] = {entry["name"]: entry for entry in manifest["piles"]}
+    
+    @classmethod
+    def is_directory(cls, filename: str) -> bool:
+        """Whether a path names a session directory: one ending in .session, or one with a manifest.
+        
+        Other existing directories are not session directories, so saving
+        to one never writes or deletes files inside it.
+        """
+        return (filename.rstrip("/" + os.sep).endswith(cls.SUFFIX)
+                or os.path.isfile(os.path.join(filename, cls.MANIFEST)))
+    
+    def read_cards(self, pile_name: str) -> List[Card]:
+        """Read the cards of one pile, checking them against the manifest."""
+        entry = self.piles[pile_name]
+        with open(os.path.join(self.path, entry["file"]), 'rb') as f:
+            data = f.read()
+        if hashlib.sha256(data).hexdigest() != entry["sha256"]:
+            raise SessionFormatError(f"Pile '{pile_name}' in '{self.path}' does not match its checksum.")
+        return [Card.from_dict(json.loads(line)) for line in data.splitlines()]
+    
+    def name_counts(self, pile_name: str) -> Optional[Dict[str, int]]:
+        """Copies of each card name in one pile, or None if the directory has no such count."""
+        entry = self.piles[pile_name]
+        if "names" not in entry:
+            return None
+        try:
+            with open(os.path.join(self.path, entry["names"]), 'r') as f:
+                counts = json.load(f)
+        except (OSError, ValueError):
+            return None
+        return counts if sum(counts.values()) == entry["count"] else None
+    
+    @classmethod
+    def write(cls, path: str, piles: Mapping[str, Iterable[Card]],
+              unchanged: Optional[Mapping[str, Dict]] = None,
+              keep: Iterable[str] = ()) -> Tuple[int, Dict[str, Dict]]:
+        """Save piles to a session directory, creating it if needed.
+        
+        Piles named in `unchanged` reuse those manifest entries, which must
+        describe files already in this directory, and are not read at all.
+        Afterwards pile files that neither the new manifest nor `keep`
+        names are removed, but only if the directory already held a
+        manifest and only files named like pile files, so nothing else in
+        the directory is touched. Returns the number of pile files written and the new
+        manifest entries by pile name.
+        """
+        unchanged = unchanged or {}
+        was_session = os.path.isfile(os.path.join(path, cls.MANIFEST))
+        os.makedirs(os.path.join(path, cls.PILE_DIR), exist_ok=True)
+        entries: Dict[str, Dict] = {}
+        written = 0
+        for name in piles:
+            entry = unchanged.get(name)
+            if entry is None:
+                names: Counter = Counter()
+                lines = []
+                for card in piles[name]:
+                    lines.append(json.dumps(card.to_dict()) + "\n")
+                    names[card.name] += 1
+                data = "".join(lines).encode("utf-8")
+                digest = hashlib.sha256(data).hexdigest()
+                entry = {"name": name, "count": len(lines),
+                         "file": f"{cls.PILE_DIR}/{digest[:32]}.jsonl", "sha256": digest,
+                         "names": f"{cls.PILE_DIR}/{digest[:32]}.names.json"}
+                target = os.path.join(path, entry["file"])
+                if not os.path.exists(target):
+                    with _atomic_open(target, 'wb') as f:
+                        f.write(data)
+                    written += 1
+                if not os.path.exists(os.path.join(path, entry["names"])):
+                    _write_json_atomic(os.path.join(path, entry["names"]), names)
+            entries[name] = entry
+        _write_json_atomic(os.path.join(path, cls.MANIFEST),
+                           {"format": cls.FORMAT, "version": cls.VERSION, "piles": list(entries.values())},
+                           indent=2)
+        if not was_session:
+            return written, entries
+        
+        referenced = {entry["file"] for entry in entries.values()}
+        referenced.update(entry["names"] for entry in entries.values() if "names" in entry)
+        referenced.update(keep)
+        for filename in os.listdir(os.path.join(path, cls.PILE_DIR)):
+            relative = f"{cls.PILE_DIR}/{filename}"
+            if cls.PILE_FILE.fullmatch(filename) and relative not in referenced:
+                os.remove(os.path.join(path, relative))
+        return written, entries
+
+
+@contextmanager
+def _atomic_open(filename: str, mode: str = 'w'):
+    """Open a temporary file that is renamed over `filename` on success.
+    
+    Readers see either the old file or the complete new one, never a
+    partially written file.
+    """
+    directory = os.path.dirname(os.path.abspath(filename))
+    while True:
+        tmp_name = os.path.join(directory, f".tmp-{os.urandom(8).hex()}")
+        try:
+            # Unlike mkstemp's private 0o600, 0o666 lets the kernel apply the
+            # umask, without reading it through the process-wide os.umask
+            fd = os.open(tmp_name, os.O_WRONLY | os.O_CREAT | os.O_EXCL | getattr(os, "O_BINARY", 0), 0o666)
+            break
+        except FileExistsError:
+            continue
+    try:
+        with os.fdopen(fd, mode) as f:
+            yield f
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_name, filename)
+    except BaseException:
+        if os.path.exists(tmp_name):
+            os.remove(tmp_name)
+        raise
+
+
+def _write_json_atomic(filename: str, data, indent: Optional[int] = None):
+    """Write JSON to `filename` atomically."""
+    with _atomic_open(filename) as f:
+        json.dump(data, f, indent=indent)
+
+
+class SessionJournal:
+    """Append-only event log for a session, with periodic snapshots.
+    
+    Every mutation is appended to `<base>.journal` as one JSON line, so
+    persisting a change costs O(change) instead of rewriting the session.
+    Every `snapshot_every` events the full state is written atomically to
+    `<base>.snapshot.json` and the journal is truncated. A session is
+    restored from the snapshot plus a replay of the events after it; a
+    torn final line from an interrupted write is ignored, and any other
+    damaged line raises SessionFormatError.
+    """
+    
+    SNAPSHOT_EVERY = 10_000
+    
+    def __init__(self, base: str, snapshot_every: int = SNAPSHOT_EVERY):
+        self.base = base
+        self.snapshot_every = snapshot_every
+        self.seq = 0
+        self._since_snapshot = 0
+        self._file = None
+    
+    @property
+    def journal_path(self) -> str:
+        return self.base + ".journal"
+    
+    @property
+    def snapshot_path(self) -> str:
+        return self.base + ".snapshot.json"
+    
+    def snapshot(self, piles: Dict[str, Pile]):
+        """Write the full state and start a fresh journal after it."""
+        if self._file is not None:
+            self._file.close()
+        data = {
+            "seq": self.seq,
+            "piles": {name: pile.to_dict() for name, pile in piles.items()},
+        }
+        _write_json_atomic(self.snapshot_path, data)
+        # Events up to `seq` are now in the snapshot; any left behind by a
+        # crash before this truncation are skipped on replay.
+        self._file = open(self.journal_path, 'w')
+        self._since_snapshot = 0
+    
+    def record(self, event: Dict, piles: Dict[str, Pile]):
+        """Append one event, taking a snapshot when one is due."""
+        self.seq += 1
+        event = dict(event, seq=self.seq)
+        self._file.write(json.dumps(event, separators=(",", ":")) + "\n")
+        self._file.flush()
+        self._since_snapshot += 1
+        if self._since_snapshot >= self.snapshot_every:
+            self.snapshot(piles)
+    
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+    
+    @classmethod
+    def read(cls, base: str) -> Tuple[Dict, List[Dict]]:
+        """Return the snapshot data and the events recorded after it."""
+        journal = cls(base)
+        snapshot = {"seq": 0, "piles": {}}
+        if os.path.exists(journal.snapshot_path):
+            with open(journal.snapshot_path, 'r') as f:
+                snapshot = json.load(f)
+        events = []
+        if os.path.exists(journal.journal_path):
+            path = journal.journal_path
+            with open(path, 'r') as f:
+                torn = None
+                for number, line in enumerate(f, 1):
+                    if torn is not None:
+                        # Only the final line can be torn by an interrupted write
+                        if line.strip():
+                            raise SessionFormatError(f"Malformed event on line {torn} of '{path}'.")
+                        continue
+                    try:
+                        event = json.loads(line)
+                    except json.JSONDecodeError:
+                        torn = number
+                        continue
+                    seq = event.get("seq") if isinstance(event, dict) else None
+                    if not isinstance(seq, int):
+                        raise SessionFormatError(f"Event on line {number} of '{path}' has no sequence number.")
+                    if seq > snapshot.get("seq", 0):
+                        events.append(event)
+        return snapshot, events
+
+
+class UndoHistory:
+    """Bounded undo and redo stacks of applied operations.
+    
+    Each entry records what is needed to reverse an operation exactly: the
+    slots its cards were taken from and the slot in the destination where
+    they were added. Entries are weighed by the number of slots they hold,
+    and once the total passes `limit` the oldest entries are forgotten.
+    """
+    
+    LIMIT = 1_000_000
+    
+    def __init__(self, limit: int = LIMIT):
+        self.limit = limit
+        self.undo_stack: Deque[Dict] = deque()
+        self.redo_stack: List[Dict] = []
+        self.weight = 0
+    
+    @staticmethod
+    def _weight(entry: Dict) -> int:
+        return len(entry.get("slots", ())) or 1
+    
+    def _push(self, entry: Dict):
+        self.undo_stack.append(entry)
+        self.weight += self._weight(entry)
+        while self.weight > self.limit and self.undo_stack:
+            self.weight -= self._weight(self.undo_stack.popleft())
+    
+    def record(self, entry: Dict):
+        """Add a newly applied operation, dropping anything that could be redone."""
+        self.redo_stack.clear()
+        self._push(entry)
+    
+    def next_undo(self) -> Optional[Dict]:
+        """Latest operation to undo; it stays on the undo stack until `undone`."""
+        return self.undo_stack[-1] if self.undo_stack else None
+    
+    def next_redo(self) -> Optional[Dict]:
+        """Latest undone operation; it stays on the redo stack until `redone`."""
+        return self.redo_stack[-1] if self.redo_stack else None
+    
+    def undone(self):
+        """Move the latest operation to the redo stack once it has been undone."""
+        entry = self.undo_stack.pop()
+        self.weight -= self._weight(entry)
+        self.redo_stack.append(entry)
+    
+    def redone(self):
+        """Move the latest undone operation back once it has been redone."""
+        self._push(self.redo_stack.pop())
+    
+    def clear(self):
+        self.undo_stack.clear()
+        self.redo_stack.clear()
+        self.weight = 0
+
+
+class Session:
+    """Headless prototyping engine: a set of named piles and the operations on them.
+    
+    Methods return structured results and raise PrototyperError subclasses
+    (or OSError / json.JSONDecodeError for file problems) instead of
+    printing, so the engine can be embedded without capturing stdout. The
+    interactive Prototyper is a presentation layer on top of it.
+    """
+    
+    BACKENDS = ("list", "columnar")
+    JSON_LINES_SUFFIXES = (".jsonl", ".ndjson")
+    PROGRESS_EVERY = 4096
+    DEFAULT_BRANCH = "main"
+    ANY_PILE = "*"
+    
+    def __init__(self, backend: str = "list", undo_limit: int = UndoHistory.LIMIT,
+                 seed: Optional[int] = None):
+        if backend not in self.BACKENDS:
+            raise InvalidArgumentError(f"Unknown pile backend '{backend}'.")
+        if backend == "columnar" and np is None:
+            backend = "list"
+        self.backend = backend
+        self.catalog = CardCatalog() if backend == "columnar" else None
+        self.piles = PileMap()
+        self.journal: Optional[SessionJournal] = None
+        self.branch = self.DEFAULT_BRANCH
+        self._branches: Dict[str, PileMap] = {}
+        self.history = UndoHistory(undo_limit)
+        self._branch_history: Dict[str, UndoHistory] = {}
+        # Card name -> {pile name: copies}; built on first use, None until then
+        self._locations: Optional[Dict[str, Dict[str, int]]] = None
+        # File or directory the session was last loaded from or saved to
+        self.saved_to: Optional[str] = None
+        # id(pile) -> (pile, its version, session directory, manifest entry)
+        # for loaded piles whose contents that directory already holds
+        self._stored: Dict[int, Tuple[Pile, int, str, Dict]] = {}
+        self.reseed(seed)
+    
+    def reseed(self, seed: Optional[int] = None) -> int:
+        """Restart the session's random number generator, returning its seed.
+        
+        Shuffles and random cuts draw from this generator, so replaying the
+        same commands after the same seed gives the same piles.
+        """
+        self.seed = random.randrange(1 << 32) if seed is None else seed
+        self.rng = random.Random(self.seed)
+        return self.seed
+    
+    def _new_pile(self, pile_name: str) -> Pile:
+        """Create an empty pile using the session's backend."""
+        if self.backend == "columnar":
+            return ColumnarPile(pile_name, self.catalog)
+        return Pile(pile_name)
+    
+    def _record(self, event: Dict):
+        """Append a mutation to the session journal, if one is active."""
+        if self.journal is not None:
+            self.journal.record(event, self.piles)
+    
+    def _apply_event(self, event: Dict):
+        """Replay one journaled mutation onto the piles."""
+        op = event["op"]
+        if op == "create":
+            self.piles[event["pile"]] = self._new_pile(event["pile"])
+        elif op == "add":
+            self.piles.writable(event["pile"]).add_cards(Card.from_dict(c) for c in event["cards"])
+        elif op == "move":
+            source = self.piles.writable(event["from"])
+            card = source.find_card_by_name(event["name"])
+            source.remove_card(card)
+            self.piles.writable(event["to"]).add_card(card)
+        elif op == "movetag":
+            cards = self.piles.writable(event["from"]).take_cards_by_tag(event["tag"])
+            self.piles.writable(event["to"]).add_cards(cards)
+        elif op == "movequery":
+            cards = self.piles.writable(event["from"]).take_cards_matching(TagQuery(event["query"]))
+            self.piles.writable(event["to"]).add_cards(cards)
+        elif op == "take":
+            source = self.piles.writable(event["from"])
+            cards = source.take_slots(source.slots_at(event["positions"]))
+            self.piles.writable(event["to"]).add_cards(cards)
+        elif op == "restore":
+            dest = self.piles.writable(event["to"])
+            count = len(event["positions"])
+            cards = dest.take_slots(dest.slots_at(range(len(dest) - count, len(dest))))
+            self.piles.writable(event["from"]).insert_at(event["positions"], cards)
+        elif op == "takebottom":
+            pile = self.piles.writable(event["pile"])
+            pile.take_slots(pile.slots_at(range(len(pile) - event["count"], len(pile))))
+        elif op == "drop":
+            del self.piles[event["pile"]]
+        elif op == "draw":
+            cards = self.piles.writable(event["from"]).draw(event["count"])
+            self.piles.writable(event["to"]).add_cards(cards)
+        elif op == "shuffle":
+            self.piles.writable(event["pile"]).shuffle(random.Random(event["seed"]))
+        elif op == "unshuffle":
+            self.piles.writable(event["pile"]).unshuffle(random.Random(event["seed"]))
+        else:
+            raise SessionFormatError(f"Unknown journal event '{op}'.")
+    
+    def _reset_piles(self):
+        """Drop the current piles ahead of loading a saved session."""
+        if self.backend == "columnar":
+            self.catalog = CardCatalog()
+        self.piles.release()
+        self.piles = PileMap()
+        self.history.clear()
+        self._locations = None
+        self._stored.clear()
+    
+    def _restore_piles(self, data: Dict):
+        """Replace all piles with those in a saved session dictionary."""
+        self._reset_piles()
+        for pile_name, pile_data in data.get("piles", {}).items():
+            pile = self._new_pile(pile_data.get("name", pile_name))
+            pile.add_cards(Card.from_dict(card_data) for card_data in pile_data.get("cards", []))
+            self.piles[pile_name] = pile
+    
+    def pile(self, pile_name: str, role: str = "Pile") -> Pile:
+        """Return a pile by name, raising PileNotFoundError if it is missing."""
+        if pile_name not in self.piles:
+            raise PileNotFoundError(pile_name, role)
+        return self.piles[pile_name]
+    
+    def _location_index(self) -> Dict[str, Dict[str, int]]:
+        """Card name -> {pile name: copies}, built on first use and kept up to date after."""
+        if self._locations is None:
+            index: Dict[str, Dict[str, int]] = {}
+            for pile_name in self.piles:
+                # Stored piles report their name counts without being loaded
+                for name, copies in self.piles.name_counts(pile_name).items():
+                    index.setdefault(name, {})[pile_name] = copies
+            self._locations = index
+        return self._locations
+    
+    def _relocate(self, cards: Iterable[Card], from_pile: Optional[str], to_pile: Optional[str]):
+        """Record in the location index that cards left one pile and/or joined another."""
+        index = self._locations
+        if index is None:
+            return
+        for name, copies in Counter(card.name for card in cards).items():
+            if from_pile is not None:
+                piles = index[name]
+                remaining = piles[from_pile] - copies
+                if remaining:
+                    piles[from_pile] = remaining
+                else:
+                    del piles[from_pile]
+                    if not piles:
+                        del index[name]
+            if to_pile is not None:
+                piles = index.setdefault(name, {})
+                piles[to_pile] = piles.get(to_pile, 0) + copies
+    
+    def where(self, card_name: str) -> Dict[str, int]:
+        """Piles holding a card, by exact name, with the number of copies in each.
+        
+        Answered from a session-wide index in O(1) once the index is built.
+        Building it counts the names in every pile once; piles still stored
+        in a session directory or binary file are counted without loading.
+        """
+        return dict(self._location_index().get(card_name, {}))
+    
+    def locate(self, card_name: str, exclude: Optional[str] = None) -> str:
+        """The one pile, other than `exclude`, that holds a card."""
+        piles = [pile_name for pile_name in self.where(card_name) if pile_name != exclude]
+        if not piles:
+            raise CardNotFoundError(card_name, None)
+        if len(piles) > 1:
+            raise InvalidArgumentError(f"Card '{card_name}' is in several piles: {', '.join(piles)}.")
+        return piles[0]
+    
+    def pile_sizes(self) -> Dict[str, int]:
+        """Card count of every pile, without loading lazily stored piles."""
+        return {pile_name: self.piles.size_of(pile_name) for pile_name in self.piles}
+    
+    def create_pile(self, pile_name: str) -> Pile:
+        """Create a new, empty pile."""
+        if pile_name in self.piles:
+            raise PileExistsError(pile_name)
+        
+        pile = self.piles[pile_name] = self._new_pile(pile_name)
+        self.history.record({"op": "create", "pile": pile_name})
+        self._record({"op": "create", "pile": pile_name})
+        return pile
+    
+    def load_cards(self, pile_name: str, filename: str,
+                   progress: Optional[Callable[[int, float], None]] = None) -> int:
+        """Load cards from a JSON or JSON Lines file into a pile.
+        
+        The file is streamed, and cards are built as they are decoded. If
+        given, `progress` is called periodically with the number of cards
+        read so far and the fraction of the file consumed. The pile is only
+        changed once the whole file has parsed cleanly. Returns the number
+        of cards loaded.
+        """
+        self.pile(pile_name)
+        json_lines = filename.lower().endswith(self.JSON_LINES_SUFFIXES)
+        total = os.path.getsize(filename) or 1
+        with open(filename, 'r') as f:
+            stream = CardStream(f, json_lines=json_lines)
+            cards = []
+            for card_data in stream:
+                cards.append(Card.from_dict(card_data))
+                if progress is not None and len(cards) % self.PROGRESS_EVERY == 0:
+                    progress(len(cards), min(1.0, stream.chars_read / total))
+        
+        pile = self.piles.writable(pile_name)
+        start = pile.next_slot
+        count = pile.add_cards(cards)
+        self._relocate(cards, None, pile_name)
+        self.history.record({"op": "add", "pile": pile_name, "start": start, "count": count})
+        if self.journal is not None:
+            self._record({"op": "add", "pile": pile_name, "cards": [card.to_dict() for card in cards]})
+        return count
+    
+    def move_card(self, from_pile: str, to_pile: str, card_name: str) -> Card:
+        """Move a single card, by name, from one pile to another.
+        
+        A source of "*" means whichever other pile holds the card.
+        """
+        if from_pile == self.ANY_PILE and from_pile not in self.piles:
+            from_pile = self.locate(card_name, to_pile)
+        source = self.pile(from_pile, "Source pile")
+        self.pile(to_pile, "Destination pile")
+        
+        slot = source.slot_of(card_name)
+        if slot is None:
+            raise CardNotFoundError(card_name, from_pile)
+        
+        cards = self._move_slots(from_pile, to_pile, [slot])
+        self._record({"op": "move", "from": from_pile, "to": to_pile, "name": card_name})
+        return cards[0]
+    
+    def _move_slots(self, from_pile: str, to_pile: str, slots: Sequence[int]) -> Sequence[Card]:
+        """Move the cards in some slots of one pile to the bottom of another."""
+        cards = self.piles.writable(from_pile).take_slots(slots)
+        dest = self.piles.writable(to_pile)
+        start = dest.next_slot
+        dest.add_cards(cards)
+        self._relocate(cards, from_pile, to_pile)
+        self.history.record({"op": "move", "from": from_pile, "to": to_pile, "slots": slots, "start": start})
+        return cards
+    
+    def move_tag(self, from_pile: str, to_pile: str, tag: str) -> Sequence[Card]:
+        """Move every card with a tag from one pile to another, keeping order.
+        
+        Returns the moved cards, which may be empty.
+        """
+        source = self.pile(from_pile, "Source pile")
+        self.pile(to_pile, "Destination pile")
+        
+        # Driven by the tag index rather than a scan of the pile
+        slots = source.slots_by_tag(tag)
+        if not len(slots):
+            return []
+        cards = self._move_slots(from_pile, to_pile, slots)
+        self._record({"op": "movetag", "from": from_pile, "to": to_pile, "tag": tag})
+        return cards
+    
+    def move_query(self, from_pile: str, to_pile: str, expression: str) -> Sequence[Card]:
+        """Move every card matching a tag query from one pile to another.
+        
+        Returns the moved cards, which may be empty.
+        """
+        source = self.pile(from_pile, "Source pile")
+        self.pile(to_pile, "Destination pile")
+        query = TagQuery(expression)
+        
+        slots = source.slots_matching(query)
+        if not len(slots):
+            return []
+        cards = self._move_slots(from_pile, to_pile, slots)
+        self._record({"op": "movequery", "from": from_pile, "to": to_pile, "query": expression})
+        return cards
+    
+    def draw(self, from_pile: str, to_pile: str, count: int = 1) -> Sequence[Card]:
+        """Move up to `count` cards from the top of one pile to the bottom of another.
+        
+        The two piles may be the same, which puts the top cards on the
+        bottom. Costs O(count). Returns the moved cards, which may be empty.
+        """
+        source = self.pile(from_pile, "Source pile")
+        self.pile(to_pile, "Destination pile")
+        if count < 0:
+            raise InvalidArgumentError("Count cannot be negative.")
+        
+        slots = source.top_slots(count)
+        if not len(slots):
+            return []
+        cards = self._move_slots(from_pile, to_pile, slots)
+        self._record({"op": "draw", "from": from_pile, "to": to_pile, "count": len(cards)})
+        return cards
+    
+    def cut(self, pile_name: str, position: Optional[int] = None) -> int:
+        """Move the top `position` cards of a pile underneath the rest.
+        
+        Without a position the pile is cut at a random point from the
+        session's generator, never leaving it unchanged when it has two or
+        more cards. Returns the position used.
+        """
+        pile = self.pile(pile_name)
+        if position is None:
+            position = self.rng.randint(1, len(pile) - 1) if len(pile) > 1 else 0
+        elif not 0 <= position <= len(pile):
+            raise InvalidArgumentError(f"Cut position must be between 0 and {len(pile)}.")
+        self.draw(pile_name, pile_name, position)
+        return position
+    
+    def shuffle(self, pile_name: str, seed: Optional[int] = None) -> int:
+        """Shuffle a pile in place and return the seed that was used.
+        
+        Without a seed one is taken from the session's generator. Only the
+        seed is kept in the undo history and the journal: undoing replays
+        the same permutation and inverts it.
+        """
+        self.pile(pile_name)
+        if seed is None:
+            seed = self.rng.getrandbits(32)
+        self.piles.writable(pile_name).shuffle(random.Random(seed))
+        self.history.record({"op": "shuffle", "pile": pile_name, "seed": seed})
+        self._record({"op": "shuffle", "pile": pile_name, "seed": seed})
+        return seed
+    
+    def count_cards(self, pile_name: str, expression: Optional[str] = None) -> int:
+        """Count the cards in a pile, optionally only those matching a tag query."""
+        pile = self.pile(pile_name)
+        if expression is None:
+            return len(pile)
+        return pile.count(TagQuery(expression))
+    
+    def pile_stats(self, pile_name: Optional[str] = None) -> Dict[str, Dict]:
+        """Tag counts and numeric stat sums for one pile, or every pile.
+        
+        Returns {pile name: {"cards": n, "tags": {tag: count},
+        "stats": {stat: (cards with it, total)}}}. Piles keep these
+        aggregates up to date as cards move, so this costs O(piles x tags)
+        rather than a scan of every card.
+        """
+        names = [pile_name] if pile_name is not None else list(self.piles)
+        result = {}
+        for name in names:
+            pile = self.pile(name)
+            result[name] = {"cards": len(pile), "tags": pile.tag_counts(), "stats": pile.stat_sums()}
+        return result
+    
+    def simulate(self, pile_name: str, draws: int, trials: int, conditions: str,
+                 seed: Optional[int] = None, workers: Optional[int] = None) -> SimulationResult:
+        """Estimate by Monte Carlo how often a draw from a pile meets the conditions."""
+        simulator = DrawSimulator(self.pile(pile_name), DrawCondition.parse_all(conditions))
+        return simulator.run(draws, trials, seed=seed, workers=workers)
+    
+    def probability(self, pile_name: str, draws: int, conditions: str,
+                    workers: Optional[int] = None):
+        """Probability that a draw from a pile meets the conditions.
+        
+        Returns an exact Fraction, or a SimulationResult when the exact
+        computation would be too expensive; that simulation runs on
+        `workers` processes, one by default.
+        """
+        engine = DrawProbability(self.pile(pile_name), DrawCondition.parse_all(conditions))
+        return engine.run(draws, workers=workers)
+    
+    @staticmethod
+    def _session_to_dict(piles: Mapping[str, Iterable[Card]]) -> Dict:
+        return {
+            "piles": {
+                name: {"name": getattr(cards, "name", name), "cards": [card.to_dict() for card in cards]}
+                for name, cards in piles.items()
+            }
+        }
+    
+    def save_session(self, filename: Optional[str] = None) -> int:
+        """Save all piles to a JSON file, a binary one ending in .ups, or a session directory.
+        
+        Without a filename the session goes back where it was last loaded
+        from or saved to. Every format is written atomically. Returns the
+        number of piles written: a session directory only rewrites the
+        piles that changed since it was last saved or loaded.
+        """
+        if filename is None:
+            if self.saved_to is None:
+                raise InvalidArgumentError("The session has not been saved or loaded yet; give a filename.")
+            filename = self.saved_to
+        if SessionDirectory.is_directory(filename):
+            written = self._save_directory(filename)
+        elif os.path.isdir(filename):
+            raise InvalidArgumentError(f"'{filename}' is a directory but not a session; "
+                                       f"session directories end in '{SessionDirectory.SUFFIX}'.")
+        elif filename.endswith(BinarySession.SUFFIX):
+            BinarySession.write(filename, self.piles)
+            written = len(self.piles)
+        else:
+            _write_json_atomic(filename, self._session_to_dict(self.piles), indent=2)
+            written = len(self.piles)
+        self.saved_to = filename
+        return written
+    
+    def _save_directory(self, path: str) -> int:
+        """Save to a session directory, skipping every pile it already holds unchanged.
+        
+        Unloaded piles that came from the directory are not even read, and
+        loaded ones are compared by version rather than serialized.
+        """
+        key = os.path.realpath(path)
+        
+        def stored_here(piles: PileMap) -> Dict[str, Dict]:
+            """Manifest entries of the piles whose contents are stored in this directory."""
+            entries = {}
+            for name in piles:
+                if piles.is_loaded(name):
+                    pile = piles[name]
+                    record = self._stored.get(id(pile))
+                    if record is not None and record[0] is pile and record[1] == pile.version \
+                            and record[2] == key:
+                        entries[name] = record[3]
+                else:
+                    source = piles.source_of(name)
+                    if source is not None and source[0] == key:
+                        entries[name] = source[1]
+            return entries
+        
+        # Other branches may still load their untouched piles from these files
+        keep = {entry.get(key) for piles in self._branches.values() for name, entry in stored_here(piles).items()
+                if not piles.is_loaded(name) for key in ("file", "names")}
+        written, entries = SessionDirectory.write(path, self.piles, stored_here(self.piles), keep)
+        self._stored = {pile_id: record for pile_id, record in self._stored.items() if record[2] != key}
+        for name, entry in entries.items():
+            if self.piles.is_loaded(name):
+                pile = self.piles[name]
+                self._stored[id(pile)] = (pile, pile.version, key, entry)
+        return written
+    
+    def _load_directory(self, path: str):
+        """Open a session directory; each pile is read on first access."""
+        directory = SessionDirectory(path)
+        self._reset_piles()
+        key = os.path.realpath(path)
+        for pile_name, entry in directory.piles.items():
+            def load(pile_name=pile_name, entry=entry) -> Pile:
+                pile = self._new_pile(pile_name)
+                pile.add_cards(directory.read_cards(pile_name))
+                self._stored[id(pile)] = (pile, pile.version, key, entry)
+                return pile
+            self.piles.add_lazy(pile_name, entry["count"], load, source=(key, entry),
+                                names=lambda pile_name=pile_name: directory.name_counts(pile_name))
+    
+    def _load_binary_session(self, filename: str):
+        """Open a binary session; each pile is decoded on first access."""
+        session = BinarySession(filename)
+        self._reset_piles()
+        for pile_name, (count, _) in session.piles.items():
+            def load(pile_name=pile_name) -> Pile:
+                pile = self._new_pile(pile_name)
+                pile.add_cards(session.read_cards(pile_name))
+                return pile
+            self.piles.add_lazy(pile_name, count, load,
+                                names=lambda pile_name=pile_name: session.name_counts(pile_name))
+    
+    def load_session(self, filename: str) -> int:
+        """Replace all piles with a saved JSON or binary session, or a session directory.
+        
+        Returns the number of piles loaded.
+        """
+        if os.path.isdir(filename):
+            self._load_directory(filename)
+        elif BinarySession.is_binary(filename):
+            self._load_binary_session(filename)
+        else:
+            with open(filename, 'r') as f:
+                data = json.load(f)
+            self._restore_piles(data)
+        self.saved_to = filename
+        if self.journal is not None:
+            self.journal.snapshot(self.piles)
+        return len(self.piles)
+    
+    def restore_journal(self, filename: str) -> int:
+        """Restore a journaled session and keep journaling into it.
+        
+        The state is rebuilt from the snapshot plus a replay of the events
+        after it. Returns the number of events replayed.
+        """
+        base = filename[:-len(".journal")] if filename.endswith(".journal") else filename
+        if not os.path.exists(base + ".journal") and not os.path.exists(base + ".snapshot.json"):
+            raise FileNotFoundError(filename)
+        snapshot, events = SessionJournal.read(base)
+        self._restore_piles(snapshot)
+        for event in events:
+            self._apply_event(event)
+        self.stop_journal()
+        self.journal = SessionJournal(base)
+        self.journal.seq = events[-1]["seq"] if events else snapshot.get("seq", 0)
+        self.journal.snapshot(self.piles)
+        return len(events)
+    
+    def undo(self) -> Optional[Dict]:
+        """Reverse the latest create, load, move or shuffle, restoring card order exactly.
+        
+        Costs about as much as the operation being undone. Returns its
+        history entry, or None if there is nothing to undo.
+        """
+        entry = self.history.next_undo()
+        if entry is None:
+            return None
+        op = entry["op"]
+        if op == "create":
+            del self.piles[entry["pile"]]
+            self._record({"op": "drop", "pile": entry["pile"]})
+        elif op == "add":
+            pile = self.piles.writable(entry["pile"])
+            entry["cards"] = pile.take_slots(range(entry["start"], entry["start"] + entry["count"]))
+            self._relocate(entry["cards"], entry["pile"], None)
+            self._record({"op": "takebottom", "pile": entry["pile"], "count": entry["count"]})
+        elif op == "shuffle":
+            self.piles.writable(entry["pile"]).unshuffle(random.Random(entry["seed"]))
+            self._record({"op": "unshuffle", "pile": entry["pile"], "seed": entry["seed"]})
+        else:
+            dest = self.piles.writable(entry["to"])
+            cards = dest.take_slots(range(entry["start"], entry["start"] + len(entry["slots"])))
+            source = self.piles.writable(entry["from"])
+            source.restore_slots(entry["slots"], cards)
+            self._relocate(cards, entry["to"], entry["from"])
+            if self.journal is not None:
+                self._record({"op": "restore", "from": entry["from"], "to": entry["to"],
+                              "positions": source.positions_of(entry["slots"])})
+        self.history.undone()
+        return entry
+    
+    def redo(self) -> Optional[Dict]:
+        """Apply the latest undone operation again.
+        
+        Cards go back into the slots the operation first gave them, so the
+        slots recorded by later entries on the redo stack stay valid.
+        Returns its history entry, or None if there is nothing to redo.
+        """
+        entry = self.history.next_redo()
+        if entry is None:
+            return None
+        op = entry["op"]
+        if op == "create":
+            self.piles[entry["pile"]] = self._new_pile(entry["pile"])
+            self._record({"op": "create", "pile": entry["pile"]})
+        elif op == "add":
+            pile = self.piles.writable(entry["pile"])
+            cards = entry["cards"]
+            pile.restore_slots(range(entry["start"], entry["start"] + entry["count"]), cards)
+            del entry["cards"]
+            self._relocate(cards, None, entry["pile"])
+            if self.journal is not None:
+                self._record({"op": "add", "pile": entry["pile"], "cards": [card.to_dict() for card in cards]})
+        elif op == "shuffle":
+            self.piles.writable(entry["pile"]).shuffle(random.Random(entry["seed"]))
+            self._record({"op": "shuffle", "pile": entry["pile"], "seed": entry["seed"]})
+        else:
+            source = self.piles.writable(entry["from"])
+            positions = source.positions_of(entry["slots"]) if self.journal is not None else None
+            cards = source.take_slots(entry["slots"])
+            dest = self.piles.writable(entry["to"])
+            dest.restore_slots(range(entry["start"], entry["start"] + len(cards)), cards)
+            self._relocate(cards, entry["from"], entry["to"])
+            self._record({"op": "take", "from": entry["from"], "to": entry["to"], "positions": positions})
+        self.history.redone()
+        return entry
+    
+    def fork(self, branch_name: str) -> str:
+        """Branch the current piles under a new name and switch to the branch.
+        
+        Piles are shared copy-on-write, so forking costs O(number of piles)
+        and each branch only pays for the piles it goes on to change. The
+        new branch starts with an empty undo history. Returns the name of
+        the branch that was forked from.
+        """
+        if branch_name == self.branch or branch_name in self._branches:
+            raise BranchExistsError(branch_name)
+        parent = self.branch
+        self._branches[parent] = self.piles
+        self._branch_history[parent] = self.history
+        self.piles = self.piles.fork()
+        self.history = UndoHistory(self.history.limit)
+        self.branch = branch_name
+        return parent
+    
+    def switch(self, branch_name: str):
+        """Make another branch the current one."""
+        if branch_name == self.branch:
+            return
+        if branch_name not in self._branches:
+            raise BranchNotFoundError(branch_name)
+        self._branches[self.branch] = self.piles
+        self._branch_history[self.branch] = self.history
+        self.piles = self._branches.pop(branch_name)
+        self.history = self._branch_history.pop(branch_name)
+        self._locations = None
+        self.branch = branch_name
+        if self.journal is not None:
+            self.journal.snapshot(self.piles)
+    
+    def branches(self) -> Dict[str, PileMap]:
+        """Every branch's piles by branch name, the current branch included."""
+        branches = dict(self._branches)
+        branches[self.branch] = self.piles
+        return branches
+    
+    def start_journal(self, base: str,
+                      snapshot_every: int = SessionJournal.SNAPSHOT_EVERY) -> SessionJournal:
+        """Start recording every mutation to `<base>.journal`."""
+        self.stop_journal()
+        journal = SessionJournal(base, snapshot_every)
+        journal.snapshot(self.piles)
+        self.journal = journal
+        return journal
+    
+    def stop_journal(self) -> Optional[SessionJournal]:
+        """Stop journaling. Returns the journal that was active, if any."""
+        journal = self.journal
+        if journal is not None:
+            journal.close()
+            self.journal = None
+        return journal
+    
+    @classmethod
+    def convert_session(cls, source: str, dest: str) -> int:
+        """Convert a saved session between the JSON, binary and directory formats.
+        
+        Returns the number of piles converted.
+        """
+        if os.path.isdir(source):
+            directory = SessionDirectory(source)
+            piles = {name: directory.read_cards(name) for name in directory.piles}
+        elif BinarySession.is_binary(source):
+            session = BinarySession(source)
+            piles = {name: session.read_cards(name) for name in session.piles}
+            session.close()
+        else:
+            with open(source, 'r') as f:
+                data = json.load(f)
+            piles = {
+                name: [Card.from_dict(card_data) for card_data in pile_data.get("cards", [])]
+                for name, pile_data in data.get("piles", {}).items()
+            }
+        
+        if SessionDirectory.is_directory(dest):
+            SessionDirectory.write(dest, piles)
+        elif dest.endswith(BinarySession.SUFFIX):
+            BinarySession.write(dest, piles)
+        else:
+            _write_json_atomic(dest, cls._session_to_dict(piles), indent=2)
+        return len(piles)
+
+
+class LatencyHistogram:
+    """Rolling histogram of durations with logarithmic buckets.
+    
+    Each power of two is split into SUB_BUCKETS buckets, so percentiles are
+    within about 10% of the true value while recording stays O(1) and
+    memory stays small. Percentiles cover the last WINDOW to 2 * WINDOW
+    samples: when the current generation fills up it replaces the previous
+    one.
+    """
+    
+    SUB_BUCKETS = 8
+    WINDOW = 10000
+    
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self._current: Counter = Counter()
+        self._previous: Counter = Counter()
+        self._in_current = 0
+    
+    def _bucket(self, seconds: float) -> int:
+        micros = seconds * 1e6
+        if micros < 1:
+            return 0
+        mantissa, exponent = math.frexp(micros)
+        return exponent * self.SUB_BUCKETS + int((mantissa - 0.5) * 2 * self.SUB_BUCKETS)
+    
+    def _upper_bound(self, bucket: int) -> float:
+        """Largest duration, in seconds, that falls into a bucket."""
+        exponent, sub = divmod(bucket, self.SUB_BUCKETS)
+        return (0.5 + (sub + 1) / (2 * self.SUB_BUCKETS)) * 2.0 ** exponent / 1e6
+    
+    def record(self, seconds: float):
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+        self._current[self._bucket(seconds)] += 1
+        self._in_current += 1
+        if self._in_current >= self.WINDOW:
+            self._previous = self._current
+            self._current = Counter()
+            self._in_current = 0
+    
+    def percentile(self, fraction: float) -> float:
+        """Approximate duration below which `fraction` of recent samples fall."""
+        counts = self._current + self._previous
+        samples = sum(counts.values())
+        if not samples:
+            return 0.0
+        rank = max(1, math.ceil(fraction * samples))
+        seen = 0
+        for bucket in sorted(counts):
+            seen += counts[bucket]
+            if seen >= rank:
+                return min(self._upper_bound(bucket), self.max)
+        return self.max
+
+
+class CommandPerf:
+    """Per-command latency histograms and an optional slow-command log.
+    
+    Commands taking at least `slow_threshold` seconds are appended to
+    `slow_log` as JSON lines with the command line, its duration and the
+    sizes of the piles it named.
+    """
+    
+    def __init__(self, slow_threshold: Optional[float] = None, slow_log: Optional[str] = None):
+        self.histograms: Dict[str, LatencyHistogram] = {}
+        self.slow_threshold = slow_threshold
+        self.slow_log = slow_log
+    
+    def record(self, command: str, seconds: float, line: str = "",
+               pile_sizes: Optional[Callable[[], Dict[str, int]]] = None):
+        """Record one command's duration, logging it if it was slow.
+        
+        `pile_sizes` is only called for slow commands.
+        """
+        histogram = self.histograms.get(command)
+        if histogram is None:
+            histogram = self.histograms[command] = LatencyHistogram()
+        histogram.record(seconds)
+        
+        if self.slow_threshold is not None and self.slow_log and seconds >= self.slow_threshold:
+            entry = {
+                "time": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+                "command": line,
+                "seconds": round(seconds, 6),
+                "piles": pile_sizes() if pile_sizes is not None else {},
+            }
+            with open(self.slow_log, 'a') as f:
+                f.write(json.dumps(entry) + "\n")
+    
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        """Count, p50/p95/p99 and max seconds per command."""
+        return {
+            command: {
+                "count": histogram.count,
+                "p50": histogram.percentile(0.50),
+                "p95": histogram.percentile(0.95),
+                "p99": histogram.percentile(0.99),
+                "max": histogram.max,
+            }
+            for command, histogram in self.histograms.items()
+        }
+    
+    def reset(self):
+        self.histograms.clear()
+
+
+_TOKEN_PATTERN = re.compile(r'"((?:[^"\\]|\\.)*)"(?!\S)|\'([^\']*)\'(?!\S)|(\S+)')
+
+
+def tokenize_command(line: str) -> List[str]:
+    """Split a command line into arguments, shell style.
+    
+    Double- or single-quoted arguments may contain spaces, and \\" or \\\\
+    escape a quote or backslash inside double quotes. A quote that does
+    not start and end a whole argument is kept literally, so names such as
+    Dragon's Breath need no quoting.
+    """
+    tokens = []
+    for double, single, bare in _TOKEN_PATTERN.findall(line):
+        if bare:
+            tokens.append(bare)
+        elif double:
+            tokens.append(re.sub(r'\\(["\\])', r'\1', double))
+        else:
+            tokens.append(single)
+    return tokens
+
+
+class CommandInvocation:
+    """A command line bound to its handler and converted arguments.
+    
+    `method` is None when the line cannot run, in which case `usage` holds
+    the message to report as the command's error instead.
+    """
+    
+    __slots__ = ("command", "method", "args", "usage")
+    
+    def __init__(self, command: str, method: Optional[str], args: Tuple, usage: str = ""):
+        self.command = command
+        self.method = method
+        self.args = args
+        self.usage = usage
+    
+    def run(self, target):
+        if self.method is None:
+            target._fail(self.usage)
+        else:
+            getattr(target, self.method)(*self.args)
+
+
+class Prototyper:
+    """Main REPL for the prototyping tool.
+    
+    Commands are carried out by a Session; this class only parses input
+    and formats the results.
+    """
+    
+    BACKENDS = Session.BACKENDS
+    SLOW_LOG = "prototyper-slow.log"
+    PAGER = "less -FX"
+    PAGER_THRESHOLD = 200
+    # Draws of at most this many cards list the drawn card names
+    DRAW_LISTING = 10
+    PROGRESS_MIN_BYTES = 16 << 20
+    PROGRESS_INTERVAL = 1.0
+    
+    def __init__(self, backend: str = "list", session: Optional[Session] = None):
+        if session is None:
+            session = Session(backend)
+            if session.backend != backend:
+                print("NumPy is not installed; falling back to the list backend.")
+        self.session = session
+        self.running = True
+        self.perf = CommandPerf()
+        self.pager_threshold = self.PAGER_THRESHOLD
+        # Error message of the command being run, if it has reported one
+        self.failed: Optional[str] = None
+    
+    def _fail(self, message: str):
+        """Print a command's error message and mark the command as failed."""
+        print(message)
+        self.failed = message
+    
+    @property
+    def piles(self) -> PileMap:
+        return self.session.piles
+    
+    @property
+    def journal(self) -> Optional[SessionJournal]:
+        return self.session.journal
+    
+    def create_pile(self, pile_name: str):
+        """Create a new pile."""
+        try:
+            self.session.create_pile(pile_name)
+        except PrototyperError as e:
+            self._fail(f"Error: {e}")
+            return
+        
+        print(f"Created pile '{pile_name}'.")
+    
+    def load_cards(self, pile_name: str, filename: str):
+        """Load cards from a JSON or JSON Lines file into a pile.
+        
+        Progress is reported on stderr for large files.
+        """
+        progress = None
+        next_report = time.monotonic() + self.PROGRESS_INTERVAL
+        
+        def report(cards: int, fraction: float):
+            nonlocal next_report
+            if time.monotonic() >= next_report:
+                print(f"  loading '{filename}': {fraction * 100:5.1f}% ({cards} cards)",
+                      file=sys.stderr)
+                next_report = time.monotonic() + self.PROGRESS_INTERVAL
+        
+        try:
+            if os.path.getsize(filename) >= self.PROGRESS_MIN_BYTES:
+                progress = report
+        except OSError:
+            pass  # reported by the session below
+        
+        try:
+            count = self.session.load_cards(pile_name, filename, progress=progress)
+            
+            print(f"Loaded {count} card(s) into pile '{pile_name}' from '{filename}'.")
+        
+        except PileNotFoundError as e:
+            self._fail(f"Error: {e} Create it first.")
+        except FileNotFoundError:
+            self._fail(f"Error: File '{filename}' not found.")
+        except json.JSONDecodeError:
+            self._fail(f"Error: Invalid JSON in file '{filename}'.")
+        except Exception as e:
+            self._fail(f"Error loading cards: {e}")
+    
+    def move_card(self, from_pile: str, to_pile: str, identifier: str, by_tag: bool = False):
+        """Move card(s) from one pile to another by name or tag."""
+        try:
+            if not by_tag and from_pile == Session.ANY_PILE and from_pile not in self.piles:
+                from_pile = self.session.locate(identifier, to_pile)
+            if by_tag:
+                cards = self.session.move_tag(from_pile, to_pile, identifier)
+            else:
+                self.session.move_card(from_pile, to_pile, identifier)
+        except CardNotFoundError as e:
+            self._fail(str(e))
+            return
+        except PrototyperError as e:
+            self._fail(f"Error: {e}")
+            return
+        
+        if not by_tag:
+            print(f"Moved card '{identifier}' from '{from_pile}' to '{to_pile}'.")
+        elif not cards:
+            print(f"No cards with tag '{identifier}' found in pile '{from_pile}'.")
+        else:
+            print(f"Moved {len(cards)} card(s) with tag '{identifier}' from '{from_pile}' to '{to_pile}'.")
+    
+    def move_query(self, from_pile: str, to_pile: str, expression: str):
+        """Move all cards matching a tag query from one pile to another."""
+        try:
+            cards = self.session.move_query(from_pile, to_pile, expression)
+        except PrototyperError as e:
+            self._fail(f"Error: {e}")
+            return
+        
+        if not cards:
+            print(f"No cards matching '{expression}' found in pile '{from_pile}'.")
+            return
+        print(f"Moved {len(cards)} card(s) matching '{expression}' from '{from_pile}' to '{to_pile}'.")
+    
+    def draw(self, from_pile: str, to_pile: str, count: int = 1, verb: str = "Drew"):
+        """Move cards from the top of one pile to the bottom of another."""
+        try:
+            cards = self.session.draw(from_pile, to_pile, count)
+        except PrototyperError as e:
+            self._fail(f"Error: {e}")
+            return
+        
+        if not cards and count > 0:
+            print(f"Pile '{from_pile}' is empty.")
+            return
+        print(f"{verb} {len(cards)} card(s) from '{from_pile}' to '{to_pile}'.")
+        if len(cards) <= self.DRAW_LISTING:
+            for card in cards:
+                print(f"  {card.name}")
+    
+    def mill(self, from_pile: str, to_pile: str, count: int = 1):
+        """Move cards from the top of one pile to another, e.g. a discard pile."""
+        self.draw(from_pile, to_pile, count, verb="Milled")
+    
+    def bottom(self, pile_name: str, count: int = 1):
+        """Put the top cards of a pile on its bottom."""
+        try:
+            cards = self.session.draw(pile_name, pile_name, count)
+        except PrototyperError as e:
+            self._fail(f"Error: {e}")
+            return
+        print(f"Put {len(cards)} card(s) from the top of '{pile_name}' on the bottom.")
+    
+    def cut(self, pile_name: str, position: Optional[int] = None):
+        """Cut a pile at a position, or at a random one."""
+        try:
+            position = self.session.cut(pile_name, position)
+        except PrototyperError as e:
+            self._fail(f"Error: {e}")
+            return
+        print(f"Cut '{pile_name}' after card {position}.")
+    
+    def shuffle(self, pile_name: str, seed: Optional[int] = None):
+        """Shuffle a pile, optionally with a fixed seed."""
+        try:
+            seed = self.session.shuffle(pile_name, seed)
+        except PrototyperError as e:
+            self._fail(f"Error: {e}")
+            return
+        print(f"Shuffled '{pile_name}' (seed {seed}).")
+    
+    def seed(self, seed: Optional[int] = None):
+        """Show the session's random seed, or restart its generator from a new one."""
+        if seed is None:
+            print(f"Session seed is {self.session.seed}.")
+        else:
+            print(f"Session seed set to {self.session.reseed(seed)}.")
+    
+    @staticmethod
+    def _format_number(value: float) -> str:
+        return f"{value:g}" if isinstance(value, float) else str(value)
+    
+    def show_stats(self, pile_name: Optional[str] = None):
+        """Show tag counts and stat totals for one pile or all piles."""
+        try:
+            summary = self.session.pile_stats(pile_name)
+        except PrototyperError as e:
+            self._fail(f"Error: {e}")
+            return
+        
+        if not summary:
+            print("No piles created yet.")
+            return
+        for name, stats in summary.items():
+            print(f"Pile '{name}' ({stats['cards']} cards):")
+            tags = sorted(stats["tags"].items(), key=lambda item: (-item[1], item[0]))
+            print(f"  tags:  {', '.join(f'{tag} {count}' for tag, count in tags) or 'none'}")
+            totals = [f"{stat} {self._format_number(total)} ({cards} card(s))"
+                      for stat, (cards, total) in stats["stats"].items()]
+            print(f"  stats: {', '.join(totals) or 'none'}")
+    
+    def show_perf(self):
+        """Show latency percentiles for each command run so far."""
+        summary = self.perf.summary()
+        if not summary:
+            print("No commands timed yet.")
+            return
+        
+        print(f"  {'command':<14}{'count':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+        for cmd, stats in sorted(summary.items(), key=lambda item: -item[1]["p99"]):
+            print(f"  {cmd:<14}{stats['count']:>8}{stats['p50'] * 1e3:>10.3f}{stats['p95'] * 1e3:>10.3f}"
+                  f"{stats['p99'] * 1e3:>10.3f}{stats['max'] * 1e3:>10.3f}")
+        if self.perf.slow_threshold is not None and self.perf.slow_log:
+            print(f"Commands over {self.perf.slow_threshold * 1e3:g} ms are logged to '{self.perf.slow_log}'.")
+    
+    def set_slow_log(self, threshold_ms: float, logfile: Optional[str] = None):
+        """Log commands slower than a threshold to a file."""
+        self.perf.slow_threshold = threshold_ms / 1e3
+        if logfile is not None:
+            self.perf.slow_log = logfile
+        if not self.perf.slow_log:
+            self.perf.slow_log = self.SLOW_LOG
+        print(f"Logging commands over {threshold_ms:g} ms to '{self.perf.slow_log}'.")
+    
+    def where(self, card_name: str):
+        """Show which piles hold a card."""
+        piles = self.session.where(card_name)
+        if not piles:
+            print(f"Card '{card_name}' is not in any pile.")
+            return
+        
+        locations = ', '.join(f"'{pile_name}' ({copies})" for pile_name, copies in piles.items())
+        print(f"Card '{card_name}' is in {locations}.")
+    
+    def count_cards(self, pile_name: str, expression: Optional[str] = None):
+        """Count the cards in a pile, optionally only those matching a tag query."""
+        try:
+            count = self.session.count_cards(pile_name, expression)
+        except PrototyperError as e:
+            self._fail(f"Error: {e}")
+            return
+        
+        if expression is None:
+            print(f"Pile '{pile_name}' contains {count} card(s).")
+        else:
+            print(f"Pile '{pile_name}' contains {count} card(s) matching '{expression}'.")
+    
+    def simulate(self, pile_name: str, draws: int, trials: int, conditions: str,
+                 seed: Optional[int] = None, workers: Optional[int] = None):
+        """Estimate how often a random draw from a pile meets the conditions."""
+        try:
+            result = self.session.simulate(pile_name, draws, trials, conditions,
+                                           seed=seed, workers=workers)
+        except PrototyperError as e:
+            self._fail(f"Error: {e}")
+            return
+        
+        print(f"P({conditions} in {draws} draw(s) from '{pile_name}') ~ "
+              f"{result.probability:.4f} +/- {result.margin:.4f}")
+        print(f"  {result.trials} trial(s), seed {result.seed}, "
+              f"{result.workers} worker(s), {result.elapsed:.2f}s")
+    
+    def probability(self, pile_name: str, draws: int, conditions: str):
+        """Compute how likely a random draw from a pile is to meet the conditions."""
+        start = time.perf_counter()
+        try:
+            result = self.session.probability(pile_name, draws, conditions)
+        except PrototyperError as e:
+            self._fail(f"Error: {e}")
+            return
+        
+        label = f"P({conditions} in {draws} draw(s) from '{pile_name}')"
+        if isinstance(result, SimulationResult):
+            print(f"{label} ~ {result.probability:.4f} +/- {result.margin:.4f}")
+            print(f"  too many states for the exact method; Monte Carlo with "
+                  f"{result.trials} trial(s), seed {result.seed}, {result.elapsed:.2f}s")
+        else:
+            print(f"{label} = {float(result):.6f}")
+            print(f"  exact, {(time.perf_counter() - start) * 1000:.1f} ms")
+    
+    @staticmethod
+    def _parse_range(text: str, size: int) -> Tuple[int, int]:
+        """Turn "[start:end]" (1-based, inclusive) into zero-based start and stop.
+        
+        Either end may be left out, and negative positions count back from
+        the bottom of the pile. A single position selects one card.
+        """
+        first, sep, last = text.strip().strip("[]").partition(":")
+        
+        def position(value: str, default: int) -> int:
+            if not value.strip():
+                return default
+            number = int(value)
+            return size + number + 1 if number < 0 else number
+        
+        start = position(first, 1)
+        stop = position(last, size) if sep else start
+        return max(start, 1) - 1, stop
+    
+    def show_pile(self, pile_name: str, positions: Optional[str] = None):
+        """Display contents of a pile, or the rows in a [start:end] range.
+        
+        Rows are streamed to stdout as they are rendered. Long listings on
+        a terminal go through a pager.
+        """
+        try:
+            pile = self.session.pile(pile_name)
+        except PrototyperError as e:
+            self._fail(f"Error: {e}")
+            return
+        
+        start, stop = self._parse_range(positions, len(pile)) if positions else (0, len(pile))
+        self._write_lines(pile.render(start, stop), max(0, min(stop, len(pile)) - start))
+    
+    def head(self, pile_name: str, count: int = 10):
+        """Display the top cards of a pile."""
+        self.show_pile(pile_name, f"1:{count}")
+    
+    def tail(self, pile_name: str, count: int = 10):
+        """Display the bottom cards of a pile."""
+        self.show_pile(pile_name, f"-{count}:" if count > 0 else "1:0")
+    
+    def _write_lines(self, lines: Iterator[str], rows: int):
+        """Write lines to stdout, through a pager if there are many on a terminal."""
+        out = sys.stdout
+        if self.pager_threshold and rows > self.pager_threshold and out.isatty():
+            self._page(lines)
+            return
+        out.writelines(f"{line}\n" for line in lines)
+    
+    def _page(self, lines: Iterator[str]):
+        """Stream lines into $PAGER, or page them here if there is no pager."""
+        command = os.environ.get("PAGER") or self.PAGER
+        sys.stdout.flush()
+        try:
+            pager = subprocess.Popen(shlex.split(command), stdin=subprocess.PIPE, text=True)
+        except (OSError, ValueError):
+            pager = None
+        
+        if pager is not None:
+            try:
+                pager.stdin.writelines(f"{line}\n" for line in lines)
+            except BrokenPipeError:
+                pass  # the pager was quit early
+            finally:
+                try:
+                    pager.stdin.close()
+                except BrokenPipeError:
+                    pass
+                pager.wait()
+            return
+        
+        page = max(shutil.get_terminal_size().lines - 1, 1)
+        for count, line in enumerate(lines, 1):
+            print(line)
+            if count % page == 0 and input("-- More -- (Enter to continue, q to stop) ").strip().lower() == 'q':
+                return
+    
+    def list_piles(self):
+        """List all existing piles."""
+        sizes = self.session.pile_sizes()
+        if not sizes:
+            print("No piles created yet.")
+            return
+        
+        print(f"Existing piles ({len(sizes)}):")
+        for pile_name, size in sizes.items():
+            print(f"  - {pile_name} ({size} cards)")
+    
+    def save_session(self, filename: Optional[str] = None):
+        """Save entire session state to a JSON file, a .ups binary file or a .session directory.
+        
+        Without a filename the session is saved where it was last loaded
+        from or saved to.
+        """
+        try:
+            written = self.session.save_session(filename)
+            filename = self.session.saved_to
+            if SessionDirectory.is_directory(filename):
+                print(f"Session saved to '{filename}' ({written} of {len(self.piles)} pile(s) written).")
+            else:
+                print(f"Session saved to '{filename}'.")
+        
+        except Exception as e:
+            self._fail(f"Error saving session: {e}")
     
-    def save_session(self, filename: str):
-        """Save entire session state to JSON file."""
+    def convert_session(self, source: str, dest: str):
+        """Convert a saved session between the JSON, binary and directory formats."""
         try:
-            data = {
-                "piles": {name: pile.to_dict() for name, pile in self.piles.items()}
-            }
-            
-            with open(filename, 'w') as f:
-                json.dump(data, f, indent=2)
-            
-            print(f"Session saved to '{filename}'.")
+            count = self.session.convert_session(source, dest)
+            print(f"Converted '{source}' to '{dest}' ({count} pile(s)).")
         
+        except FileNotFoundError:
+            self._fail(f"Error: File '{source}' not found.")
+        except json.JSONDecodeError:
+            self._fail(f"Error: Invalid JSON in file '{source}'.")
         except Exception as e:
-            print(f"Error saving session: {e}")
+            self._fail(f"Error converting session: {e}")
     
     def load_session(self, filename: str):
-        """Load entire session state from JSON file."""
+        """Load entire session state from JSON file or a session journal.
+        
+        A `.journal` file is restored from its snapshot plus a replay of the
+        events after it, and journaling then continues into it.
+        """
         try:
-            with open(filename, 'r') as f:
-                data = json.load(f)
-            
-            self.piles = {}
-            for pile_name, pile_data in data.get("piles", {}).items():
-                self.piles[pile_name] = Pile.from_dict(pile_data)
+            if filename.endswith(".journal"):
+                replayed = self.session.restore_journal(filename)
+                print(f"Session restored from '{filename}' ({replayed} event(s) replayed). "
+                      f"Loaded {len(self.piles)} pile(s).")
+                return
             
-            print(f"Session loaded from '{filename}'. Loaded {len(self.piles)} pile(s).")
+            count = self.session.load_session(filename)
+            print(f"Session loaded from '{filename}'. Loaded {count} pile(s).")
         
         except FileNotFoundError:
-            print(f"Error: File '{filename}' not found.")
+            self._fail(f"Error: File '{filename}' not found.")
         except json.JSONDecodeError:
-            print(f"Error: Invalid JSON in file '{filename}'.")
+            self._fail(f"Error: Invalid JSON in file '{filename}'.")
+        except Exception as e:
+            self._fail(f"Error loading session: {e}")
+    
+    @staticmethod
+    def _describe(entry: Dict) -> str:
+        """Short description of an undo history entry."""
+        op = entry["op"]
+        if op == "create":
+            return f"create of pile '{entry['pile']}'"
+        if op == "add":
+            return f"load of {entry['count']} card(s) into '{entry['pile']}'"
+        if op == "shuffle":
+            return f"shuffle of '{entry['pile']}'"
+        return f"move of {len(entry['slots'])} card(s) from '{entry['from']}' to '{entry['to']}'"
+    
+    def undo(self, steps: int = 1):
+        """Undo the latest operations."""
+        for _ in range(steps):
+            entry = self.session.undo()
+            if entry is None:
+                print("Nothing to undo.")
+                return
+            print(f"Undid {self._describe(entry)}.")
+    
+    def redo(self, steps: int = 1):
+        """Redo operations that were undone."""
+        for _ in range(steps):
+            entry = self.session.redo()
+            if entry is None:
+                print("Nothing to redo.")
+                return
+            print(f"Redid {self._describe(entry)}.")
+    
+    def fork(self, branch_name: str):
+        """Branch the session and switch to the new branch."""
+        try:
+            parent = self.session.fork(branch_name)
+        except PrototyperError as e:
+            self._fail(f"Error: {e}")
+            return
+        
+        print(f"Forked branch '{branch_name}' from '{parent}'.")
+    
+    def switch(self, branch_name: str):
+        """Switch to another branch of the session."""
+        try:
+            self.session.switch(branch_name)
+        except PrototyperError as e:
+            self._fail(f"Error: {e}")
+            return
+        
+        print(f"Switched to branch '{branch_name}'.")
+    
+    def list_branches(self):
+        """List the session's branches, marking the current one."""
+        branches = self.session.branches()
+        print(f"Branches ({len(branches)}):")
+        for branch_name, piles in sorted(branches.items()):
+            marker = "*" if branch_name == self.session.branch else " "
+            print(f"  {marker} {branch_name} ({len(piles)} pile(s), {piles.shared_piles()} shared)")
+    
+    def start_journal(self, base: str, snapshot_every: int = SessionJournal.SNAPSHOT_EVERY):
+        """Start recording every mutation to `<base>.journal`."""
+        try:
+            journal = self.session.start_journal(base, snapshot_every)
+            print(f"Journaling session to '{journal.journal_path}' "
+                  f"(snapshot every {snapshot_every} event(s)).")
         except Exception as e:
-            print(f"Error loading session: {e}")
+            self._fail(f"Error starting journal: {e}")
+    
+    def stop_journal(self):
+        """Stop recording mutations to the session journal."""
+        journal = self.session.stop_journal()
+        if journal is None:
+            print("No journal is active.")
+        else:
+            print(f"Stopped journaling to '{journal.journal_path}'.")
     
     def show_help(self):
         """Display help information."""
@@ -245,24 +3492,124 @@ Universal Prototyper - Available Commands:
   load <pile_name> <filename>
       Load cards from a JSON file into the specified pile.
       JSON format: [{"name": "...", "effect": "...", "tags": ["..."]}]
+      Files ending in .jsonl or .ndjson are read as one card per line.
   
   move <from_pile> <to_pile> <card_name>
-      Move a card by name from one pile to another.
+      Move a card by name from one pile to another. Use * as <from_pile>
+      to take it from whichever other pile holds it.
+  
+  where <card_name>
+      Show which piles hold a card, and how many copies each has.
   
   movetag <from_pile> <to_pile> <tag>
       Move all cards with the specified tag from one pile to another.
   
-  show <pile_name>
-      Display the contents of a pile.
+  movequery <from_pile> <to_pile> <query>
+      Move all cards matching a tag query from one pile to another.
+      Queries combine tags with & (and), | (or), ~ (not) and parentheses,
+      e.g. "spell & fire & ~ice".
+  
+  count <pile_name> [query]
+      Count the cards in a pile, optionally only those matching a tag query.
+  
+  draw <from_pile> <to_pile> [count] / mill <from_pile> <to_pile> [count]
+      Move the top card(s) of one pile to the bottom of another (1 by default).
+  
+  bottom <pile_name> [count]
+      Put the top card(s) of a pile on its bottom.
+  
+  cut <pile_name> [position]
+      Move the top <position> cards underneath the rest (random if omitted).
+  
+  shuffle <pile_name> [seed]
+      Shuffle a pile. The seed used is printed so the shuffle can be repeated.
+  
+  seed [n]
+      Show the session's random seed, or restart its generator from <n>.
+  
+  simulate <pile_name> <draws> <trials> <conditions> [seed=N] [workers=N]
+      Estimate by Monte Carlo how often drawing <draws> cards from a pile
+      meets every condition. Conditions are comma-separated, e.g.
+      "spell >= 2, name:Fireball >= 1"; each side is a tag query or
+      name:<card name>. The same seed always gives the same result.
+  
+  prob <pile_name> <draws> <conditions>
+      Compute exactly how likely drawing <draws> cards from a pile is to
+      meet every condition (same syntax as simulate). Falls back to Monte
+      Carlo when the exact computation would be too expensive.
+  
+  show <pile_name> [start:end]
+      Display the contents of a pile, or only positions start to end
+      (counting from 1, either end optional, negative from the bottom).
+      Long listings on a terminal open in a pager.
+  
+  head <pile_name> [count] / tail <pile_name> [count]
+      Display the top or bottom cards of a pile (10 by default).
   
   piles
       List all existing piles and their card counts.
   
+  perf
+      Show p50/p95/p99 and maximum latency for each command type.
+  
+  perf slow <ms> [logfile]
+      Log every command taking at least <ms> milliseconds, with its pile
+      sizes, to a file (default prototyper-slow.log).
+  
+  perf reset
+      Clear the command timings.
+  
+  stats [pile_name]
+      Show how many cards carry each tag, and totals of numeric stats
+      written in effects as "Name: value" (e.g. "Attack: 3"), for one pile
+      or every pile.
+  
   save <filename>
       Save the entire session state to a JSON file.
   
+  save <filename>.ups
+      Save the session in the compact binary format.
+  
+  save <dirname>.session
+      Save the session as a directory with one file per pile. Saving
+      again only writes the piles that changed.
+  
+  save
+      Save again to the file or directory last loaded or saved.
+  
   loadsession <filename>
-      Load a previously saved session from a JSON file.
+      Load a previously saved session from a JSON or binary file or a
+      session directory, or restore a journaled session from its .journal
+      file. Piles of a binary session or a session directory are only
+      read when first used.
+  
+  convert <source> <dest>
+      Convert a saved session between JSON, binary (.ups) and directory
+      (.session) formats.
+  
+  journal <base> [snapshot_every]
+      Record every change to <base>.journal as it happens, with a full
+      snapshot in <base>.snapshot.json every so many events.
+  
+  journal off
+      Stop journaling.
+  
+  undo [steps]
+      Undo the latest create, load, move, movetag or movequery, putting
+      cards back exactly where they were.
+  
+  redo [steps]
+      Redo what was undone. Any new change clears the redo list.
+  
+  fork <branch_name>
+      Branch the current piles under a new name and switch to it, to try
+      out an alternative. Branches share piles until one of them changes.
+  
+  switch <branch_name>
+      Switch to another branch. The first branch is called 'main'.
+  
+  branches
+      List all branches; the current one is marked with *.
   
   help
       Display this help message.
@@ -272,77 +3619,171 @@ Universal Prototyper - Available Commands:
 """
         print(help_text)
     
-    def parse_command(self, line: str):
-        """Parse and execute a command."""
-        parts = line.strip().split()
+    # Command name -> (method, argument signature). In a signature, <arg>
+    # is required and [arg] optional, a trailing ... takes the rest of the
+    # line, :int converts the argument, and * hands the method the raw
+    # argument tokens instead.
+    COMMANDS = {
+        'quit': ('quit', ''),
+        'exit': ('quit', ''),
+        'help': ('show_help', ''),
+        'create': ('create_pile', '<pile_name>'),
+        'load': ('load_cards', '<pile_name> <filename>'),
+        'move': ('move_card', '<from_pile> <to_pile> <card_name...>'),
+        'where': ('where', '<card_name...>'),
+        'movetag': ('move_tag', '<from_pile> <to_pile> <tag...>'),
+        'movequery': ('move_query', '<from_pile> <to_pile> <query...>'),
+        'count': ('count_cards', '<pile_name> [query...]'),
+        'draw': ('draw', '<from_pile> <to_pile> [count:int]'),
+        'mill': ('mill', '<from_pile> <to_pile> [count:int]'),
+        'bottom': ('bottom', '<pile_name> [count:int]'),
+        'cut': ('cut', '<pile_name> [position:int]'),
+        'shuffle': ('shuffle', '<pile_name> [seed:int]'),
+        'seed': ('seed', '[seed:int]'),
+        'simulate': ('_simulate_command', '*'),
+        'prob': ('probability', '<pile_name> <draws:int> <conditions...>'),
+        'show': ('show_pile', '<pile_name> [range]'),
+        'head': ('head', '<pile_name> [count:int]'),
+        'tail': ('tail', '<pile_name> [count:int]'),
+        'piles': ('list_piles', ''),
+        'stats': ('show_stats', '[pile_name]'),
+        'perf': ('_perf_command', '*'),
+        'save': ('save_session', '[filename]'),
+        'loadsession': ('load_session', '<filename>'),
+        'convert': ('convert_session', '<source> <dest>'),
+        'journal': ('_journal_command', '*'),
+        'undo': ('undo', '[steps:int]'),
+        'redo': ('redo', '[steps:int]'),
+        'fork': ('fork', '<branch_name>'),
+        'switch': ('switch', '<branch_name>'),
+        'branches': ('list_branches', ''),
+    }
+    
+    @classmethod
+    @lru_cache(maxsize=4096)
+    def compile(cls, line: str) -> Optional[CommandInvocation]:
+        """Tokenize a command line and bind it to its handler.
         
-        if not parts:
-            return
+        Results are cached per line, so replayed scripts skip re-parsing.
+        Returns None for a blank line. Raises ValueError if an argument
+        cannot be converted.
+        """
+        tokens = tokenize_command(line)
+        if not tokens:
+            return None
+        command = tokens[0].lower()
+        spec = cls.COMMANDS.get(command)
+        if spec is None:
+            return CommandInvocation(command, None, (), f"Unknown command: {command}. "
+                                                       "Type 'help' for available commands.")
+        method, signature = spec
+        if signature == '*':
+            return CommandInvocation(command, method, (tokens[1:],))
+        
+        args = []
+        rest = tokens[1:]
+        for param in signature.split():
+            required = param.startswith('<')
+            name = param[1:-1]
+            if name.endswith('...'):
+                if rest:
+                    args.append(' '.join(rest))
+                elif required:
+                    break
+                rest = []
+                continue
+            if not rest:
+                if required:
+                    break
+                continue
+            token, rest = rest[0], rest[1:]
+            args.append(int(token) if name.endswith(':int') else token)
+        else:
+            return CommandInvocation(command, method, tuple(args))
         
-        cmd = parts[0].lower()
+        usage = signature.replace('...', '').replace(':int', '')
+        return CommandInvocation(command, None, (), f"Usage: {command} {usage}")
+    
+    def _involved_piles(self, args: Tuple) -> Dict[str, int]:
+        """Sizes of the existing piles named in a command's arguments."""
+        piles = self.session.piles
+        if args and isinstance(args[0], list):
+            args = args[0]
+        return {name: piles.size_of(name) for name in args if isinstance(name, str) and name in piles}
+    
+    def parse_command(self, line: str) -> bool:
+        """Parse and execute a command, recording how long it took.
         
+        Returns False if the command reported an error.
+        """
+        began = time.perf_counter()
+        self.failed = None
         try:
-            if cmd in ('quit', 'exit'):
-                self.running = False
-                print("Goodbye!")
-            
-            elif cmd == 'help':
-                self.show_help()
-            
-            elif cmd == 'create':
-                if len(parts) < 2:
-                    print("Usage: create <pile_name>")
-                else:
-                    self.create_pile(parts[1])
-            
-            elif cmd == 'load':
-                if len(parts) < 3:
-                    print("Usage: load <pile_name> <filename>")
-                else:
-                    self.load_cards(parts[1], parts[2])
-            
-            elif cmd == 'move':
-                if len(parts) < 4:
-                    print("Usage: move <from_pile> <to_pile> <card_name>")
-                else:
-                    # Allow card names with spaces (join remaining parts)
-                    card_name = ' '.join(parts[3:])
-                    self.move_card(parts[1], parts[2], card_name)
-            
-            elif cmd == 'movetag':
-                if len(parts) < 4:
-                    print("Usage: movetag <from_pile> <to_pile> <tag>")
-                else:
-                    # Allow tag names with spaces (join remaining parts)
-                    tag = ' '.join(parts[3:])
-                    self.move_card(parts[1], parts[2], tag, by_tag=True)
-            
-            elif cmd == 'show':
-                if len(parts) < 2:
-                    print("Usage: show <pile_name>")
-                else:
-                    self.show_pile(parts[1])
-            
-            elif cmd == 'piles':
-                self.list_piles()
-            
-            elif cmd == 'save':
-                if len(parts) < 2:
-                    print("Usage: save <filename>")
-                else:
-                    self.save_session(parts[1])
-            
-            elif cmd == 'loadsession':
-                if len(parts) < 2:
-                    print("Usage: loadsession <filename>")
-                else:
-                    self.load_session(parts[1])
-            
-            else:
-                print(f"Unknown command: {cmd}. Type 'help' for available commands.")
+            invocation = self.compile(line)
+        except ValueError as e:
+            self._fail(f"Error executing command: {e}")
+            return False
+        if invocation is None:
+            return True
         
+        try:
+            invocation.run(self)
         except Exception as e:
-            print(f"Error executing command: {e}")
+            self._fail(f"Error executing command: {e}")
+        finally:
+            # Unknown commands share one histogram so typos cannot grow the table
+            name = invocation.command if invocation.command in self.COMMANDS else "(unknown)"
+            self.perf.record(name, time.perf_counter() - began, line.strip(),
+                             lambda: self._involved_piles(invocation.args))
+        return self.failed is None
+    
+    def quit(self):
+        """Stop the REPL."""
+        self.running = False
+        print("Goodbye!")
+    
+    def move_tag(self, from_pile: str, to_pile: str, tag: str):
+        """Move all cards with a tag from one pile to another."""
+        self.move_card(from_pile, to_pile, tag, by_tag=True)
+    
+    def _simulate_command(self, tokens: List[str]):
+        options = {}
+        args = []
+        for token in tokens:
+            key, sep, value = token.partition('=')
+            if sep and key in ('seed', 'workers') and value.isdigit():
+                options[key] = int(value)
+            else:
+                args.append(token)
+        if len(args) < 4:
+            self._fail("Usage: simulate <pile_name> <draws> <trials> <conditions> [seed=N] [workers=N]")
+        else:
+            self.simulate(args[0], int(args[1]), int(args[2]), ' '.join(args[3:]), **options)
+    
+    def _perf_command(self, tokens: List[str]):
+        if not tokens:
+            self.show_perf()
+        elif tokens[0] == 'reset':
+            self.perf.reset()
+            print("Command timings cleared.")
+        elif tokens[0] == 'slow' and len(tokens) > 1:
+            self.set_slow_log(float(tokens[1]), tokens[2] if len(tokens) > 2 else None)
+        else:
+            self._fail("Usage: perf [reset | slow <ms> [logfile]]")
+    
+    def _journal_command(self, tokens: List[str]):
+        if not tokens:
+            if self.journal is None:
+                print("No journal is active.")
+            else:
+                print(f"Journaling to '{self.journal.journal_path}' "
+                      f"({self.journal.seq} event(s) recorded).")
+        elif tokens[0] == 'off':
+            self.stop_journal()
+        elif len(tokens) > 1:
+            self.start_journal(tokens[0], int(tokens[1]))
+        else:
+            self.start_journal(tokens[0])
     
     def run(self):
         """Start the REPL."""
@@ -362,12 +3803,970 @@ Universal Prototyper - Available Commands:
             except KeyboardInterrupt:
                 print("\nUse 'quit' or 'exit' to leave.")
                 continue
+    
+    OUTPUT_FLUSH_CHARS = 1 << 16
+    
+    def run_script(self, lines: Iterable[str], quiet: bool = False, report=sys.stderr):
+        """Run commands non-interactively and report timing per command type.
+        
+        No prompts are shown. Command output is collected in a buffer that
+        is written out in large blocks, or discarded entirely when `quiet`.
+        Blank lines and lines starting with '#' are skipped.
+        """
+        out = sys.stdout
+        buffer = io.StringIO()
+        counts: Counter = Counter()
+        totals: Dict[str, float] = defaultdict(float)
+        clock = time.perf_counter
+        start = clock()
+        
+        with redirect_stdout(buffer):
+            for line in lines:
+                stripped = line.strip()
+                if not stripped or stripped.startswith("#"):
+                    continue
+                cmd = stripped.split(None, 1)[0].lower()
+                began = clock()
+                self.parse_command(stripped)
+                totals[cmd] += clock() - began
+                counts[cmd] += 1
+                if buffer.tell() >= self.OUTPUT_FLUSH_CHARS:
+                    if not quiet:
+                        out.write(buffer.getvalue())
+                    buffer.seek(0)
+                    buffer.truncate()
+                if not self.running:
+                    break
+        if not quiet:
+            out.write(buffer.getvalue())
+        out.flush()
+        
+        if report is not None:
+            elapsed = clock() - start
+            total = sum(counts.values())
+            rate = total / elapsed if elapsed > 0 else 0.0
+            print(f"Ran {total} command(s) in {elapsed:.3f}s ({rate:.0f} commands/s)", file=report)
+            if counts:
+                print(f"  {'command':<14}{'count':>10}{'total ms':>12}{'mean us':>12}", file=report)
+                for cmd, seconds in sorted(totals.items(), key=lambda item: -item[1]):
+                    print(f"  {cmd:<14}{counts[cmd]:>10}{seconds * 1e3:>12.1f}"
+                          f"{seconds * 1e6 / counts[cmd]:>12.1f}", file=report)
+
+
+def _percentile(ordered: Sequence[float], fraction: float) -> float:
+    """Nearest-rank percentile of an already sorted, non-empty sequence."""
+    index = max(0, min(len(ordered) - 1, math.ceil(fraction * len(ordered)) - 1))
+    return ordered[index]
+
+
+class CatalogGenerator:
+    """Seeded generator of synthetic card catalogs for benchmarking.
+    
+    Tag popularity follows a Zipf-like distribution: tag i is drawn with
+    weight 1 / (i + 1) ** tag_skew, so a skew of 0 makes every tag equally
+    common. Name and effect lengths are drawn uniformly from the given
+    (min, max) ranges, and some effects carry numeric "Name: value" stats.
+    The same seed always produces the same catalog.
+    """
+    
+    SYLLABLES = ("ka", "ra", "mon", "el", "dra", "vi", "sh", "or", "th", "un",
+                 "ix", "zal", "fe", "go", "lin", "ar", "wy", "qu", "sto", "ne")
+    WORDS = ("deal", "damage", "to", "target", "gain", "armor", "draw", "a", "card",
+             "each", "turn", "summon", "token", "restore", "health", "when", "played")
+    STATS = ("Attack", "Health", "Cost", "Range", "Speed")
+    
+    def __init__(self, seed: int = 0, tags: int = 32, tags_per_card: int = 3,
+                 tag_skew: float = 1.0, name_length: Tuple[int, int] = (6, 24),
+                 effect_length: Tuple[int, int] = (0, 80), stats_fraction: float = 0.5):
+        self.seed = seed
+        self.tags = [f"tag{i:03d}" for i in range(tags)]
+        self.tags_per_card = min(tags_per_card, tags)
+        self.tag_weights = list(itertools.accumulate(1 / (i + 1) ** tag_skew for i in range(tags)))
+        self.name_length = name_length
+        self.effect_length = effect_length
+        self.stats_fraction = stats_fraction
+    
+    def _text(self, rng: random.Random, pieces: Sequence[str], length: int, sep: str) -> str:
+        parts: List[str] = []
+        size = 0
+        while size < length:
+            piece = rng.choice(pieces)
+            parts.append(piece)
+            size += len(piece) + len(sep)
+        return sep.join(parts)[:length]
+    
+    def cards(self, count: int) -> Iterator[Dict]:
+        """Yield `count` card dictionaries. Every name is unique."""
+        rng = random.Random(self.seed)
+        choices = rng.choices
+        for i in range(count):
+            suffix = f"#{i}"
+            name_length = max(rng.randint(*self.name_length) - len(suffix), 1)
+            name = self._text(rng, self.SYLLABLES, name_length, "").capitalize() + suffix
+            effect = self._text(rng, self.WORDS, rng.randint(*self.effect_length), " ")
+            if rng.random() < self.stats_fraction:
+                stats = ", ".join(f"{stat}: {rng.randint(0, 9)}" for stat in rng.sample(self.STATS, 2))
+                effect = f"{effect}. {stats}" if effect else stats
+            tags = set(choices(self.tags, cum_weights=self.tag_weights, k=self.tags_per_card))
+            yield {"name": name, "effect": effect, "tags": sorted(tags)}
+    
+    def write(self, filename: str, count: int) -> int:
+        """Write a catalog as JSON Lines. Returns the number of bytes written."""
+        with _atomic_open(filename) as f:
+            for card in self.cards(count):
+                f.write(json.dumps(card))
+                f.write("\n")
+            return f.tell()
+
+
+def _run_benchmark_size(size: int, options: Dict) -> Dict:
+    """Benchmark one catalog size; runs in its own process so peak memory is per size."""
+    return BenchmarkSuite(**options).run_size(size)
+
+
+class BenchmarkSuite:
+    """Times the core session operations on synthetic catalogs.
+    
+    For each size a catalog is generated into a temporary directory and
+    loaded into a fresh Session, then load_cards, move_card (by name and by
+    tag), show_pile, save_session and load_session (JSON and binary) are
+    timed. Each size runs in a separate process so that its peak memory can
+    be reported. Results are plain dictionaries that `compare` can check
+    against a stored baseline.
+    """
+    
+    FORMAT_VERSION = 1
+    # Lower is better for every compared metric
+    COMPARED = ("seconds", "p50_us", "p95_us", "peak_rss_mb")
+    
+    def __init__(self, seed: int = 0, moves: int = 1000, tag_moves: int = 8, backend: str = "list",
+                 generator: Optional[Dict] = None):
+        self.seed = seed
+        self.moves = moves
+        self.tag_moves = tag_moves
+        self.backend = backend
+        self.generator = dict(generator or {})
+    
+    def options(self) -> Dict:
+        return {"seed": self.seed, "moves": self.moves, "tag_moves": self.tag_moves,
+                "backend": self.backend, "generator": self.generator}
+    
+    @staticmethod
+    def _single(seconds: float, items: int) -> Dict:
+        return {"seconds": seconds, "items_per_s": items / seconds if seconds > 0 else 0.0}
+    
+    @staticmethod
+    def _repeated(samples: List[float]) -> Dict:
+        ordered = sorted(samples)
+        if not ordered:
+            return {"ops": 0, "mean_us": 0.0, "p50_us": 0.0, "p95_us": 0.0, "p99_us": 0.0, "ops_per_s": 0.0}
+        total = sum(ordered)
+        return {
+            "ops": len(ordered),
+            "mean_us": total / len(ordered) * 1e6,
+            "p50_us": _percentile(ordered, 0.50) * 1e6,
+            "p95_us": _percentile(ordered, 0.95) * 1e6,
+            "p99_us": _percentile(ordered, 0.99) * 1e6,
+            "ops_per_s": len(ordered) / total if total > 0 else 0.0,
+        }
+    
+    def run_size(self, size: int) -> Dict:
+        """Run every benchmark on a catalog of `size` cards."""
+        clock = time.perf_counter
+        rng = random.Random(self.seed)
+        results: Dict[str, Dict] = {}
+        with tempfile.TemporaryDirectory(prefix="prototyper-bench-") as tmp:
+            catalog = os.path.join(tmp, "catalog.jsonl")
+            CatalogGenerator(seed=self.seed, **self.generator).write(catalog, size)
+            
+            session = Session(self.backend)
+            session.create_pile("deck")
+            session.create_pile("hand")
+            began = clock()
+            session.load_cards("deck", catalog)
+            results["load_cards"] = self._single(clock() - began, size)
+            
+            deck = session.pile("deck")
+            names = [card.name for card in deck]
+            samples = []
+            for name in rng.sample(names, min(self.moves, size)):
+                began = clock()
+                session.move_card("deck", "hand", name)
+                samples.append(clock() - began)
+                session.move_card("hand", "deck", name)
+            del names
+            results["move_card"] = self._repeated(samples)
+            
+            counts = deck.tag_counts()
+            tags = sorted(counts, key=counts.get, reverse=True)
+            samples = []
+            # Half the most common tags and half the rarest
+            common = self.tag_moves // 2
+            rare = self.tag_moves - common
+            for tag in tags[:common] + (tags[-rare:] if rare > 0 else []):
+                began = clock()
+                session.move_tag("deck", "hand", tag)
+                samples.append(clock() - began)
+                session.move_tag("hand", "deck", tag)
+            results["move_tag"] = self._repeated(samples)
+            
+            with open(os.devnull, 'w') as sink, redirect_stdout(sink):
+                began = clock()
+                Prototyper(session=session).show_pile("deck")
+                results["show_pile"] = self._single(clock() - began, size)
+            
+            for label, suffix in (("json", ".json"), ("binary", BinarySession.SUFFIX)):
+                path = os.path.join(tmp, "session" + suffix)
+                began = clock()
+                session.save_session(path)
+                results[f"save_session_{label}"] = self._single(clock() - began, size)
+                
+                loaded = Session(self.backend)
+                began = clock()
+                loaded.load_session(path)
+                for pile_name in loaded.piles:
+                    loaded.piles[pile_name]  # decode lazily stored piles too
+                results[f"load_session_{label}"] = self._single(clock() - began, size)
+                if label == "binary":
+                    # Release the mmap before the directory is removed
+                    loaded.piles = PileMap()
+                del loaded
+        
+        if resource is not None:
+            peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            # ru_maxrss is in kilobytes on Linux but bytes on macOS
+            results["memory"] = {"peak_rss_mb": peak / (1 << 20 if sys.platform == "darwin" else 1 << 10)}
+        return results
+    
+    def run(self, sizes: Iterable[int], report=None) -> Dict:
+        """Benchmark each size in a fresh worker process and collect the results."""
+        results = {"version": self.FORMAT_VERSION, "options": self.options(),
+                   "python": sys.version.split()[0], "sizes": {}}
+        for size in sizes:
+            with ProcessPoolExecutor(max_workers=1) as pool:
+                results["sizes"][str(size)] = pool.submit(_run_benchmark_size, size, self.options()).result()
+            if report is not None:
+                self.print_size(size, results["sizes"][str(size)], report)
+        return results
+    
+    @staticmethod
+    def print_size(size: int, results: Dict, report):
+        print(f"{size} cards:", file=report)
+        for name, metrics in results.items():
+            if "ops" in metrics:
+                print(f"  {name:<22}p50 {metrics['p50_us']:>10.1f} us  p95 {metrics['p95_us']:>10.1f} us  "
+                      f"p99 {metrics['p99_us']:>10.1f} us  ({metrics['ops_per_s']:,.0f} ops/s)", file=report)
+            elif "seconds" in metrics:
+                print(f"  {name:<22}{metrics['seconds']:>10.3f} s  "
+                      f"({metrics['items_per_s']:,.0f} cards/s)", file=report)
+            else:
+                print(f"  {'peak RSS':<22}{metrics['peak_rss_mb']:>10.1f} MB", file=report)
+    
+    @classmethod
+    def compare(cls, results: Dict, baseline: Dict, tolerance: float = 0.25) -> List[Tuple[str, float, float]]:
+        """Metrics more than `tolerance` (a fraction) worse than the baseline.
+        
+        Returns (metric path, baseline value, new value) for each regression.
+        Sizes and metrics missing from either side are skipped.
+        """
+        regressions = []
+        for size, benchmarks in results.get("sizes", {}).items():
+            base_benchmarks = baseline.get("sizes", {}).get(size, {})
+            for name, metrics in benchmarks.items():
+                for metric in cls.COMPARED:
+                    new = metrics.get(metric)
+                    old = base_benchmarks.get(name, {}).get(metric)
+                    if new is not None and old and new > old * (1 + tolerance):
+                        regressions.append((f"{size}/{name}/{metric}", old, new))
+        return regressions
+
+
+class RemoteError(PrototyperError):
+    """An error reported by a SessionServer in reply to a request."""
+    
+    def __init__(self, error_type: str, message: str):
+        super().__init__(message)
+        self.error_type = error_type
+
+
+class CommandError(PrototyperError):
+    """A REPL command sent to a SessionServer reported an error.
+    
+    The message is everything the command printed, error included.
+    """
+
+
+class _ThreadLocalStdout:
+    """Stand-in for sys.stdout that lets each thread capture its own prints.
+    
+    redirect_stdout swaps the process-wide sys.stdout, so commands printing
+    on the event loop and on worker threads at the same time would mix
+    their output. Threads not capturing write to the original stdout.
+    """
+    
+    _install_lock = threading.Lock()
+    
+    def __init__(self, default):
+        self._default = default
+        self._local = threading.local()
+    
+    def _target(self):
+        stream = getattr(self._local, "stream", None)
+        return self._default if stream is None else stream
+    
+    def write(self, text: str) -> int:
+        return self._target().write(text)
+    
+    def __getattr__(self, name: str):
+        return getattr(self._target(), name)
+    
+    @classmethod
+    @contextmanager
+    def capture(cls) -> Iterator[io.StringIO]:
+        """Collect what the current thread prints, installing the stand-in on first use."""
+        with cls._install_lock:
+            stdout = sys.stdout
+            if not isinstance(stdout, cls):
+                stdout = sys.stdout = cls(stdout)
+        previous = getattr(stdout._local, "stream", None)
+        stdout._local.stream = output = io.StringIO()
+        try:
+            yield output
+        finally:
+            stdout._local.stream = previous
+
+
+class _ReadWriteLock:
+    """asyncio lock admitting many readers or a single writer.
+    
+    Waiting writers block new readers, so a stream of reads cannot starve
+    mutations. The uncontended paths never suspend.
+    """
+    
+    def __init__(self):
+        self._readers = 0
+        self._writer = False
+        self._writers_waiting = 0
+        self._waiting = 0
+        self._cond = asyncio.Condition()
+    
+    def _can_read(self) -> bool:
+        return not self._writer and not self._writers_waiting
+    
+    def _can_write(self) -> bool:
+        return not self._writer and not self._readers
+    
+    async def _wait(self, predicate: Callable[[], bool]):
+        self._waiting += 1
+        try:
+            async with self._cond:
+                await self._cond.wait_for(predicate)
+        finally:
+            self._waiting -= 1
+    
+    async def _wake(self):
+        if self._waiting:
+            async with self._cond:
+                self._cond.notify_all()
+    
+    @asynccontextmanager
+    async def reading(self):
+        if not self._can_read():
+            await self._wait(self._can_read)
+        self._readers += 1
+        try:
+            yield
+        finally:
+            self._readers -= 1
+            if not self._readers:
+                await self._wake()
+    
+    @asynccontextmanager
+    async def writing(self):
+        if not self._can_write():
+            self._writers_waiting += 1
+            try:
+                await self._wait(self._can_write)
+            finally:
+                self._writers_waiting -= 1
+        self._writer = True
+        try:
+            yield
+        finally:
+            self._writer = False
+            await self._wake()
+
+
+class SessionServer:
+    """Asyncio server hosting Sessions behind a line-delimited JSON protocol.
+    
+    Each request is one JSON object per line:
+        {"id": 1, "session": "default", "op": "move",
+         "args": {"from": "deck", "to": "hand", "name": "Fireball"}}
+    and gets one response line:
+        {"id": 1, "ok": true, "result": {...}}
+        {"id": 1, "ok": false, "error": {"type": "PileNotFoundError", "message": "..."}}
+    
+    Clients may pipeline requests; each connection is answered in order,
+    with responses to a batch of input written out together. Sessions are
+    created on first use. Per session, mutations run one at a time while
+    reads may overlap; slow operations run on a worker thread so the event
+    loop keeps serving other clients.
+    """
+    
+    READ_SIZE = 1 << 16
+    MAX_LINE = 64 << 20
+    SOCKET_ENV = "PROTOTYPER_SOCKET"
+    
+    def __init__(self, backend: str = "list"):
+        self.backend = backend
+        self.sessions: Dict[str, Session] = {}
+        self._locks: Dict[str, _ReadWriteLock] = {}
+        # One REPL per hosted session (by id) so its perf stats accumulate
+        self._repls: Dict[int, Prototyper] = {}
+    
+    @classmethod
+    def default_socket(cls) -> str:
+        """The daemon's Unix socket path: $PROTOTYPER_SOCKET, else a per-user runtime path."""
+        path = os.environ.get(cls.SOCKET_ENV)
+        if path:
+            return path
+        directory = os.environ.get("XDG_RUNTIME_DIR") or tempfile.gettempdir()
+        user = os.getuid() if hasattr(os, "getuid") else os.environ.get("USERNAME", "user")
+        return os.path.join(directory, f"prototyper-{user}.sock")
+    
+    @staticmethod
+    def is_listening(path: str) -> bool:
+        """Whether a server accepts connections on a Unix socket path."""
+        if not os.path.exists(path):
+            return False
+        try:
+            with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as probe:
+                probe.connect(path)
+        except OSError:
+            return False
+        return True
+    
+    def session(self, name: str) -> Session:
+        """Return a hosted session, creating it if new."""
+        session = self.sessions.get(name)
+        if session is None:
+            session = self.sessions[name] = Session(self.backend)
+            self._locks[name] = _ReadWriteLock()
+        return session
+    
+    # Operation handlers: (session, args) -> JSON-serializable result
+    
+    def _op_create(self, session: Session, args: Dict):
+        return {"pile": session.create_pile(args["pile"]).name}
+    
+    def _op_load(self, session: Session, args: Dict):
+        return {"loaded": session.load_cards(args["pile"], args["filename"])}
+    
+    def _op_move(self, session: Session, args: Dict):
+        return session.move_card(args["from"], args["to"], args["name"]).to_dict()
+    
+    def _op_movetag(self, session: Session, args: Dict):
+        return {"moved": len(session.move_tag(args["from"], args["to"], args["tag"]))}
+    
+    def _op_movequery(self, session: Session, args: Dict):
+        return {"moved": len(session.move_query(args["from"], args["to"], args["query"]))}
+    
+    def _op_where(self, session: Session, args: Dict):
+        return {"piles": session.where(args["name"])}
+    
+    def _op_draw(self, session: Session, args: Dict):
+        cards = session.draw(args["from"], args["to"], int(args.get("count", 1)))
+        return {"cards": [card.to_dict() for card in cards]}
+    
+    def _op_shuffle(self, session: Session, args: Dict):
+        return {"seed": session.shuffle(args["pile"], args.get("seed"))}
+    
+    def _op_count(self, session: Session, args: Dict):
+        return {"count": session.count_cards(args["pile"], args.get("query"))}
+    
+    def _op_show(self, session: Session, args: Dict):
+        pile = session.pile(args["pile"])
+        start = int(args.get("start", 0))
+        limit = args.get("limit")
+        stop = len(pile) if limit is None else start + int(limit)
+        cards = pile.iter_range(start, stop)
+        return {"pile": pile.name, "size": len(pile), "cards": [card.to_dict() for card in cards]}
+    
+    def _op_piles(self, session: Session, args: Dict):
+        return {"piles": session.pile_sizes()}
+    
+    def _op_stats(self, session: Session, args: Dict):
+        return {"piles": session.pile_stats(args.get("pile"))}
+    
+    def _op_simulate(self, session: Session, args: Dict):
+        result = session.simulate(args["pile"], int(args["draws"]), int(args["trials"]),
+                                  args["conditions"], seed=args.get("seed"), workers=args.get("workers"))
+        return {"probability": result.probability, "margin": result.margin,
+                "trials": result.trials, "seed": result.seed}
+    
+    def _op_prob(self, session: Session, args: Dict):
+        result = session.probability(args["pile"], int(args["draws"]), args["conditions"],
+                                     workers=args.get("workers"))
+        if isinstance(result, SimulationResult):
+            return {"probability": result.probability, "exact": False, "margin": result.margin}
+        return {"probability": float(result), "exact": True,
+                "fraction": [result.numerator, result.denominator]}
+    
+    def _op_save(self, session: Session, args: Dict):
+        written = session.save_session(args.get("filename"))
+        return {"saved": session.saved_to, "written": written}
+    
+    def _op_loadsession(self, session: Session, args: Dict):
+        filename = args["filename"]
+        if filename.endswith(".journal"):
+            return {"replayed": session.restore_journal(filename), "piles": len(session.piles)}
+        return {"piles": session.load_session(filename)}
+    
+    def _op_command(self, session: Session, args: Dict):
+        """Run one REPL command line against the session, returning its output.
+        
+        Raises CommandError carrying the output if the command failed.
+        """
+        repl = self._repls.get(id(session))
+        if repl is None:
+            repl = self._repls[id(session)] = Prototyper(session=session)
+        with _ThreadLocalStdout.capture() as output:
+            ok = repl.parse_command(args["line"])
+        if not ok:
+            raise CommandError(output.getvalue())
+        return {"output": output.getvalue()}
+    
+    def _op_undo(self, session: Session, args: Dict):
+        entry = session.undo()
+        return {"undone": entry is not None and Prototyper._describe(entry)}
+    
+    def _op_redo(self, session: Session, args: Dict):
+        entry = session.redo()
+        return {"redone": entry is not None and Prototyper._describe(entry)}
+    
+    def _op_sessions(self, session: Session, args: Dict):
+        return {"sessions": sorted(self.sessions)}
+    
+    def _op_ping(self, session: Session, args: Dict):
+        return {"pong": True}
+    
+    # REPL commands that do file I/O or heavy computation, run on a worker thread
+    BLOCKING_COMMANDS = frozenset({"load", "loadsession", "save", "convert", "journal",
+                                   "simulate", "prob"})
+    
+    # op: (handler, mutates, runs on a worker thread; None: decided per command line)
+    OPS = {
+        "create": (_op_create, True, False),
+        "load": (_op_load, True, True),
+        "move": (_op_move, True, False),
+        "movetag": (_op_movetag, True, False),
+        "movequery": (_op_movequery, True, False),
+        "where": (_op_where, False, False),
+        "draw": (_op_draw, True, False),
+        "shuffle": (_op_shuffle, True, False),
+        "count": (_op_count, False, False),
+        "show": (_op_show, False, False),
+        "piles": (_op_piles, False, False),
+        "stats": (_op_stats, False, False),
+        "simulate": (_op_simulate, False, True),
+        "prob": (_op_prob, False, True),
+        # save records where and which pile versions it wrote, so it takes the write lock
+        "save": (_op_save, True, True),
+        "loadsession": (_op_loadsession, True, True),
+        "undo": (_op_undo, True, False),
+        "redo": (_op_redo, True, False),
+        "command": (_op_command, True, None),
+        "sessions": (_op_sessions, False, False),
+        "ping": (_op_ping, False, False),
+    }
+    
+    @staticmethod
+    def _error(request_id, error_type: str, message: str) -> Dict:
+        return {"id": request_id, "ok": False, "error": {"type": error_type, "message": message}}
+    
+    async def dispatch(self, request: Dict) -> Dict:
+        """Execute one request and build its response."""
+        request_id = request.get("id")
+        entry = self.OPS.get(request.get("op"))
+        if entry is None:
+            return self._error(request_id, "InvalidArgumentError", f"Unknown op '{request.get('op')}'.")
+        handler, mutates, blocking = entry
+        name = str(request.get("session", "default"))
+        session = self.session(name)
+        args = request.get("args") or {}
+        lock = self._locks[name]
+        if blocking is None:
+            command = str(args.get("line", "")).split(None, 1)
+            blocking = bool(command) and command[0].lower() in self.BLOCKING_COMMANDS
+        
+        try:
+            async with (lock.writing() if mutates else lock.reading()):
+                if blocking:
+                    loop = asyncio.get_running_loop()
+                    result = await loop.run_in_executor(None, handler, self, session, args)
+                else:
+                    result = handler(self, session, args)
+        except KeyError as e:
+            return self._error(request_id, "InvalidArgumentError", f"Missing argument {e}.")
+        except json.JSONDecodeError as e:
+            return self._error(request_id, "JSONDecodeError", str(e))
+        except (PrototyperError, OSError, ValueError) as e:
+            return self._error(request_id, type(e).__name__, str(e))
+        except Exception as e:
+            # Anything else is still answered, so the connection and the
+            # requests pipelined behind this one survive
+            return self._error(request_id, type(e).__name__, str(e) or repr(e))
+        return {"id": request_id, "ok": True, "result": result}
+    
+    async def _handle_line(self, line: bytes) -> Dict:
+        try:
+            request = json.loads(line)
+        except ValueError as e:
+            return self._error(None, "JSONDecodeError", str(e))
+        if not isinstance(request, dict):
+            return self._error(None, "InvalidArgumentError", "Requests must be JSON objects.")
+        return await self.dispatch(request)
+    
+    async def _handle_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        pending = b""
+        try:
+            while True:
+                chunk = await reader.read(self.READ_SIZE)
+                if not chunk:
+                    break
+                pending += chunk
+                if b"\n" not in chunk:
+                    if len(pending) > self.MAX_LINE:
+                        break
+                    continue
+                *lines, pending = pending.split(b"\n")
+                for line in lines:
+                    if line.strip():
+                        response = await self._handle_line(line)
+                        writer.write(json.dumps(response, separators=(",", ":")).encode() + b"\n")
+                await writer.drain()
+        except (ConnectionResetError, BrokenPipeError):
+            pass
+        finally:
+            writer.close()
+    
+    async def serve(self, host: str = "127.0.0.1", port: int = 0, unix: Optional[str] = None,
+                    ready: Optional[Callable[[str], None]] = None):
+        """Serve until cancelled, on a TCP port or a Unix socket path.
+        
+        A Unix socket is only accessible to the current user. A stale socket
+        file is replaced, but one another server still listens on is not.
+        """
+        if unix:
+            if self.is_listening(unix):
+                raise OSError(errno.EADDRINUSE, f"A server is already listening on '{unix}'.")
+            if os.path.exists(unix):
+                os.remove(unix)
+            umask = os.umask(0o077)
+            try:
+                server = await asyncio.start_unix_server(self._handle_client, path=unix)
+            finally:
+                os.umask(umask)
+            address = unix
+        else:
+            server = await asyncio.start_server(self._handle_client, host, port)
+            bound = server.sockets[0].getsockname()
+            address = f"{bound[0]}:{bound[1]}"
+        loop = asyncio.get_running_loop()
+        try:
+            loop.add_signal_handler(signal.SIGTERM, server.close)
+        except (NotImplementedError, AttributeError, RuntimeError, ValueError):
+            pass  # no SIGTERM handling on this platform or off the main thread
+        try:
+            async with server:
+                if ready is not None:
+                    ready(address)
+                await server.serve_forever()
+        except asyncio.CancelledError:
+            pass
+        finally:
+            if unix and os.path.exists(unix):
+                os.remove(unix)
+
+
+class ServerClient:
+    """Blocking client for SessionServer.
+    
+    `request` sends one request and waits for its answer; `pipeline` sends
+    a batch in one write and then reads all the responses.
+    """
+    
+    def __init__(self, host: str = "127.0.0.1", port: Optional[int] = None,
+                 unix: Optional[str] = None, session: str = "default", timeout: Optional[float] = None):
+        if unix:
+            self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self._sock.settimeout(timeout)
+            self._sock.connect(unix)
+        else:
+            self._sock = socket.create_connection((host, port), timeout=timeout)
+            self._sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._reader = self._sock.makefile('rb')
+        self.session = session
+        self._next_id = 0
+    
+    def _encode(self, op: str, args: Dict) -> bytes:
+        self._next_id += 1
+        request = {"id": self._next_id, "session": self.session, "op": op, "args": args}
+        return json.dumps(request, separators=(",", ":")).encode() + b"\n"
+    
+    def _read(self) -> Dict:
+        line = self._reader.readline()
+        if not line:
+            raise ConnectionError("Server closed the connection.")
+        return json.loads(line)
+    
+    def request(self, op: str, **args):
+        """Send one request and return its result, raising RemoteError on failure."""
+        self._sock.sendall(self._encode(op, args))
+        response = self._read()
+        if not response["ok"]:
+            raise RemoteError(response["error"]["type"], response["error"]["message"])
+        return response["result"]
+    
+    def pipeline(self, requests: Iterable[Tuple[str, Dict]]) -> List[Dict]:
+        """Send (op, args) requests in one batch and return the raw responses."""
+        payload = b"".join(self._encode(op, args) for op, args in requests)
+        count = payload.count(b"\n")
+        self._sock.sendall(payload)
+        return [self._read() for _ in range(count)]
+    
+    def close(self):
+        self._reader.close()
+        self._sock.close()
+    
+    def __enter__(self) -> 'ServerClient':
+        return self
+    
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def exec_commands(lines: Iterable[str], unix: Optional[str] = None, session: str = "default",
+                  out=None) -> int:
+    """Run REPL command lines in a daemon's session and write their output.
+    
+    The lines go out in one pipelined batch. Blank lines and lines starting
+    with '#' are skipped. Output of failed commands goes to stderr. Returns
+    an exit status: 0 on success, 1 if a command failed or the daemon
+    rejected a request, 2 if no daemon could be reached.
+    """
+    out = out or sys.stdout
+    unix = unix or SessionServer.default_socket()
+    requests = [("command", {"line": line.strip()}) for line in lines
+                if line.strip() and not line.strip().startswith("#")]
+    try:
+        with ServerClient(unix=unix, session=session) as client:
+            responses = client.pipeline(requests)
+    except OSError as e:
+        print(f"Error: no daemon reachable on '{unix}' ({e.strerror or e}). "
+              f"Start one with 'prototyper.py daemon'.", file=sys.stderr)
+        return 2
+    
+    status = 0
+    for response in responses:
+        if response["ok"]:
+            out.write(response["result"]["output"])
+        elif response["error"]["type"] == "CommandError":
+            out.flush()
+            sys.stderr.write(response["error"]["message"])
+            status = 1
+        else:
+            print(f"Error: {response['error']['message']}", file=sys.stderr)
+            status = 1
+    return status
+
+
+def run_daemon(server: SessionServer, unix: str, detach: bool = False) -> int:
+    """Serve sessions on a Unix socket until terminated.
+    
+    With `detach` the server moves to a background process and this
+    returns once it is listening (or has failed to start), so the calling
+    shell or editor can go on immediately. Returns an exit status.
+    """
+    def ready(address: str):
+        print(f"Daemon listening on {address} (pid {os.getpid()})", file=sys.stderr, flush=True)
+    
+    if detach:
+        if not hasattr(os, "fork"):
+            print("Error: --detach is not supported on this platform.", file=sys.stderr)
+            return 1
+        read_end, write_end = os.pipe()
+        if os.fork():
+            # Parent: relay the child's startup message, then exit
+            os.close(write_end)
+            with os.fdopen(read_end, 'r') as startup:
+                message = startup.read()
+            sys.stderr.write(message)
+            return 0 if message.startswith("Daemon listening") else 1
+        os.close(read_end)
+        os.setsid()
+        status = open(write_end, 'w')
+        devnull = os.open(os.devnull, os.O_RDWR)
+        for fd in (0, 1, 2):
+            os.dup2(devnull, fd)
+        
+        def ready(address: str):
+            status.write(f"Daemon listening on {address} (pid {os.getpid()})\n")
+            status.close()
+    else:
+        status = sys.stderr
+    
+    try:
+        asyncio.run(server.serve(unix=unix, ready=ready))
+    except KeyboardInterrupt:
+        pass
+    except OSError as e:
+        if not status.closed:
+            status.write(f"Error: {e}\n")
+        return 1
+    finally:
+        if detach and not status.closed:
+            status.close()
+    return 0
+
+
+def _positive_int(text: str) -> int:
+    """argparse type for counts that must be at least 1."""
+    try:
+        value = int(text)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid int value: '{text}'")
+    if value <= 0:
+        raise argparse.ArgumentTypeError(f"must be a positive number, not {value}")
+    return value
+
+
+def _positive_int_list(text: str) -> List[int]:
+    """argparse type for a comma-separated list of positive counts."""
+    return [_positive_int(part) for part in text.split(",")]
 
 
 def main():
     """Entry point for the prototyper."""
-    prototyper = Prototyper()
-    prototyper.run()
+    parser = argparse.ArgumentParser(description="Universal Prototyper")
+    parser.add_argument("--backend", choices=Prototyper.BACKENDS, default="list",
+                        help="pile storage backend (columnar requires NumPy)")
+    parser.add_argument("--script", metavar="FILE",
+                        help="run commands from FILE ('-' for stdin) without prompts")
+    parser.add_argument("--quiet", action="store_true",
+                        help="in script mode, suppress command output")
+    parser.add_argument("--no-timing", action="store_true",
+                        help="in script mode, skip the timing report")
+    parser.add_argument("--interactive", action="store_true",
+                        help="use the interactive prompt even if stdin is not a terminal")
+    parser.add_argument("--undo-limit", type=int, default=UndoHistory.LIMIT, metavar="N",
+                        help="card slots of undo history to keep (default %(default)s)")
+    parser.add_argument("--pager-threshold", type=int, default=Prototyper.PAGER_THRESHOLD, metavar="ROWS",
+                        help="page listings longer than ROWS on a terminal (0 never pages)")
+    parser.add_argument("--slow-ms", type=float, metavar="MS",
+                        help="log commands taking at least MS milliseconds")
+    parser.add_argument("--slow-log", default=Prototyper.SLOW_LOG, metavar="FILE",
+                        help="file for the slow-command log (default %(default)s)")
+    commands = parser.add_subparsers(dest="command", metavar="command")
+    serve = commands.add_parser("serve", help="host sessions over a line-delimited JSON socket protocol")
+    serve.add_argument("--host", default="127.0.0.1", help="TCP address to listen on")
+    serve.add_argument("--port", type=int, default=7878, help="TCP port to listen on")
+    serve.add_argument("--unix", metavar="PATH", help="listen on a Unix socket instead of TCP")
+    daemon = commands.add_parser("daemon", help="keep sessions in memory for 'exec' clients")
+    daemon.add_argument("--socket", metavar="PATH",
+                        help=f"Unix socket to listen on (default ${SessionServer.SOCKET_ENV} "
+                             f"or {SessionServer.default_socket()})")
+    daemon.add_argument("--load", metavar="FILE", help="load a saved session, session directory or journal before serving")
+    daemon.add_argument("--session", default="default", help="session that --load fills (default %(default)s)")
+    daemon.add_argument("--detach", action="store_true", help="run in the background once listening")
+    execute = commands.add_parser("exec", help="run commands in a running daemon's session")
+    execute.add_argument("lines", nargs="*", metavar="COMMAND",
+                         help="command lines, e.g. \"move deck hand Fireball\" (default: read stdin)")
+    execute.add_argument("--socket", metavar="PATH", help="daemon socket (default as for daemon)")
+    execute.add_argument("--session", default="default", help="session to run in (default %(default)s)")
+    bench = commands.add_parser("bench", help="time core operations on synthetic card catalogs")
+    bench.add_argument("--sizes", type=_positive_int_list, default="1000,10000,100000",
+                       help="comma-separated catalog sizes (default %(default)s)")
+    bench.add_argument("--seed", type=int, default=0, help="seed for the catalog generator")
+    bench.add_argument("--moves", type=_positive_int, default=1000, help="moves by name timed per size")
+    bench.add_argument("--tag-moves", type=_positive_int, default=8, help="moves by tag timed per size")
+    bench.add_argument("--tags", type=int, default=32, help="number of distinct tags")
+    bench.add_argument("--tags-per-card", type=int, default=3, help="tags drawn for each card")
+    bench.add_argument("--tag-skew", type=float, default=1.0,
+                       help="Zipf exponent of tag popularity (0 = uniform)")
+    bench.add_argument("--name-length", default="6:24", metavar="MIN:MAX", help="card name length range")
+    bench.add_argument("--effect-length", default="0:80", metavar="MIN:MAX", help="effect text length range")
+    bench.add_argument("--output", metavar="FILE", help="write results to FILE as JSON")
+    bench.add_argument("--baseline", metavar="FILE", help="compare against results saved earlier")
+    bench.add_argument("--tolerance", type=float, default=0.25,
+                       help="fraction a metric may exceed the baseline by (default %(default)s)")
+    args = parser.parse_args()
+    
+    if args.command == "bench":
+        def length_range(text: str) -> Tuple[int, int]:
+            low, _, high = text.partition(":")
+            return int(low), int(high or low)
+        suite = BenchmarkSuite(seed=args.seed, moves=args.moves, tag_moves=args.tag_moves,
+                               backend=args.backend, generator={
+                                   "tags": args.tags, "tags_per_card": args.tags_per_card,
+                                   "tag_skew": args.tag_skew, "name_length": length_range(args.name_length),
+                                   "effect_length": length_range(args.effect_length)})
+        results = suite.run(args.sizes, report=sys.stdout)
+        if args.output:
+            _write_json_atomic(args.output, results, indent=2)
+            print(f"Results written to '{args.output}'.")
+        if args.baseline:
+            with open(args.baseline, 'r') as f:
+                baseline = json.load(f)
+            regressions = BenchmarkSuite.compare(results, baseline, args.tolerance)
+            for metric, old, new in regressions:
+                print(f"REGRESSION {metric}: {old:.4g} -> {new:.4g} ({(new / old - 1) * 100:+.0f}%)")
+            if regressions:
+                sys.exit(1)
+            print(f"No regressions against '{args.baseline}' (tolerance {args.tolerance:.0%}).")
+        return
+    
+    if args.command == "exec":
+        sys.exit(exec_commands(args.lines or sys.stdin, args.socket, args.session))
+    
+    if args.command == "daemon":
+        server = SessionServer(backend=args.backend)
+        if args.load:
+            session = server.session(args.session)
+            try:
+                if args.load.endswith(".journal"):
+                    session.restore_journal(args.load)
+                else:
+                    session.load_session(args.load)
+            except (PrototyperError, OSError, ValueError) as e:
+                print(f"Error: cannot load '{args.load}': {e}", file=sys.stderr)
+                sys.exit(1)
+        sys.exit(run_daemon(server, args.socket or SessionServer.default_socket(), detach=args.detach))
+    
+    if args.command == "serve":
+        server = SessionServer(backend=args.backend)
+        ready = lambda address: print(f"Serving sessions on {address}", file=sys.stderr, flush=True)
+        try:
+            asyncio.run(server.serve(args.host, args.port, unix=args.unix, ready=ready))
+        except KeyboardInterrupt:
+            pass
+        return
+    
+    prototyper = Prototyper(backend=args.backend)
+    prototyper.session.history.limit = args.undo_limit
+    prototyper.pager_threshold = args.pager_threshold
+    if args.slow_ms is not None:
+        prototyper.perf.slow_threshold = args.slow_ms / 1e3
+        prototyper.perf.slow_log = args.slow_log
+    report = None if args.no_timing else sys.stderr
+    if args.script and args.script != "-":
+        with open(args.script, 'r') as f:
+            prototyper.run_script(f, quiet=args.quiet, report=report)
+    elif args.script == "-" or (not args.interactive and not sys.stdin.isatty()):
+        prototyper.run_script(sys.stdin, quiet=args.quiet, report=report)
+    else:
+        prototyper.run()
 
 
 if __name__ == '__main__':
@@ -0,0 +1,59 @@
+"""Tests for incremental card file parsing."""
+
+import io
+import json
+import os
+import sys
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import prototyper  # noqa: E402
+
+CARDS = [
+    {"name": "Fireball", "effect": "Deal 3 damage, \"burn\" [all]", "tags": ["spell", "fire"]},
+    {"name": "Ice {Wall}", "effect": "Block: 4", "tags": []},
+    {"name": "Snowy Owl ❄", "effect": "Draw 1 \\ card", "tags": ["unit", "ice"]},
+    {"name": "x" * 300, "effect": "", "tags": ["long"]},
+]
+
+
+def stream(text, chunk_size, json_lines=False):
+    return list(prototyper.CardStream(io.StringIO(text), json_lines=json_lines, chunk_size=chunk_size))
+
+
+class CardStreamTest(unittest.TestCase):
+    def test_array_split_at_every_chunk_size(self):
+        text = json.dumps(CARDS, indent=2)
+        for chunk_size in range(1, 64):
+            with self.subTest(chunk_size=chunk_size):
+                self.assertEqual(stream(text, chunk_size), CARDS)
+
+    def test_cards_object_split_at_every_chunk_size(self):
+        text = json.dumps({"version": 1, "cards": CARDS})
+        for chunk_size in range(1, 64):
+            with self.subTest(chunk_size=chunk_size):
+                self.assertEqual(stream(text, chunk_size), CARDS)
+
+    def test_json_lines(self):
+        text = "".join(json.dumps(card) + "\n" for card in CARDS) + "\n"
+        self.assertEqual(stream(text, 7, json_lines=True), CARDS)
+
+    def test_empty_array(self):
+        self.assertEqual(stream(" [ ] ", 1), [])
+
+    def test_progress_reaches_end(self):
+        text = json.dumps(CARDS)
+        reader = prototyper.CardStream(io.StringIO(text), chunk_size=5)
+        list(reader)
+        self.assertEqual(reader.chars_read, len(text))
+
+    def test_truncated_array_raises(self):
+        text = json.dumps(CARDS)[:-40]
+        with self.assertRaises(ValueError):
+            stream(text, 16)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,78 @@
+"""Tests for command tokenizing and dispatch."""
+
+import contextlib
+import io
+import os
+import sys
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import prototyper  # noqa: E402
+
+
+class TokenizeTest(unittest.TestCase):
+    def test_quoting(self):
+        cases = {
+            'create deck': ["create", "deck"],
+            'move "draw pile" hand Ice Wall': ["move", "draw pile", "hand", "Ice", "Wall"],
+            "move 'draw pile' hand x": ["move", "draw pile", "hand", "x"],
+            r'create "say \"hi\" \\ bye"': ["create", 'say "hi" \\ bye'],
+            "move deck hand Dragon's Breath": ["move", "deck", "hand", "Dragon's", "Breath"],
+            'where a"b': ["where", 'a"b'],
+            '   ': [],
+        }
+        for line, tokens in cases.items():
+            with self.subTest(line=line):
+                self.assertEqual(prototyper.tokenize_command(line), tokens)
+
+
+class CompileTest(unittest.TestCase):
+    def test_binds_arguments(self):
+        invocation = prototyper.Prototyper.compile('DRAW "draw pile" hand 3')
+        self.assertEqual((invocation.command, invocation.method, invocation.args),
+                         ("draw", "draw", ("draw pile", "hand", 3)))
+        invocation = prototyper.Prototyper.compile("move deck hand Dragon's Breath")
+        self.assertEqual(invocation.args, ("deck", "hand", "Dragon's Breath"))
+        self.assertEqual(prototyper.Prototyper.compile("draw deck hand").args, ("deck", "hand"))
+        self.assertEqual(prototyper.Prototyper.compile("perf slow 5").args, (["slow", "5"],))
+        self.assertIsNone(prototyper.Prototyper.compile("  "))
+
+    def test_usage_errors(self):
+        invocation = prototyper.Prototyper.compile("move deck")
+        self.assertIsNone(invocation.method)
+        self.assertEqual(invocation.usage, "Usage: move <from_pile> <to_pile> <card_name>")
+        with self.assertRaises(ValueError):
+            prototyper.Prototyper.compile("draw deck hand three")
+
+    def test_every_command_has_a_handler(self):
+        for command, (method, _) in prototyper.Prototyper.COMMANDS.items():
+            with self.subTest(command=command):
+                self.assertTrue(callable(getattr(prototyper.Prototyper, method, None)))
+
+
+class ParseCommandTest(unittest.TestCase):
+    def setUp(self):
+        self.repl = prototyper.Prototyper()
+        self.output = io.StringIO()
+
+    def run_line(self, line):
+        with contextlib.redirect_stdout(self.output):
+            return self.repl.parse_command(line)
+
+    def test_success_and_failure(self):
+        self.assertTrue(self.run_line('create "draw pile"'))
+        self.assertIn("draw pile", self.repl.piles)
+        self.assertFalse(self.run_line("frobnicate"))
+        self.assertIn("Unknown command: frobnicate", self.repl.failed)
+        self.assertFalse(self.run_line("create"))
+        self.assertEqual(self.repl.failed, "Usage: create <pile_name>")
+        self.assertFalse(self.run_line("draw nowhere hand"))
+        self.assertFalse(self.run_line("draw deck hand x"))
+        self.assertTrue(self.run_line(""))
+        self.assertIsNone(self.repl.failed)
+
+
+if __name__ == "__main__":
+    unittest.main()
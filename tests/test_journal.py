@@ -0,0 +1,98 @@
+"""Tests for journal replay after a crash."""
+
+import json
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import prototyper  # noqa: E402
+
+
+def snapshot(session):
+    return {name: [card.name for card in session.piles[name]] for name in session.piles}
+
+
+class JournalTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.base = os.path.join(self.tmp, "game")
+        self.cards_file = os.path.join(self.tmp, "cards.json")
+        with open(self.cards_file, "w") as f:
+            json.dump([{"name": f"C{i % 30}", "tags": [f"t{i % 4}"]} for i in range(90)], f)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def _play(self, snapshot_every=prototyper.SessionJournal.SNAPSHOT_EVERY):
+        """Journal a game and return its state, leaving the files as a crash would."""
+        session = prototyper.Session(seed=5)
+        session.start_journal(self.base, snapshot_every)
+        session.create_pile("deck")
+        session.create_pile("hand")
+        session.load_cards("deck", self.cards_file)
+        session.shuffle("deck")
+        session.draw("deck", "hand", 7)
+        session.move_tag("deck", "hand", "t1")
+        session.undo()
+        session.move_card("deck", "hand", "C3")
+        session.cut("deck")
+        session.undo()
+        session.redo()
+        # Every event is flushed as it is recorded, so closing the file
+        # leaves exactly what a crash at this point would
+        session.journal.close()
+        return snapshot(session)
+
+    def _restore(self):
+        session = prototyper.Session()
+        try:
+            session.restore_journal(self.base)
+        finally:
+            session.stop_journal()
+        return session
+
+    def test_replay_after_crash(self):
+        state = self._play()
+        self.assertEqual(snapshot(self._restore()), state)
+
+    def test_torn_final_line_is_ignored(self):
+        state = self._play()
+        with open(self.base + ".journal", "a") as f:
+            f.write('{"op":"draw","from":"deck","to":"ha')
+        self.assertEqual(snapshot(self._restore()), state)
+
+    def test_crash_between_snapshot_and_truncation(self):
+        state = self._play(snapshot_every=3)
+        with open(self.base + ".journal") as f:
+            events = f.read()
+        # Stale events already covered by the snapshot precede the live ones
+        stale = "".join(json.dumps({"op": "drop", "pile": "deck", "seq": seq}) + "\n" for seq in (1, 2))
+        with open(self.base + ".journal", "w") as f:
+            f.write(stale + events)
+        self.assertEqual(snapshot(self._restore()), state)
+
+    def test_event_without_seq_is_malformed(self):
+        self._play()
+        with open(self.base + ".journal", "a") as f:
+            f.write('{"op":"create","pile":"x"}\n')
+        with self.assertRaisesRegex(prototyper.SessionFormatError, "line"):
+            self._restore()
+
+    def test_damage_before_the_last_line_is_malformed(self):
+        self._play()
+        with open(self.base + ".journal") as f:
+            lines = f.readlines()
+        lines[1] = lines[1][:5] + "\n"
+        with open(self.base + ".journal", "w") as f:
+            f.writelines(lines)
+        with self.assertRaisesRegex(prototyper.SessionFormatError, "line 2"):
+            self._restore()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,46 @@
+"""Tests for slot-ordered piles."""
+
+import os
+import random
+import sys
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import prototyper  # noqa: E402
+
+
+class SlotOrderTest(unittest.TestCase):
+    def test_islice_from_either_end(self):
+        rng = random.Random(4)
+        slots = sorted(rng.sample(range(20_000), 5_000))
+        order = prototyper._SlotOrder(slots)
+        # Uneven blocks, as left behind by single inserts and removals
+        for slot in slots[100:900:3]:
+            order.remove(slot)
+        order.add(-1)
+        expected = list(order)
+        size = len(expected)
+        for start, stop in [(0, 0), (0, 5), (3, 70), (size - 5, size), (size - 200, size - 3), (size - 2500, size - 2),
+                            (size // 2 - 10, size // 2 + 10), (0, size), (size, size), (size - 1, size + 5)]:
+            with self.subTest(start=start, stop=stop):
+                self.assertEqual(list(order.islice(start, stop)), expected[start:stop])
+
+
+class PileRangeTest(unittest.TestCase):
+    def test_iter_range(self):
+        pile = prototyper.Pile("deck")
+        for i in range(3000):
+            pile.add_card(prototyper.Card(f"C{i}"))
+        pile.take_slots(range(500, 1500, 7))
+        names = [card.name for card in pile]
+        size = len(names)
+        for start, stop in [(0, 10), (size - 5, size), (size - 10, size + 10), (-3, 4), (1200, 1300), (5, 2)]:
+            with self.subTest(start=start, stop=stop):
+                self.assertEqual([card.name for card in pile.iter_range(start, stop)],
+                                 names[max(start, 0):max(stop, 0)])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,71 @@
+"""Tests for exact draw probabilities."""
+
+import itertools
+import os
+import sys
+import unittest
+from fractions import Fraction
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import prototyper  # noqa: E402
+
+
+def deck():
+    cards = []
+    for i in range(14):
+        tags = ["spell"] if i % 3 == 0 else ["unit"]
+        if i % 4 == 0:
+            tags.append("fire")
+        if i % 5 == 1:
+            tags.append("ice")
+        cards.append(prototyper.Card(f"C{i % 6}", "", tags))
+    return cards
+
+
+def brute_force(cards, conditions, draws):
+    hands = list(itertools.combinations(cards, draws))
+    favorable = sum(
+        all(condition.holds(sum(condition.selects(card) for card in hand)) for condition in conditions)
+        for hand in hands
+    )
+    return Fraction(favorable, len(hands))
+
+
+class DrawProbabilityTest(unittest.TestCase):
+    CONDITIONS = [
+        "spell >= 2",
+        "fire",
+        "spell & fire >= 1, unit >= 2",
+        "spell | ice == 2",
+        "unit & ~ice < 3, fire != 1",
+        "name:C2 >= 1",
+        "name:C0 == 1, spell > 1",
+        "fire <= 0",
+    ]
+
+    def test_matches_brute_force(self):
+        cards = deck()
+        for text in self.CONDITIONS:
+            conditions = prototyper.DrawCondition.parse_all(text)
+            engine = prototyper.DrawProbability(cards, conditions)
+            for draws in range(6):
+                with self.subTest(conditions=text, draws=draws):
+                    self.assertEqual(engine.exact(draws), brute_force(cards, conditions, draws))
+
+    def test_run_is_exact_when_cheap(self):
+        cards = deck()
+        conditions = prototyper.DrawCondition.parse_all("spell >= 2")
+        self.assertEqual(prototyper.DrawProbability(cards, conditions).run(5),
+                         brute_force(cards, conditions, 5))
+
+    def test_draws_out_of_range(self):
+        engine = prototyper.DrawProbability(deck(), prototyper.DrawCondition.parse_all("spell"))
+        for draws in (-1, 15):
+            with self.assertRaises(prototyper.InvalidArgumentError):
+                engine.exact(draws)
+
+
+if __name__ == "__main__":
+    unittest.main()
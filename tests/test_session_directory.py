@@ -0,0 +1,94 @@
+"""Tests for sharded session directories."""
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import prototyper  # noqa: E402
+
+
+def make_session():
+    session = prototyper.Session()
+    for name in ("deck", "hand", "grave"):
+        session.create_pile(name)
+    for i in range(40):
+        session.piles["deck"].add_card(prototyper.Card(f"C{i}", "", [f"t{i % 3}"]))
+    session.draw("deck", "hand", 5)
+    return session
+
+
+def pile_files(path):
+    return sorted(os.listdir(os.path.join(path, "piles")))
+
+
+class SessionDirectoryTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp, "game.session")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_incremental_saves(self):
+        session = make_session()
+        self.assertEqual(session.save_session(self.path), 3)
+        self.assertEqual(session.save_session(), 0)
+        session.draw("deck", "grave", 2)
+        self.assertEqual(session.save_session(), 2)
+        # Old contents of the changed piles are cleaned up
+        self.assertEqual(len(pile_files(self.path)), 6)
+
+        reopened = prototyper.Session()
+        reopened.load_session(self.path)
+        self.assertEqual(reopened.save_session(), 0)
+        reopened.draw("hand", "grave", 1)
+        self.assertEqual(reopened.save_session(), 2)
+        self.assertFalse(reopened.piles.is_loaded("deck"))
+        self.assertEqual(reopened.pile_sizes(), {"deck": 33, "hand": 4, "grave": 3})
+
+    def test_lazy_open_reads_nothing_for_where(self):
+        make_session().save_session(self.path)
+        session = prototyper.Session()
+        session.load_session(self.path)
+        self.assertEqual(session.where("C2"), {"hand": 1})
+        self.assertEqual([session.piles.is_loaded(name) for name in session.piles], [False] * 3)
+
+    def test_checksum_mismatch(self):
+        make_session().save_session(self.path)
+        directory = prototyper.SessionDirectory(self.path)
+        with open(os.path.join(self.path, directory.piles["hand"]["file"]), "a") as f:
+            f.write('{"name": "Intruder"}\n')
+        session = prototyper.Session()
+        session.load_session(self.path)
+        self.assertEqual(len(session.piles["deck"]), 35)
+        with self.assertRaisesRegex(prototyper.SessionFormatError, "checksum"):
+            session.piles["hand"]
+
+    def test_plain_directory_is_left_alone(self):
+        plain = os.path.join(self.tmp, "plain")
+        os.makedirs(os.path.join(plain, "piles"))
+        with open(os.path.join(plain, "piles", "notes.jsonl"), "w") as f:
+            f.write("{}\n")
+        with self.assertRaises(prototyper.InvalidArgumentError):
+            make_session().save_session(plain)
+        self.assertEqual(os.listdir(plain), ["piles"])
+        self.assertEqual(pile_files(plain), ["notes.jsonl"])
+
+    def test_foreign_files_survive_cleanup(self):
+        os.makedirs(os.path.join(self.path, "piles"))
+        with open(os.path.join(self.path, "piles", "notes.jsonl"), "w") as f:
+            f.write("{}\n")
+        session = make_session()
+        session.save_session(self.path)
+        session.draw("deck", "grave", 1)
+        session.save_session()
+        self.assertIn("notes.jsonl", pile_files(self.path))
+
+
+if __name__ == "__main__":
+    unittest.main()
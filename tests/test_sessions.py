@@ -0,0 +1,98 @@
+"""Tests for saving and loading sessions in every format."""
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import prototyper  # noqa: E402
+
+
+def contents(session):
+    return {name: [card.to_dict() for card in session.piles[name]] for name in session.piles}
+
+
+def make_session():
+    session = prototyper.Session()
+    session.create_pile("deck")
+    session.create_pile("hand")
+    session.create_pile("empty")
+    for i in range(50):
+        session.piles["deck"].add_card(prototyper.Card(f"Card {i % 17} ✦", f"Attack: {i}", [f"t{i % 5}", "any"]))
+    session.draw("deck", "hand", 6)
+    return session
+
+
+class FailingCards:
+    """Cards that raise part-way through being written."""
+
+    def __iter__(self):
+        yield prototyper.Card("first", "", [])
+        raise RuntimeError("disk on fire")
+
+
+class SessionRoundTripTest(unittest.TestCase):
+    FORMATS = ("game.json", "game.ups", "game.session")
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def _load(self, filename):
+        session = prototyper.Session()
+        session.load_session(filename)
+        return session
+
+    def test_round_trip(self):
+        session = make_session()
+        for name in self.FORMATS:
+            with self.subTest(format=name):
+                path = os.path.join(self.tmp, name)
+                session.save_session(path)
+                loaded = self._load(path)
+                self.assertEqual(list(loaded.piles), ["deck", "hand", "empty"])
+                self.assertEqual(contents(loaded), contents(session))
+                self.assertEqual(loaded.where("Card 3 ✦"), session.where("Card 3 ✦"))
+
+    def test_failed_save_keeps_previous_file(self):
+        session = make_session()
+        writers = {
+            "game.json": lambda path: prototyper._write_json_atomic(path, {"piles": object()}),
+            "game.ups": lambda path: prototyper.BinarySession.write(path, {"deck": FailingCards()}),
+        }
+        for name, write in writers.items():
+            with self.subTest(format=name):
+                path = os.path.join(self.tmp, name)
+                session.save_session(path)
+                with open(path, "rb") as f:
+                    before = f.read()
+                with self.assertRaises((RuntimeError, TypeError)):
+                    write(path)
+                with open(path, "rb") as f:
+                    self.assertEqual(f.read(), before)
+                self.assertEqual([f for f in os.listdir(self.tmp) if f.startswith(".tmp-")], [])
+                self.assertEqual(contents(self._load(path)), contents(session))
+
+    def test_truncated_binary_session(self):
+        path = os.path.join(self.tmp, "game.ups")
+        make_session().save_session(path)
+        with open(path, "rb") as f:
+            data = f.read()
+        for size in (10, len(data) // 2, len(data) - 3):
+            with self.subTest(size=size):
+                with open(path, "wb") as f:
+                    f.write(data[:size])
+                with self.assertRaises(prototyper.SessionFormatError):
+                    loaded = self._load(path)
+                    for pile_name in loaded.piles:
+                        loaded.piles[pile_name]
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,46 @@
+"""Tests that seeded shuffles agree across pile backends."""
+
+import json
+import os
+import sys
+import tempfile
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import prototyper  # noqa: E402
+
+
+@unittest.skipIf(prototyper.np is None, "the columnar backend needs NumPy")
+class ShuffleTest(unittest.TestCase):
+    def setUp(self):
+        handle, self.cards_file = tempfile.mkstemp(suffix=".json")
+        with os.fdopen(handle, "w") as f:
+            json.dump([{"name": f"C{i}", "tags": [f"t{i % 3}"]} for i in range(200)], f)
+
+    def tearDown(self):
+        os.remove(self.cards_file)
+
+    def _session(self, backend):
+        session = prototyper.Session(backend)
+        session.create_pile("deck")
+        session.load_cards("deck", self.cards_file)
+        return session
+
+    def test_same_seed_same_order(self):
+        orders = []
+        for backend in ("list", "columnar"):
+            session = self._session(backend)
+            for seed in (1, 2, 3):
+                session.shuffle("deck", seed)
+            orders.append([card.name for card in session.piles["deck"]])
+            session.undo()
+            session.undo()
+            session.undo()
+            self.assertEqual([card.name for card in session.piles["deck"]], [f"C{i}" for i in range(200)])
+        self.assertEqual(orders[0], orders[1])
+
+
+if __name__ == "__main__":
+    unittest.main()
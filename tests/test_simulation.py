@@ -0,0 +1,53 @@
+"""Tests for the Monte Carlo draw simulator."""
+
+import multiprocessing
+import os
+import sys
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import prototyper  # noqa: E402
+
+
+def deck():
+    cards = []
+    for i in range(40):
+        tags = ["spell"] if i % 3 == 0 else ["unit"]
+        if i % 5 == 0:
+            tags.append("fire")
+        cards.append(prototyper.Card(f"C{i}", "", tags))
+    return cards
+
+
+class DrawSimulatorTest(unittest.TestCase):
+    def test_spawned_workers(self):
+        conditions = prototyper.DrawCondition.parse_all("spell & fire >= 1, unit >= 2")
+        simulator = prototyper.DrawSimulator(deck(), conditions)
+        spawned = simulator.run(7, 30_000, seed=7, workers=2,
+                                mp_context=multiprocessing.get_context("spawn"))
+        self.assertEqual(spawned.workers, 2)
+        self.assertEqual(spawned.successes, simulator.run(7, 30_000, seed=7, workers=1).successes)
+
+    def test_seed_reproduces_across_worker_counts(self):
+        conditions = prototyper.DrawCondition.parse_all("spell >= 2")
+        simulator = prototyper.DrawSimulator(deck(), conditions)
+        results = [simulator.run(6, 45_000, seed=1234, workers=workers) for workers in (1, 2, 4)]
+        self.assertEqual(len({result.successes for result in results}), 1)
+        self.assertEqual([result.workers for result in results], [1, 2, 4])
+        self.assertNotEqual(simulator.run(6, 45_000, seed=1235, workers=1).successes, results[0].successes)
+
+    def test_probability_fallback_uses_one_worker(self):
+        conditions = prototyper.DrawCondition.parse_all("spell >= 2")
+        engine = prototyper.DrawProbability(deck(), conditions)
+        engine.MAX_COST = 0
+        engine.FALLBACK_TRIALS = 20_000
+        result = engine.run(6, seed=3)
+        self.assertIsInstance(result, prototyper.SimulationResult)
+        self.assertEqual(result.workers, 1)
+        self.assertEqual(engine.run(6, seed=3, workers=2).successes, result.successes)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,114 @@
+"""Regression tests for multi-step undo and redo."""
+
+import json
+import os
+import random
+import sys
+import tempfile
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import prototyper  # noqa: E402
+
+BACKENDS = ["list"] + (["columnar"] if prototyper.np is not None else [])
+
+
+def snapshot(session):
+    return {name: [card.name for card in session.piles[name]] for name in session.piles}
+
+
+class UndoRedoTest(unittest.TestCase):
+    def setUp(self):
+        handle, self.cards_file = tempfile.mkstemp(suffix=".json")
+        with os.fdopen(handle, "w") as f:
+            json.dump([{"name": f"C{i % 40}", "effect": f"Attack: {i % 5}",
+                        "tags": [f"t{i % 4}", f"u{i % 3}"]} for i in range(120)], f)
+
+    def tearDown(self):
+        os.remove(self.cards_file)
+
+    def test_redo_chain_of_moves(self):
+        for backend in BACKENDS:
+            with self.subTest(backend=backend):
+                session = prototyper.Session(backend)
+                for name in ("x", "y", "z"):
+                    session.create_pile(name)
+                session.load_cards("x", os.path.join(ROOT, "example_cards.json"))
+                session.move_card("x", "y", "Fireball")
+                session.move_card("y", "z", "Fireball")
+                after = snapshot(session)
+                session.undo()
+                session.undo()
+                session.redo()
+                session.redo()
+                self.assertEqual(snapshot(session), after)
+                for _ in range(3):
+                    session.undo()
+                self.assertEqual(snapshot(session), {"x": [], "y": [], "z": []})
+
+    def test_random_undo_redo(self):
+        for backend in BACKENDS:
+            for trial in range(20):
+                with self.subTest(backend=backend, trial=trial):
+                    self._run_random(backend, trial)
+
+    def _run_random(self, backend, trial):
+        rng = random.Random(trial)
+        session = prototyper.Session(backend, seed=trial)
+        piles = ["deck", "hand", "grave"]
+        for name in piles:
+            session.create_pile(name)
+        session.load_cards("deck", self.cards_file)
+        session.history.clear()
+        # states[:done] have been applied; states[done:] can be redone
+        states = [snapshot(session)]
+        done = 1
+        for _ in range(80):
+            roll = rng.random()
+            a, b = rng.choice(piles), rng.choice(piles)
+            if roll < 0.25:
+                before = len(session.history.undo_stack)
+                if roll < 0.1:
+                    session.draw(a, b, rng.randint(1, 8))
+                elif roll < 0.15:
+                    session.shuffle(a)
+                elif roll < 0.2:
+                    session.move_tag(a, b, rng.choice(["t0", "u1"]))
+                else:
+                    session.cut(a)
+                if len(session.history.undo_stack) > before:
+                    del states[done:]
+                    states.append(snapshot(session))
+                    done += 1
+            elif roll < 0.65:
+                for _ in range(rng.randint(1, 4)):
+                    if session.undo() is None:
+                        break
+                    done -= 1
+                    self.assertEqual(snapshot(session), states[done - 1])
+            else:
+                for _ in range(rng.randint(1, 4)):
+                    if session.redo() is None:
+                        break
+                    done += 1
+                    self.assertEqual(snapshot(session), states[done - 1])
+
+    def test_failed_redo_stays_on_redo_stack(self):
+        session = prototyper.Session()
+        session.create_pile("x")
+        session.create_pile("y")
+        session.load_cards("x", os.path.join(ROOT, "example_cards.json"))
+        session.move_card("x", "y", "Fireball")
+        session.undo()
+        entry = session.history.next_redo()
+        entry["slots"] = [10 ** 6]
+        with self.assertRaises(KeyError):
+            session.redo()
+        self.assertIs(session.history.next_redo(), entry)
+        self.assertEqual(len(session.history.undo_stack), 3)
+
+
+if __name__ == "__main__":
+    unittest.main()